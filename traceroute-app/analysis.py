@@ -4,82 +4,278 @@ Script to analyze results.json and report statistics:
 - Number of unique IP addresses
 - Total number of hops
 - Top 10 IPs by connection count (appearances as origin or destination)
+- Degree distribution, connected components and approximate betweenness centrality
+
+results.json (flat or normalized, see results_io.py) is parsed a batch of entries at a time,
+decoding only origin and destination, and IPs are interned to integer IDs, so memory grows
+with the number of unique IPs and hops (kept in flat arrays), not with the file size.
+The graph metrics run over a CSR (compressed sparse row) adjacency of those IDs.
 """
 
 import json
+import random
 import sys
+from array import array
+from collections import Counter
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import instrumentation
+from cli_args import get_flag, positional
+from results_io import iter_endpoints
 
 RESULTS_FILE = 'results.json'
 TARGETS_FILE = 'targets.json'
+BETWEENNESS_SAMPLES = 32
+TOP_COUNT = 10
+
+
+class HopGraph:
+    """Undirected hop graph with IPs interned to integer IDs"""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.ips: List[str] = []
+        self.sources = array('I')
+        self.targets = array('I')
+        self.connections = array('I')
+        self.offsets: Optional[array] = None
+        self.neighbors: Optional[array] = None
+
+    def intern(self, ip: str) -> int:
+        node = self.ids.get(ip)
+        if node is None:
+            node = self.ids[ip] = len(self.ips)
+            self.ips.append(ip)
+            self.connections.append(0)
+        self.connections[node] += 1
+        return node
+
+    def add(self, origin: str, destination: str):
+        """Count an entry's IPs and record the edge when both ends are known"""
+        origin_id = self.intern(origin) if origin and origin != 'unknown' else None
+        destination_id = self.intern(destination) if destination else None
+        if origin_id is not None and destination_id is not None and origin_id != destination_id:
+            self.sources.append(origin_id)
+            self.targets.append(destination_id)
+
+    def __len__(self) -> int:
+        return len(self.ips)
+
+    def build_csr(self):
+        """Build the CSR adjacency: neighbors[offsets[v]:offsets[v + 1]] are v's distinct neighbors"""
+        node_count = len(self.ips)
+        counts = array('I', bytes(4 * (node_count + 1)))
+        for source, target in zip(self.sources, self.targets):
+            counts[source + 1] += 1
+            counts[target + 1] += 1
+        offsets = array('Q', bytes(8 * (node_count + 1)))
+        for node in range(node_count):
+            offsets[node + 1] = offsets[node] + counts[node + 1]
+        del counts
+
+        cursor = array('Q', offsets[:-1])
+        neighbors = array('I', bytes(4 * offsets[-1]))
+        for source, target in zip(self.sources, self.targets):
+            neighbors[cursor[source]] = target
+            cursor[source] += 1
+            neighbors[cursor[target]] = source
+            cursor[target] += 1
+        del cursor
+        # The edge list isn't needed once the adjacency exists
+        self.sources = array('I')
+        self.targets = array('I')
+
+        # Drop duplicates (A -> B and B -> A are the same undirected edge), compacting in place
+        write = 0
+        start = 0
+        for node in range(node_count):
+            end = offsets[node + 1]
+            row = sorted(set(neighbors[start:end]))
+            offsets[node] = write
+            neighbors[write:write + len(row)] = array('I', row)
+            write += len(row)
+            start = end
+        offsets[node_count] = write
+        del neighbors[write:]
+        self.offsets = offsets
+        self.neighbors = neighbors
+
+    def degree(self, node: int) -> int:
+        return self.offsets[node + 1] - self.offsets[node]
+
+    def neighbors_of(self, node: int) -> array:
+        return self.neighbors[self.offsets[node]:self.offsets[node + 1]]
+
+    def degree_distribution(self) -> Dict[int, int]:
+        """Number of nodes with each degree (distinct neighbors)"""
+        distribution = Counter(self.degree(node) for node in range(len(self.ips)))
+        return dict(sorted(distribution.items()))
+
+    def components(self) -> List[int]:
+        """Sizes of the connected components, largest first"""
+        seen = bytearray(len(self.ips))
+        sizes = []
+        for root in range(len(self.ips)):
+            if seen[root]:
+                continue
+            seen[root] = 1
+            stack = [root]
+            size = 0
+            while stack:
+                node = stack.pop()
+                size += 1
+                for neighbor in self.neighbors_of(node):
+                    if not seen[neighbor]:
+                        seen[neighbor] = 1
+                        stack.append(neighbor)
+            sizes.append(size)
+        sizes.sort(reverse=True)
+        return sizes
+
+    def betweenness(self, samples: int = BETWEENNESS_SAMPLES, seed: Optional[int] = None) -> array:
+        """Approximate betweenness centrality: Brandes' algorithm from a random sample of
+        source nodes, scaled up to the whole graph"""
+        node_count = len(self.ips)
+        scores = array('d', bytes(8 * node_count))
+        if node_count == 0:
+            return scores
+        sources = random.Random(seed).sample(range(node_count), min(samples, node_count))
+        distance = array('i', [-1]) * node_count
+        paths = array('d', bytes(8 * node_count))
+        dependency = array('d', bytes(8 * node_count))
+        offsets, neighbors = self.offsets, self.neighbors
+        for source in sources:
+            order = [source]
+            distance[source] = 0
+            paths[source] = 1.0
+            # Breadth-first search; order doubles as the queue
+            for node in order:
+                next_distance = distance[node] + 1
+                node_paths = paths[node]
+                for neighbor in neighbors[offsets[node]:offsets[node + 1]]:
+                    neighbor_distance = distance[neighbor]
+                    if neighbor_distance < 0:
+                        distance[neighbor] = next_distance
+                        order.append(neighbor)
+                        paths[neighbor] = node_paths
+                    elif neighbor_distance == next_distance:
+                        paths[neighbor] += node_paths
+            # Accumulate dependencies from the farthest nodes back
+            for node in reversed(order):
+                next_distance = distance[node] + 1
+                node_paths = paths[node]
+                total = 0.0
+                for neighbor in neighbors[offsets[node]:offsets[node + 1]]:
+                    if distance[neighbor] == next_distance:
+                        total += node_paths / paths[neighbor] * (1.0 + dependency[neighbor])
+                dependency[node] = total
+                if node != source:
+                    scores[node] += total
+            for node in order:
+                distance[node] = -1
+        # Each undirected path is counted from both ends
+        scale = node_count / len(sources) / 2
+        for node in range(node_count):
+            scores[node] *= scale
+        return scores
+
+
+def load_graph(filename: str) -> Tuple[HopGraph, int]:
+    """Stream results into a HopGraph. Returns (graph, total hops)"""
+    graph = HopGraph()
+    total_hops = 0
+    for origin, destination in iter_endpoints(filename):
+        graph.add(origin, destination)
+        total_hops += 1
+    return graph, total_hops
+
+
+def _top(graph: HopGraph, values, count: int = TOP_COUNT) -> List[Tuple[str, float]]:
+    ranked = sorted(range(len(graph)), key=lambda node: values[node], reverse=True)[:count]
+    return [(graph.ips[node], values[node]) for node in ranked if values[node] > 0]
+
+
+def _degree_bins(distribution: Dict[int, int]) -> List[Tuple[int, int, int]]:
+    """Group a degree distribution into power-of-two bins: (low, high, IPs)"""
+    bins: Dict[int, int] = {}
+    for degree, count in distribution.items():
+        low = 0 if degree == 0 else 1 << (degree.bit_length() - 1)
+        bins[low] = bins.get(low, 0) + count
+    return [(low, max(low, 2 * low - 1), count) for low, count in sorted(bins.items())]
+
+
+def _count_targets() -> int:
+    targets_path = Path(TARGETS_FILE)
+    if targets_path.exists():
+        try:
+            with open(targets_path, 'r') as f:
+                targets_data = json.load(f)
+                if isinstance(targets_data, list):
+                    return len(targets_data)
+        except (json.JSONDecodeError, IOError):
+            pass
+    return 0
+
+
+def save_metrics(metrics: Dict, filename: str):
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, 'w', encoding='utf-8') as f:
+        json.dump(metrics, f, indent=2)
+    Path(temp_filename).replace(filename)
 
-def analyze_results(filename: str = RESULTS_FILE):
-    """Read results.json and analyze IP addresses and hops"""
+
+def analyze_results(
+    filename: str = RESULTS_FILE,
+    json_filename: Optional[str] = None,
+    samples: int = BETWEENNESS_SAMPLES,
+    seed: Optional[int] = None,
+):
+    """Read results.json and analyze IP addresses, hops and the graph they form"""
     file_path = Path(filename)
-    
+
     if not file_path.exists():
         print(f"Error: {filename} not found")
         return
-    
+
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+        with instrumentation.timer('load'):
+            graph, total_hops = load_graph(filename)
     except json.JSONDecodeError as e:
         print(f"Error: Invalid JSON in {filename}: {e}")
         return
     except IOError as e:
         print(f"Error: Could not read {filename}: {e}")
         return
-    
-    if not isinstance(data, list):
-        print(f"Error: {filename} must contain an array")
+    except ValueError as e:
+        print(f"Error: {e}")
         return
-    
-    # Collect unique IPs from both origin and destination
-    # Also count connections (appearances as origin or destination)
-    unique_ips = set()
-    ip_connection_count = {}  # IP -> count of connections
-    total_hops = len(data)
-    
-    for entry in data:
-        origin = entry.get('origin', '')
-        destination = entry.get('destination', '')
-        
-        # Add origin IP if it's not "unknown" and not empty
-        if origin and origin != 'unknown':
-            unique_ips.add(origin)
-            ip_connection_count[origin] = ip_connection_count.get(origin, 0) + 1
-        
-        # Add destination IP if it's not empty
-        if destination:
-            unique_ips.add(destination)
-            ip_connection_count[destination] = ip_connection_count.get(destination, 0) + 1
-    
-    # Count targets
-    targets_path = Path(TARGETS_FILE)
-    target_count = 0
-    if targets_path.exists():
-        try:
-            with open(targets_path, 'r') as f:
-                targets_data = json.load(f)
-                if isinstance(targets_data, list):
-                    target_count = len(targets_data)
-        except (json.JSONDecodeError, IOError):
-            pass
-    
-    # Sort IPs by connection count (descending)
-    sorted_ips = sorted(ip_connection_count.items(), key=lambda x: x[1], reverse=True)
-    top_10_ips = sorted_ips[:10]
-    
+
+    instrumentation.count('hops', total_hops)
+    instrumentation.count('unique_ips', len(graph))
+    target_count = _count_targets()
+    with instrumentation.timer('top_connections'):
+        top_10_ips = _top(graph, graph.connections)
+
+    with instrumentation.timer('build_csr'):
+        graph.build_csr()
+    with instrumentation.timer('degree_distribution'):
+        degree_distribution = graph.degree_distribution()
+    with instrumentation.timer('components'):
+        component_sizes = graph.components()
+    sample_count = min(samples, len(graph))
+    with instrumentation.timer('betweenness'):
+        chokepoints = _top(graph, graph.betweenness(samples, seed))
+
     # Print results
     print(f"Results Analysis for {filename}")
     print("=" * 50)
     print(f"Total hops: {total_hops:,}")
-    print(f"Unique IP addresses: {len(unique_ips):,}")
+    print(f"Unique IP addresses: {len(graph):,}")
     if target_count > 0:
         print(f"Targets in {TARGETS_FILE}: {target_count:,}")
     print()
-    
+
     # Print top 10 IPs by connection count
     if top_10_ips:
         print("Top 10 IPs by connection count:")
@@ -87,10 +283,57 @@ def analyze_results(filename: str = RESULTS_FILE):
         for i, (ip, count) in enumerate(top_10_ips, 1):
             print(f"  {i:2d}. {ip:20s} - {count:,} connection(s)")
         print()
-    
+
+    if degree_distribution:
+        print("Degree distribution (distinct neighbors -> IPs):")
+        print("-" * 50)
+        for low, high, count in _degree_bins(degree_distribution):
+            label = f"{low}" if low == high else f"{low}-{high}"
+            print(f"  {label:>12s} -> {count:,}")
+        print()
+
+    if component_sizes:
+        print(f"Connected components: {len(component_sizes):,} (largest: {component_sizes[0]:,} IPs)")
+        print()
+
+    if chokepoints:
+        print(f"Top 10 chokepoints by betweenness (sampled from {sample_count:,} IPs):")
+        print("-" * 50)
+        for i, (ip, score) in enumerate(chokepoints, 1):
+            print(f"  {i:2d}. {ip:20s} - {score:,.1f}")
+        print()
+
+    if json_filename:
+        save_metrics({
+            'file': filename,
+            'totalHops': total_hops,
+            'uniqueIps': len(graph),
+            'targets': target_count,
+            'topConnections': [{'ip': ip, 'connections': count} for ip, count in top_10_ips],
+            'degreeDistribution': {str(degree): count for degree, count in degree_distribution.items()},
+            'components': {
+                'count': len(component_sizes),
+                'largest': component_sizes[0] if component_sizes else 0,
+                'sizes': component_sizes[:TOP_COUNT],
+            },
+            'betweenness': {
+                'samples': sample_count,
+                'top': [{'ip': ip, 'score': round(score, 3)} for ip, score in chokepoints],
+            },
+        }, json_filename)
+        print(f"Metrics written to {json_filename}")
+
     print("Remember, as you add more targets, the same hops will show up (diminishing returns)")
 
+
 if __name__ == '__main__':
     # Allow custom filename as command line argument
-    filename = sys.argv[1] if len(sys.argv) > 1 else RESULTS_FILE
-    analyze_results(filename)
\ No newline at end of file
+    filenames = positional(sys.argv, ('--json', '--samples', '--seed'))
+    filename = filenames[0] if filenames else RESULTS_FILE
+    with instrumentation.run_report('analysis', sys.argv):
+        analyze_results(
+            filename,
+            json_filename=get_flag(sys.argv, '--json', None),
+            samples=get_flag(sys.argv, '--samples', BETWEENNESS_SAMPLES, int),
+            seed=get_flag(sys.argv, '--seed', None, int),
+        )
@@ -0,0 +1,91 @@
+"""
+Benchmark the clamp/filter pass of ip-geoloc.py, serial vs NumPy.
+
+    python3 benchmarks/bench_clamp_filter.py [entries]
+
+Runs both paths over the same synthetic entries and checks they agree.
+"""
+
+import copy
+import importlib.util
+import io
+import os
+import random
+import sys
+import time
+from contextlib import redirect_stdout
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_ip_geoloc():
+    sys.path.insert(0, APP_DIR)
+    spec = importlib.util.spec_from_file_location("ip_geoloc", os.path.join(APP_DIR, "ip-geoloc.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def synthetic_entries(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    cities = [
+        {"country": f"C{i}", "region": "", "city": f"City {i}",
+         "latitude": rng.uniform(-60, 70), "longitude": rng.uniform(-180, 180)}
+        for i in range(2000)
+    ]
+    entries = []
+    for i in range(count):
+        origin = rng.choice(cities)
+        # Like real routes, most hops stay in the same city or close by, and a few cross oceans
+        roll = rng.random()
+        if roll < 0.5:
+            destination = origin
+        elif roll < 0.95:
+            destination = dict(origin, latitude=origin["latitude"] + rng.uniform(-2, 2),
+                               longitude=origin["longitude"] + rng.uniform(-2, 2))
+        else:
+            destination = rng.choice(cities)
+        entry = {
+            "origin": f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}",
+            "destination": f"11.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}",
+            "pingTime": rng.choice([None, rng.randint(0, 200)]),
+            "origin_geo": origin,
+            "destination_geo": destination,
+        }
+        # Hops measured more than once carry latency aggregates
+        if entry["pingTime"] is not None and rng.random() < 0.3:
+            entry["pingMin"] = rng.randint(0, entry["pingTime"])
+            entry["pingP90"] = entry["pingTime"] + rng.randint(0, 50)
+            entry["samples"] = rng.randint(2, 20)
+        entries.append(entry)
+    return entries
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    geoloc = load_ip_geoloc()
+    os.chdir(APP_DIR)
+    geozones = geoloc.GeozoneIndex(geoloc.load_geozones())
+    entries = synthetic_entries(count)
+
+    timings = {}
+    outputs = {}
+    for name, run in [("serial", geoloc._clamp_and_filter_serial), ("numpy", geoloc._clamp_and_filter_vectorized)]:
+        data = copy.deepcopy(entries)
+        stats = geoloc.ClampFilterStats()
+        log = io.StringIO()
+        start = time.perf_counter()
+        with redirect_stdout(log):
+            kept = run(data, geozones, stats)
+        timings[name] = time.perf_counter() - start
+        outputs[name] = (kept, stats.clamped, stats.filtered, stats.bypassed, log.getvalue())
+
+    serial, vectorized = outputs["serial"], outputs["numpy"]
+    print(f"{count:,} entries: clamped {serial[1]:,}, filtered {serial[2]:,}, bypassed {serial[3]:,}")
+    for name, seconds in timings.items():
+        print(f"  {name:7s} {seconds:8.3f}s  {count / seconds:12,.0f} entries/s")
+    print(f"  speedup {timings['serial'] / timings['numpy']:.1f}x, identical: {serial == vectorized}")
+
+
+if __name__ == "__main__":
+    main()
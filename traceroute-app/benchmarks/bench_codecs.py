@@ -0,0 +1,74 @@
+"""
+Compare how fast results.json is written and read: the standard library with indent=2 (what
+every script did before results_io picked codecs) against the compact one-entry-per-line
+layout through each codec installed (see results_io.py).
+
+    python3 benchmarks/bench_codecs.py [entries]
+
+For each codec: encode and write, load_results (whole file), iter_results (streamed in
+batches) and, with msgspec, iter_endpoints (origin and destination only, as analysis.py reads).
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import results_io  # noqa: E402
+from bench_results_format import synthetic_entries  # noqa: E402
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    entries = synthetic_entries(count)
+    print(f"{count:,} synthetic entries, codecs installed: {', '.join(results_io.CODECS)}")
+    print(f"  {'codec':24s} {'size':>12s} {'write':>8s} {'load':>8s} {'stream':>8s} {'endpoints':>10s}")
+    default_codec = results_io.codec
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "results.json")
+
+        def write_before():
+            with open(filename, "w", encoding="utf-8") as f:
+                json.dump(entries, f, indent=2, ensure_ascii=False)
+
+        def load_before():
+            with open(filename, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+        write_seconds, _ = timed(write_before)
+        load_seconds, loaded = timed(load_before)
+        baseline = load_seconds
+        print(f"  {'json indent=2 (before)':24s} {os.path.getsize(filename):12,} {write_seconds:7.3f}s "
+              f"{load_seconds:7.3f}s")
+
+        for name, codec in results_io.CODECS.items():
+            results_io.codec = codec
+            try:
+                write_seconds, _ = timed(lambda: results_io.save_results(entries, filename, results_io.FLAT,
+                                                                         pretty=False))
+                load_seconds, loaded = timed(lambda: results_io.load_results(filename))
+                stream_seconds, streamed = timed(lambda: sum(1 for _ in results_io.iter_results(filename)))
+                endpoint_seconds, endpoints = timed(lambda: sum(1 for _ in results_io.iter_endpoints(filename)))
+            finally:
+                results_io.codec = default_codec
+            identical = loaded == entries and streamed == endpoints == count
+            print(f"  {name + ' compact':24s} {os.path.getsize(filename):12,} {write_seconds:7.3f}s "
+                  f"{load_seconds:7.3f}s {stream_seconds:7.3f}s {endpoint_seconds:9.3f}s"
+                  f"  {baseline / load_seconds:4.1f}x load{'' if identical else '  MISMATCH'}")
+    print(f"  The scripts use {default_codec.name}"
+          + ("; iter_endpoints decodes into msgspec structs" if results_io.msgspec is not None else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+How ip-geoloc.py --jobs scales: the same full run (offline provider) with 1 process and with
+more, each in a copy of a synthetic dataset, checking the parallel runs write the same
+results.json and print the same output as the single process one.
+
+    python3 benchmarks/bench_geoloc_jobs.py [10k | 100k | 1m | hops] [--jobs 1,2,4] [--data DIR]
+
+The speedup can't exceed the cores available (os.cpu_count() is printed alongside).
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import generate_synthetic  # noqa: E402
+from cli_args import get_flag, positional  # noqa: E402
+
+DEFAULT_JOBS = "1,2,4"
+
+
+def run(data_dir: str, work_dir: str, jobs: int) -> float:
+    """Run ip-geoloc.py --full --jobs in work_dir on a fresh copy of the dataset. Returns seconds"""
+    os.makedirs(work_dir)
+    for filename in ("results.json", "geozones.json"):
+        shutil.copy(os.path.join(data_dir, filename), work_dir)
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, os.path.join(APP_DIR, "ip-geoloc.py"), "--provider", "offline",
+         "--geo-db", os.path.join(data_dir, "ip-ranges.csv"), "--full", "--jobs", str(jobs)],
+        cwd=work_dir, capture_output=True,
+    )
+    seconds = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"ip-geoloc.py --jobs {jobs} failed:\n{completed.stderr.decode()}")
+    with open(os.path.join(work_dir, "output.txt"), "wb") as f:
+        f.write(completed.stdout)
+    return seconds
+
+
+def _same_files(a: str, b: str, filename: str) -> bool:
+    with open(os.path.join(a, filename), "rb") as fa, open(os.path.join(b, filename), "rb") as fb:
+        return fa.read() == fb.read()
+
+
+def main(argv: List[str]) -> int:
+    sizes = positional(argv, ("--jobs", "--data"))
+    hops = generate_synthetic.parse_size(sizes[0]) if sizes else generate_synthetic.SIZES["100k"]
+    job_counts = [int(jobs) for jobs in get_flag(argv, "--jobs", DEFAULT_JOBS).split(",")]
+    if 1 not in job_counts:
+        job_counts.insert(0, 1)
+
+    with tempfile.TemporaryDirectory(prefix="bench-geoloc-jobs-") as temp_dir:
+        data_dir = os.path.abspath(get_flag(argv, "--data", os.path.join(temp_dir, "data")))
+        if not os.path.exists(os.path.join(data_dir, "results.json")):
+            generate_synthetic.generate(hops, data_dir)
+        print(f"{hops:,} hops, {os.cpu_count()} CPU(s)")
+        print(f"  {'jobs':>4s} {'seconds':>9s} {'speedup':>8s}  same output")
+        baseline_dir = os.path.join(temp_dir, "jobs-1")
+        baseline = run(data_dir, baseline_dir, 1)
+        print(f"  {1:4d} {baseline:9.2f} {1:7.2f}x")
+        mismatches = 0
+        for jobs in job_counts:
+            if jobs == 1:
+                continue
+            work_dir = os.path.join(temp_dir, f"jobs-{jobs}")
+            seconds = run(data_dir, work_dir, jobs)
+            same = all(_same_files(baseline_dir, work_dir, filename)
+                       for filename in ("results.json", "output.txt", "results.geo.state.json"))
+            mismatches += not same
+            print(f"  {jobs:4d} {seconds:9.2f} {baseline / seconds:7.2f}x  {'yes' if same else 'NO'}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
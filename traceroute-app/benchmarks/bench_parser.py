@@ -0,0 +1,59 @@
+"""
+Benchmark traceroute output parsing, per line vs batch, through to result entries.
+
+    python3 benchmarks/bench_parser.py [outputs]
+
+per-line   unix.parse_traceroute_line on every line, _extract_ip_from_line on the rest, then
+           format_results, as process_traceroute used to
+batch      unix.parse_traceroute_outputs over every output at once, then columns_to_entries
+
+Runs both over the same synthetic outputs and checks they give the same entries.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unix  # noqa: E402
+from replay_tracer import SyntheticNetwork  # noqa: E402
+
+
+def parse_by_line(output: str):
+    """Result entries for one output through the per-line parser"""
+    hops, standalone_ips = [], []
+    for line in output.split("\n"):
+        hop = unix.parse_traceroute_line(line)
+        if hop:
+            if hop.hop > unix.FIRST_HOP_FILTER:
+                hops.append(hop)
+        else:
+            ip = unix._extract_ip_from_line(line)
+            if ip:
+                standalone_ips.append(ip)
+    return [entry.model_dump() for entry in unix.format_results(hops, standalone_ips)]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    network = SyntheticNetwork()
+    outputs = [network.output(f"45.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}") for i in range(count)]
+    lines = sum(output.count("\n") for output in outputs)
+
+    start = time.perf_counter()
+    by_line = [entry for output in outputs for entry in parse_by_line(output)]
+    per_line = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = unix.columns_to_entries(unix.parse_traceroute_outputs(outputs))
+    batched = time.perf_counter() - start
+
+    print(f"{count:,} outputs, {lines:,} lines, {len(batch):,} entries")
+    for name, seconds in (("per-line", per_line), ("batch", batched)):
+        print(f"  {name:8s} {seconds:8.3f}s  {lines / seconds:12,.0f} lines/s")
+    print(f"  speedup {per_line / batched:.1f}x, identical: {by_line == batch}")
+
+
+if __name__ == "__main__":
+    main()
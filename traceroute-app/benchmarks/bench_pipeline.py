@@ -0,0 +1,213 @@
+"""
+End-to-end benchmark of the pipeline on synthetic data, without root or a network.
+
+    python3 benchmarks/bench_pipeline.py [10k | 100k | 1m | hops] [--data DIR] [--stages a,b]
+                                         [--json out.json] [--compare baseline.json]
+
+Stages, each over a dataset from generate_synthetic.py (written to --data, or a temp dir):
+    parse      unix.parse_traceroute_line over every line of synthetic traceroute outputs, then
+               format_results into dicts, the per-line path
+    columnar   unix.parse_traceroute_outputs + columns_to_entries over the same outputs
+    collect    unix.trace_columns + columns_to_entries through a ReplayTracer, no latency
+    save       unix.save_results into a fresh results.db / results.json
+    geoloc     ip-geoloc.py process_results with the offline provider (geolocate, clamp, filter)
+    analyze    analysis.analyze_results
+
+Each stage runs in a process of its own, so its peak memory (max RSS, inputs included) isn't
+hidden by an earlier stage. --compare exits with status 1 if a stage's throughput dropped more
+than REGRESSION_TOLERANCE below the baseline, a file written by --json.
+"""
+
+import importlib.util
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from functools import partial
+from typing import Dict, List
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_parser  # noqa: E402
+import generate_synthetic  # noqa: E402
+from cli_args import get_flag, positional  # noqa: E402
+
+STAGES = ("parse", "columnar", "collect", "save", "geoloc", "analyze")
+REGRESSION_TOLERANCE = 0.25
+HOPS_PER_TRACE = 8  # Roughly what a synthetic trace contributes to results.json
+
+
+def load_ip_geoloc():
+    spec = importlib.util.spec_from_file_location("ip_geoloc", os.path.join(APP_DIR, "ip-geoloc.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _trace_targets(data_dir: str, hops: int) -> List[str]:
+    with open(os.path.join(data_dir, "targets.json"), "r", encoding="utf-8") as f:
+        targets = json.load(f)
+    count = max(1, hops // HOPS_PER_TRACE)
+    # Past the dataset's destinations, make up more so every trace goes somewhere distinct
+    return targets[:count] + [f"45.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(len(targets), count)]
+
+
+def _run_stage(name: str, data_dir: str, work_dir: str, hops: int) -> Dict:
+    """Run one stage in this process. Returns items processed and seconds spent on them"""
+    import unix
+    from replay_tracer import ReplayTracer, SyntheticNetwork
+
+    os.chdir(work_dir)
+    log = io.StringIO()
+    if name in ("parse", "columnar", "collect"):
+        network = SyntheticNetwork()
+        targets = _trace_targets(data_dir, hops)
+    if name in ("parse", "columnar"):
+        outputs = [network.output(target) for target in targets]
+        lines = [line for output in outputs for line in output.split("\n") if line]
+        start = time.perf_counter()
+        if name == "parse":
+            for output in outputs:
+                bench_parser.parse_by_line(output)
+        else:
+            unix.columns_to_entries(unix.parse_traceroute_outputs(outputs))
+        return {"items": len(lines), "unit": "lines", "seconds": time.perf_counter() - start}
+
+    if name == "collect":
+        trace = partial(unix.trace_columns, tracer=ReplayTracer(network=network))
+        start = time.perf_counter()
+        with redirect_stdout(log):
+            outcomes = unix.schedule_traceroutes(targets, trace, workers=8)
+            for columns in outcomes:
+                unix.columns_to_entries(columns)
+        return {"items": len(targets), "unit": "traces", "seconds": time.perf_counter() - start}
+
+    with open(os.path.join(data_dir, "results.json"), "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    if name == "save":
+        results = [unix.ResultEntry(**entry) for entry in entries]
+        del entries
+        start = time.perf_counter()
+        with redirect_stdout(log):
+            unix.save_results(results, os.path.join(work_dir, "results.json"), os.path.join(work_dir, "results.db"))
+        return {"items": len(results), "unit": "hops", "seconds": time.perf_counter() - start}
+
+    if name == "geoloc":
+        geoloc = load_ip_geoloc()
+        for filename in ("results.json", "geozones.json"):
+            shutil.copy(os.path.join(data_dir, filename), work_dir)
+        client = geoloc.OfflineGeoProvider(os.path.join(data_dir, "ip-ranges.csv"))
+        start = time.perf_counter()
+        with redirect_stdout(log):
+            geoloc.process_results(client=client, full=True)
+        return {"items": len(entries), "unit": "hops", "seconds": time.perf_counter() - start}
+
+    if name == "analyze":
+        import analysis
+        start = time.perf_counter()
+        with redirect_stdout(log):
+            analysis.analyze_results(os.path.join(data_dir, "results.json"), seed=0)
+        return {"items": len(entries), "unit": "hops", "seconds": time.perf_counter() - start}
+    raise ValueError(f"Unknown stage {name!r}, expected one of {', '.join(STAGES)}")
+
+
+def run_stage(name: str, data_dir: str, hops: int) -> Dict:
+    """Run a stage in a fresh interpreter and add its throughput and peak memory"""
+    with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as work_dir:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--stage", name, "--data", data_dir,
+             "--work", work_dir, str(hops)],
+            capture_output=True, text=True,
+        )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Stage {name} failed:\n{completed.stderr}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["throughput"] = result["items"] / result["seconds"] if result["seconds"] > 0 else 0.0
+    return result
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    """Stages whose throughput fell more than tolerance below the baseline's"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name, {}).get("throughput")
+        if before and result["throughput"] < before * (1 - tolerance):
+            regressions.append(f"{name}: {result['throughput']:,.0f} {result['unit']}/s, "
+                               f"baseline {before:,.0f} ({result['throughput'] / before - 1:+.0%})")
+    return regressions
+
+
+def main(argv: List[str]):
+    sizes = positional(argv, ("--data", "--stage", "--work", "--stages", "--json", "--compare"))
+    hops = generate_synthetic.parse_size(sizes[0]) if sizes else generate_synthetic.SIZES["10k"]
+    data_dir = get_flag(argv, "--data", None)
+
+    stage = get_flag(argv, "--stage", None)
+    if stage is not None:
+        result = _run_stage(stage, os.path.abspath(data_dir), get_flag(argv, "--work", "."), hops)
+        # ru_maxrss is in kilobytes on Linux, bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        result["peak_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1_000_000
+        print(json.dumps(result))
+        return 0
+
+    stages = get_flag(argv, "--stages", ",".join(STAGES)).split(",")
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        print(f"Unknown stage(s) {', '.join(unknown)}, expected some of {', '.join(STAGES)}")
+        return 2
+
+    temp_dir = None
+    if data_dir is None:
+        temp_dir = tempfile.TemporaryDirectory(prefix="bench-data-")
+        data_dir = temp_dir.name
+    data_dir = os.path.abspath(data_dir)
+    try:
+        if not os.path.exists(os.path.join(data_dir, "results.json")):
+            start = time.perf_counter()
+            generate_synthetic.generate(hops, data_dir)
+            print(f"Generated {hops:,} hops in {data_dir} ({time.perf_counter() - start:.1f}s)")
+
+        results = {}
+        print(f"{'stage':10s} {'items':>12s} {'seconds':>9s} {'throughput':>20s} {'peak MB':>9s}")
+        for name in stages:
+            result = results[name] = run_stage(name, data_dir, hops)
+            throughput = f"{result['throughput']:,.0f} {result['unit']}/s"
+            print(f"{name:10s} {result['items']:12,d} {result['seconds']:9.3f} {throughput:>20s} "
+                  f"{result['peak_mb']:9.1f}")
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    json_filename = get_flag(argv, "--json", None)
+    if json_filename:
+        with open(json_filename, "w", encoding="utf-8") as f:
+            json.dump({"hops": hops, "stages": results}, f, indent=2)
+        print(f"Wrote {json_filename}")
+
+    baseline_filename = get_flag(argv, "--compare", None)
+    if baseline_filename:
+        with open(baseline_filename, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("hops") != hops:
+            print(f"Warning: baseline was measured on {baseline.get('hops'):,} hops, this run on {hops:,}")
+        regressions = compare(results, baseline["stages"])
+        if regressions:
+            print(f"Throughput regressions (more than {REGRESSION_TOLERANCE:.0%} below {baseline_filename}):")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"No stage more than {REGRESSION_TOLERANCE:.0%} slower than {baseline_filename}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
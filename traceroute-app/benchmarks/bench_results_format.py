@@ -0,0 +1,94 @@
+"""
+Compare the flat and normalized results layouts (see results_io.py): file size, gzipped
+size, load time and memory.
+
+    python3 benchmarks/bench_results_format.py [results.json | entries]
+
+Given a results file, measures it; given a number (default 200,000), measures synthetic
+entries shaped like real routes: a few busy routers appear in many hops.
+"""
+
+import gzip
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import results_io  # noqa: E402
+
+
+def synthetic_entries(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    cities = [
+        {"country": f"Country {i % 150}", "region": f"Region {i}", "city": f"City {i}",
+         "latitude": round(rng.uniform(-60, 70), 4), "longitude": round(rng.uniform(-180, 180), 4)}
+        for i in range(3000)
+    ]
+    router_count = max(10, count // 4)
+    routers = [f"{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+               for _ in range(router_count)]
+    geos = [rng.choice(cities) if rng.random() < 0.97 else None for _ in range(router_count)]
+    entries = []
+    seen = set()
+    while len(entries) < count:
+        # Pareto-distributed router picks: a small core shows up in most routes
+        origin = min(int(rng.paretovariate(1.2)) - 1, router_count - 1)
+        destination = rng.randrange(router_count)
+        if origin == destination or (origin, destination) in seen:
+            continue
+        seen.add((origin, destination))
+        entries.append({
+            "origin": routers[origin],
+            "destination": routers[destination],
+            "pingTime": rng.randint(1, 150),
+            "origin_geo": geos[origin],
+            "destination_geo": geos[destination],
+        })
+    return entries
+
+
+def measure(filename: str):
+    with open(filename, "rb") as f:
+        raw = f.read()
+    start = time.perf_counter()
+    results_io.load_results(filename)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    entries = results_io.load_results(filename)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(raw), len(gzip.compress(raw, 6)), seconds, peak, entries
+
+
+def main():
+    argument = sys.argv[1] if len(sys.argv) > 1 else "200000"
+    with tempfile.TemporaryDirectory() as directory:
+        flat = os.path.join(directory, "flat.json")
+        normalized = os.path.join(directory, "normalized.json")
+        if argument.isdigit():
+            entries = synthetic_entries(int(argument))
+            print(f"{len(entries):,} synthetic entries")
+        else:
+            entries = results_io.load_results(argument)
+            print(f"{len(entries):,} entries from {argument}")
+        results_io.save_results(entries, flat, results_io.FLAT)
+        results_io.save_results(entries, normalized, results_io.NORMALIZED)
+        del entries
+
+        rows = {name: measure(path) for name, path in [("flat", flat), ("normalized", normalized)]}
+        print(f"  {'layout':11s} {'size':>14s} {'gzipped':>14s} {'load':>9s} {'peak memory':>14s}")
+        for name, (size, gzipped, seconds, peak, _) in rows.items():
+            print(f"  {name:11s} {size:14,} {gzipped:14,} {seconds:8.3f}s {peak / 2**20:12.1f}MB")
+        (size, gzipped, seconds, peak, flat_entries), (n_size, n_gzipped, n_seconds, n_peak, n_entries) = rows.values()
+        print(f"  normalized is {size / n_size:.1f}x smaller ({gzipped / n_gzipped:.1f}x gzipped), "
+              f"loads {seconds / n_seconds:.1f}x faster in {peak / n_peak:.1f}x less memory")
+        print(f"  round trip identical: {flat_entries == n_entries}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Generate a synthetic dataset shaped like a real collection, for benchmarks and tests.
+
+    python3 benchmarks/generate_synthetic.py [10k | 100k | 1m | hops] [--out DIR] [--seed N]
+
+Writes to DIR (default synthetic-<hops>):
+    results.json    hops as unix.py exports them (no geolocation yet), unique (origin, destination)
+    ip-ranges.csv   an offline geolocation database covering every router, for
+                    ip-geoloc.py --provider offline
+    geozones.json   corridors between far apart cities, some hops cross them
+    targets.json    up to 10,000 of the destinations the hops lead to
+
+Routers sit in /24s that belong to cities; most hops stay in a city or go to a neighbouring
+router, a few cross oceans, and a Pareto-picked core shows up in many hops.
+"""
+
+import csv
+import json
+import math
+import os
+import random
+import sys
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import results_io  # noqa: E402
+from cli_args import get_flag, positional  # noqa: E402
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+ROUTERS_PER_PREFIX = 32
+PREFIXES_PER_CITY = 4
+CITIES_PER_REGION = 16
+GEOZONE_COUNT = 12
+MISSING_PING_CHANCE = 0.1
+UNKNOWN_ORIGIN_CHANCE = 0.03
+FAR_HOP_CHANCE = 0.05
+
+
+def parse_size(value: str) -> int:
+    value = value.lower().replace("_", "").replace(",", "")
+    return SIZES[value] if value in SIZES else int(value)
+
+
+def _router_ip(router: int) -> str:
+    prefix = router // ROUTERS_PER_PREFIX
+    return f"{20 + (prefix >> 16)}.{(prefix >> 8) & 255}.{prefix & 255}.{router % ROUTERS_PER_PREFIX + 1}"
+
+
+def _cities(count: int, rng: random.Random) -> List[Dict]:
+    """Cities in groups of CITIES_PER_REGION a few hundred km apart, so neighbouring routers
+    (and cities) are usually close and a random pair usually isn't"""
+    cities = []
+    for i in range(count):
+        if i % CITIES_PER_REGION == 0:
+            region_lat, region_lon = rng.uniform(-45, 60), rng.uniform(-165, 170)
+        cities.append({
+            "country": f"Country {i // CITIES_PER_REGION}", "region": f"Region {i // CITIES_PER_REGION}",
+            "city": f"City {i}",
+            "latitude": round(region_lat + rng.uniform(-4, 4), 4),
+            "longitude": round(region_lon + rng.uniform(-4, 4), 4),
+        })
+    return cities
+
+
+def _distance_km(a: Dict, b: Dict) -> float:
+    lat1, lat2 = math.radians(a["latitude"]), math.radians(b["latitude"])
+    dlat, dlon = lat2 - lat1, math.radians(b["longitude"] - a["longitude"])
+    h = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+    return 6371 * 2 * math.asin(math.sqrt(h))
+
+
+def _write_results(filename: str, entries):
+    """Write entries in results_io's compact layout, one per line, without holding them all"""
+    with open(filename, "wb") as f:
+        f.write(b"[")
+        for i, entry in enumerate(entries):
+            f.write(b",\n" if i else b"\n")
+            f.write(results_io.encode_entry(entry))
+        f.write(b"\n]\n")
+
+
+def generate(hops: int, directory: str, seed: int = 0) -> Dict[str, int]:
+    """Write the dataset to directory. Returns counts of what was written"""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    router_count = max(64, hops // 3)
+    prefix_count = -(-router_count // ROUTERS_PER_PREFIX)
+    cities = _cities(max(8, min(2000, prefix_count // PREFIXES_PER_CITY)), rng)
+
+    def city_of(router: int) -> Dict:
+        return cities[(router // ROUTERS_PER_PREFIX // PREFIXES_PER_CITY) % len(cities)]
+
+    destinations = set()
+
+    def entries():
+        seen = set()
+        produced = 0
+        while produced < hops:
+            origin = min(int(rng.paretovariate(1.1)) - 1, router_count - 1) if rng.random() < 0.3 \
+                else rng.randrange(router_count)
+            if rng.random() < FAR_HOP_CHANCE:
+                destination = rng.randrange(router_count)
+            else:
+                destination = min(router_count - 1, max(0, origin + rng.randint(-96, 96)))
+            key = origin * router_count + destination
+            if origin == destination or key in seen:
+                continue
+            seen.add(key)
+            produced += 1
+            distance = _distance_km(city_of(origin), city_of(destination))
+            ping = None if rng.random() < MISSING_PING_CHANCE else \
+                max(0, int(distance / 100 + rng.expovariate(1 / 4)))
+            destinations.add(destination)
+            yield {
+                "origin": "unknown" if rng.random() < UNKNOWN_ORIGIN_CHANCE else _router_ip(origin),
+                "destination": _router_ip(destination),
+                "pingTime": ping,
+            }
+
+    _write_results(os.path.join(directory, "results.json"), entries())
+
+    with open(os.path.join(directory, "ip-ranges.csv"), "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["start", "end", "country", "region", "city", "latitude", "longitude"])
+        for prefix in range(prefix_count):
+            city = city_of(prefix * ROUTERS_PER_PREFIX)
+            network = _router_ip(prefix * ROUTERS_PER_PREFIX).rsplit(".", 1)[0]
+            writer.writerow([f"{network}.0", f"{network}.255", city["country"], city["region"], city["city"],
+                             city["latitude"], city["longitude"]])
+
+    features = []
+    for i in range(GEOZONE_COUNT):
+        a, b = rng.sample(cities, 2)
+        width = 3.0
+        ring = [
+            [a["longitude"] - width, a["latitude"] - width], [b["longitude"] - width, b["latitude"] - width],
+            [b["longitude"] + width, b["latitude"] + width], [a["longitude"] + width, a["latitude"] + width],
+        ]
+        features.append({
+            "type": "Feature",
+            "properties": {"id": f"zone-{i + 1}", "name": f"{a['city']} - {b['city']}"},
+            "geometry": {"type": "Polygon", "coordinates": [ring + [ring[0]]]},
+        })
+    with open(os.path.join(directory, "geozones.json"), "w", encoding="utf-8") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f, indent=2)
+
+    with open(os.path.join(directory, "targets.json"), "w", encoding="utf-8") as f:
+        json.dump([_router_ip(router) for router in sorted(destinations)[:10_000]], f, indent=2)
+
+    return {"hops": hops, "routers": router_count, "prefixes": prefix_count, "cities": len(cities),
+            "geozones": GEOZONE_COUNT}
+
+
+if __name__ == "__main__":
+    sizes = positional(sys.argv, ("--out", "--seed"))
+    size = parse_size(sizes[0]) if sizes else SIZES["10k"]
+    out = get_flag(sys.argv, "--out", f"synthetic-{size}")
+    counts = generate(size, out, get_flag(sys.argv, "--seed", 0, int))
+    print(f"Wrote {counts['hops']:,} hops over {counts['routers']:,} routers in {counts['cities']:,} cities "
+          f"({counts['prefixes']:,} /24 ranges, {counts['geozones']} geozones) to {out}")
@@ -0,0 +1,42 @@
+"""
+Command-line parsing shared by the scripts, which take "--flag value" options, "--flag"
+switches and positional arguments in any order:
+
+    python3 tile_results.py --full results.json --out tiles
+
+A switch can't be told from an option by looking at argv, so positional() is given the
+options a script takes; any other "--flag" is a switch and doesn't consume the next argument.
+"""
+
+from typing import Callable, Iterable, List, TypeVar
+
+T = TypeVar('T')
+
+# Options every script accepts through instrumentation.run_report
+COMMON_OPTIONS = ('--metrics',)
+
+
+def get_flag(argv: List[str], flag: str, default: T, cast: Callable[[str], T] = str) -> T:
+    """Return the value following flag in argv, or default if absent or invalid"""
+    if flag not in argv:
+        return default
+    try:
+        return cast(argv[argv.index(flag) + 1])
+    except (IndexError, ValueError):
+        print(f"Warning: {flag} expects a value, using {default}")
+        return default
+
+
+def positional(argv: List[str], options: Iterable[str] = ()) -> List[str]:
+    """The arguments after argv[0] that are neither flags nor the values of options"""
+    options = set(options).union(COMMON_OPTIONS)
+    args = []
+    takes_value = False
+    for arg in argv[1:]:
+        if takes_value:
+            takes_value = False
+        elif arg.startswith('--'):
+            takes_value = arg in options
+        else:
+            args.append(arg)
+    return args
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Long-running collection: re-trace every target on its own schedule instead of rerunning
+unix.py over all of targets.json.
+
+Targets wait in a priority queue ordered by when they're due. After each trace the path
+(hop number -> IP) is compared with the previous one:
+
+    new       first trace of the target                     -> BASE_INTERVAL
+    changed   a hop moved to an IP never seen at that TTL   -> MIN_INTERVAL
+    churn     hops only alternate between IPs already seen  -> interval / 2, down to MIN_INTERVAL
+              at their TTL (load balancing)
+    stable    same path                                     -> interval * 2, up to MAX_INTERVAL
+
+Only differences are written: one line per new, changed or churning route to route_diffs.jsonl,
+and only new and changed routes' hops go to results.db/results.json (churn only revisits hops
+already there). A stable route costs one trace per (growing) interval and no storage.
+Schedules and last paths live in daemon.db, so a restart picks up where it stopped. SIGTERM
+stops it after the traces running finish.
+
+    python3 collector_daemon.py [--workers N] [--batch N] [--min-interval M] [--max-interval M]
+                                [--stream] [--no-resolve] [--hosts hosts.json]
+                                [--replay recorded/ | --synthetic] [--latency MS]
+
+Intervals are in minutes. --replay and --synthetic trace through replay_tracer as unix.py does,
+without root or a network. The clock, sleep and tracer (a unix.Tracer) are arguments of
+CollectorDaemon, so it can run against a fake clock and canned traces.
+"""
+
+import heapq
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+
+import shards
+import target_resolver
+import unix
+from cli_args import get_flag
+from unix import HopColumns, columns_to_entries, save_entries, schedule_traceroutes
+
+DAEMON_DB_FILE = 'daemon.db'
+ROUTE_DIFFS_FILE = 'route_diffs.jsonl'
+MIN_INTERVAL = 15 * 60
+BASE_INTERVAL = 60 * 60
+MAX_INTERVAL = 24 * 60 * 60
+BACKOFF = 2.0
+BATCH_SIZE = 8  # Due targets traced per round
+MAX_IDLE_SLEEP = 60
+MAX_SEEN_PER_TTL = 8  # Alternative IPs remembered per hop, to tell churn from change
+
+NEW, CHANGED, CHURN, STABLE, FAILED = 'new', 'changed', 'churn', 'stable', 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS routes (
+    target TEXT PRIMARY KEY,
+    due REAL NOT NULL,
+    interval REAL NOT NULL,
+    path TEXT,
+    seen TEXT NOT NULL DEFAULT '{}',
+    traces INTEGER NOT NULL DEFAULT 0,
+    changes INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+Path = Dict[int, str]
+
+
+def to_path(columns: HopColumns) -> Path:
+    """Hop number -> IP of a single traced output, past unix.FIRST_HOP_FILTER"""
+    return {
+        hop: columns.ip_at(row) for row, hop in enumerate(columns.hop) if hop > unix.FIRST_HOP_FILTER
+    }
+
+
+def classify(previous: Optional[Path], path: Path, seen: Dict[int, List[str]]) -> Tuple[str, List[list]]:
+    """Kind of change from previous to path, and the hops that differ as [ttl, old ip, new ip]"""
+    if not path:
+        return FAILED, []
+    if previous is None:
+        return NEW, []
+    changed = [
+        [ttl, previous.get(ttl), path.get(ttl)]
+        for ttl in sorted(set(previous) | set(path))
+        if previous.get(ttl) != path.get(ttl)
+    ]
+    if not changed:
+        return STABLE, []
+    if all(new is None or new in seen.get(ttl, ()) for ttl, _, new in changed):
+        return CHURN, changed
+    return CHANGED, changed
+
+
+def next_interval(kind: str, interval: float, min_interval: float = MIN_INTERVAL,
+                  max_interval: float = MAX_INTERVAL) -> float:
+    if kind == NEW:
+        interval = BASE_INTERVAL
+    elif kind == CHANGED:
+        interval = min_interval
+    elif kind == CHURN:
+        interval = max(min_interval, interval / BACKOFF)
+    elif kind == STABLE:
+        interval = interval * BACKOFF
+    return min(max_interval, max(min_interval, interval))
+
+
+class CollectorDaemon:
+    def __init__(
+        self,
+        targets: List[str],
+        tracer: unix.Tracer,
+        db_filename: str = DAEMON_DB_FILE,
+        diffs_filename: str = ROUTE_DIFFS_FILE,
+        results_filename: str = unix.RESULTS_FILE,
+        store_filename: str = unix.STORE_FILE,
+        workers: int = unix.DEFAULT_WORKERS,
+        per_prefix: int = unix.MAX_TRACES_PER_PREFIX,
+        batch: int = BATCH_SIZE,
+        min_interval: float = MIN_INTERVAL,
+        max_interval: float = MAX_INTERVAL,
+        clock: Callable[[], float] = time.time,
+        sleep: Optional[Callable[[float], None]] = None,
+        stop: Optional[threading.Event] = None,
+        stream: bool = False,
+        sudo_password: Optional[str] = None,
+    ):
+        self.tracer = tracer
+        self.trace = partial(unix.trace_columns, tracer=tracer, stream=stream, sudo_password=sudo_password)
+        self.diffs_filename = diffs_filename
+        self.results_filename = results_filename
+        self.store_filename = store_filename
+        self.workers = workers
+        self.per_prefix = per_prefix
+        self.batch = max(1, batch)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.clock = clock
+        self.stop = stop or threading.Event()
+        self.sleep = sleep or self.stop.wait
+        self.stats = {kind: 0 for kind in (NEW, CHANGED, CHURN, STABLE, FAILED)}
+        self.connection = sqlite3.connect(db_filename)
+        self.connection.executescript(_SCHEMA)
+        self.queue: List[Tuple[float, str]] = []
+        self._load(targets)
+
+    def close(self):
+        self.connection.close()
+
+    def _load(self, targets: List[str]):
+        """Queue targets, keeping the schedule of those traced before; new ones are due now"""
+        now = self.clock()
+        known = dict(self.connection.execute('SELECT target, due FROM routes'))
+        with self.connection:
+            for target in dict.fromkeys(targets):
+                if target not in known:
+                    self.connection.execute(
+                        'INSERT INTO routes (target, due, interval) VALUES (?, ?, ?)', (target, now, BASE_INTERVAL)
+                    )
+                heapq.heappush(self.queue, (known.get(target, now), target))
+
+    def _due(self, now: float) -> List[str]:
+        due = []
+        while self.queue and self.queue[0][0] <= now and len(due) < self.batch:
+            due.append(heapq.heappop(self.queue)[1])
+        return due
+
+    def _record(self, target: str, path: Path, now: float) -> str:
+        interval, path_json, seen_json, changes = self.connection.execute(
+            'SELECT interval, path, seen, changes FROM routes WHERE target = ?', (target,)
+        ).fetchone()
+        previous = None if path_json is None else {int(ttl): ip for ttl, ip in json.loads(path_json).items()}
+        seen = {int(ttl): ips for ttl, ips in json.loads(seen_json).items()}
+        kind, changed = classify(previous, path, seen)
+        interval = next_interval(kind, interval, self.min_interval, self.max_interval)
+
+        for ttl, ip in path.items():
+            ips = seen.setdefault(ttl, [])
+            if ip not in ips:
+                ips.append(ip)
+                del ips[:-MAX_SEEN_PER_TTL]
+        if kind in (NEW, CHANGED, CHURN):
+            diff = {'time': round(now, 3), 'target': target, 'kind': kind}
+            if kind == NEW:
+                diff['path'] = [[ttl, ip] for ttl, ip in sorted(path.items())]
+            else:
+                diff['changed'] = changed
+            with open(self.diffs_filename, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(diff) + '\n')
+        with self.connection:
+            self.connection.execute(
+                'UPDATE routes SET due = ?, interval = ?, path = ?, seen = ?, traces = traces + 1, changes = ? '
+                'WHERE target = ?',
+                (now + interval, interval, json.dumps(path) if path else path_json, json.dumps(seen),
+                 changes + (kind in (CHANGED, CHURN)), target),
+            )
+        heapq.heappush(self.queue, (now + interval, target))
+        self.stats[kind] += 1
+        return kind
+
+    def run_once(self) -> int:
+        """Trace the targets due now. Returns how many were traced"""
+        due = self._due(self.clock())
+        if not due:
+            return 0
+        outcomes = schedule_traceroutes(due, self.trace, workers=self.workers, per_prefix=self.per_prefix)
+        now = self.clock()
+        entries = []
+        for target, columns in zip(due, outcomes):
+            kind = self._record(target, to_path(columns), now)
+            print(f"  {target}: {kind}, next in {self.interval_of(target) / 60:.0f} min")
+            if kind in (NEW, CHANGED):
+                entries.extend(columns_to_entries(columns))
+        if entries:
+            save_entries(entries, self.results_filename, self.store_filename)
+        return len(due)
+
+    def interval_of(self, target: str) -> float:
+        return self.connection.execute('SELECT interval FROM routes WHERE target = ?', (target,)).fetchone()[0]
+
+    def run(self, max_rounds: Optional[int] = None):
+        """Trace targets as they come due until stop is set (or after max_rounds rounds)"""
+        rounds = 0
+        while not self.stop.is_set() and (max_rounds is None or rounds < max_rounds):
+            if self.run_once():
+                rounds += 1
+                continue
+            wait = self.queue[0][0] - self.clock() if self.queue else MAX_IDLE_SLEEP
+            self.sleep(min(MAX_IDLE_SLEEP, max(0.0, wait)))
+
+    def summary(self) -> str:
+        return ', '.join(f"{count} {kind}" for kind, count in self.stats.items())
+
+
+def main(argv: List[str]):
+    workers = max(1, get_flag(argv, '--workers', unix.DEFAULT_WORKERS, int))
+    per_prefix = max(1, get_flag(argv, '--per-prefix', unix.MAX_TRACES_PER_PREFIX, int))
+    batch = max(1, get_flag(argv, '--batch', BATCH_SIZE, int))
+    min_interval = max(1, get_flag(argv, '--min-interval', MIN_INTERVAL // 60, int)) * 60
+    max_interval = max(min_interval, get_flag(argv, '--max-interval', MAX_INTERVAL // 60, int) * 60)
+    hosts_file = get_flag(argv, '--hosts', None)
+
+    targets = unix.read_targets()
+    if not targets:
+        print(f"No targets found. Please ensure {unix.TARGETS_FILE} contains an array of IPv4 addresses.")
+        return
+    if '--no-resolve' not in argv:
+        resolver = target_resolver.HostsResolver(hosts_file) if hosts_file else target_resolver.system_resolver
+        targets = unix.preflight_targets(targets, resolver=resolver)
+
+    tracer, sudo_password = unix.tracer_from_args(argv)
+    if tracer is None:
+        return
+
+    daemon = CollectorDaemon(targets, tracer, workers=workers, per_prefix=per_prefix, batch=batch,
+                             min_interval=min_interval, max_interval=max_interval, stop=shards.stop_on_sigterm(),
+                             stream='--stream' in argv, sudo_password=sudo_password)
+    print(f"Collecting from {len(targets)} target(s), re-tracing every {min_interval // 60}-{max_interval // 60} min "
+          f"depending on how often their route changes. Diffs go to {ROUTE_DIFFS_FILE}")
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.close()
+    print(f"\nStopped: {daemon.summary()}")
+    if not os.path.exists(ROUTE_DIFFS_FILE):
+        print("No route changes recorded")
+
+
+if __name__ == '__main__':
+    main(sys.argv)
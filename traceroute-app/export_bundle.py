@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Export results.json as a compact binary bundle for the website.
+
+The map only needs each distinct location once, and only the hops with both ends located,
+so those are deduplicated here instead of in the browser. The bundle is little-endian:
+
+    header       magic "WWMB", then uint32 version, string table bytes, node count, edge count, 0
+    strings      UTF-8, separated by NUL, padded to 8 bytes
+    nodes        float64 latitude[n], float64 longitude[n],
+                 uint32 country[n], region[n], city[n] (indexes into the string table), padded to 8 bytes
+    edges        uint32 origin[e], destination[e] (node indexes),
+                 int32 pingTime[e], pingMin[e], pingP90[e] (-1 when missing), uint32 samples[e]
+
+It's written as results-<content hash>.bin, next to .gz (and .br when the brotli module is
+installed) precompressed copies, and bundle.json points at the current one. Bundles the
+manifest no longer references are removed, except the one it pointed to before.
+
+    python3 export_bundle.py [results.json] [--out DIR]
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import results_io
+from cli_args import get_flag, positional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+RESULTS_FILE = 'results.json'
+BUNDLE_DIR = os.path.join('..', 'website', 'public', 'data')
+MANIFEST_FILE = 'bundle.json'
+BUNDLE_MAGIC = b'WWMB'
+BUNDLE_VERSION = 1
+NO_PING = -1
+
+_HEADER = struct.Struct('<4sIIIII')
+
+
+def _pad(data: bytearray, alignment: int = 8):
+    data.extend(bytes(-len(data) % alignment))
+
+
+def _column(typecode: str, values: List) -> bytes:
+    column = array(typecode, values)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column.tobytes()
+
+
+def _ping(value) -> int:
+    return NO_PING if value is None else int(value)
+
+
+def build_bundle(entries) -> Tuple[bytes, int, int]:
+    """Encode results entries as a bundle. Returns (bundle, node count, edge count)"""
+    strings: List[str] = []
+    string_ids: Dict[str, int] = {}
+    node_ids: Dict[Tuple[float, float], int] = {}
+    latitudes, longitudes, countries, regions, cities = [], [], [], [], []
+    origins, destinations, pings, ping_mins, ping_p90s, samples = [], [], [], [], [], []
+
+    def intern(value: Optional[str]) -> int:
+        value = value or ''
+        if value not in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value)
+        return string_ids[value]
+
+    def node(geo: Optional[Dict]) -> Optional[int]:
+        if not geo or geo.get('latitude') is None or geo.get('longitude') is None:
+            return None
+        # Same key as the website used to dedupe markers with
+        key = (geo['latitude'], geo['longitude'])
+        if key not in node_ids:
+            node_ids[key] = len(latitudes)
+            latitudes.append(float(geo['latitude']))
+            longitudes.append(float(geo['longitude']))
+            countries.append(intern(geo.get('country')))
+            regions.append(intern(geo.get('region')))
+            cities.append(intern(geo.get('city')))
+        return node_ids[key]
+
+    for entry in entries:
+        origin = node(entry.get('origin_geo'))
+        destination = node(entry.get('destination_geo'))
+        if origin is None or destination is None:
+            continue
+        origins.append(origin)
+        destinations.append(destination)
+        pings.append(_ping(entry.get('pingTime')))
+        ping_mins.append(_ping(entry.get('pingMin')))
+        ping_p90s.append(_ping(entry.get('pingP90')))
+        samples.append(int(entry.get('samples') or 0))
+
+    string_table = '\0'.join(strings).encode('utf-8')
+    bundle = bytearray(_HEADER.pack(
+        BUNDLE_MAGIC, BUNDLE_VERSION, len(string_table), len(latitudes), len(origins), 0
+    ))
+    bundle.extend(string_table)
+    _pad(bundle)
+    for typecode, column in [('d', latitudes), ('d', longitudes), ('I', countries), ('I', regions), ('I', cities)]:
+        bundle.extend(_column(typecode, column))
+    _pad(bundle)
+    for typecode, column in [('I', origins), ('I', destinations), ('i', pings), ('i', ping_mins),
+                             ('i', ping_p90s), ('I', samples)]:
+        bundle.extend(_column(typecode, column))
+    return bytes(bundle), len(latitudes), len(origins)
+
+
+def _write(filename: str, data: bytes):
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_filename, filename)
+
+
+def _bundle_files(manifest: Dict) -> List[str]:
+    return [manifest['file']] + list(manifest.get('encodings', {}).values())
+
+
+def export_bundle(filename: str = RESULTS_FILE, out_dir: str = BUNDLE_DIR) -> Dict:
+    """Write the bundle, its precompressed copies and the manifest. Returns the manifest"""
+    bundle, node_count, edge_count = build_bundle(results_io.iter_results(filename))
+    digest = hashlib.sha256(bundle).hexdigest()
+    name = f"results-{digest[:16]}.bin"
+    os.makedirs(out_dir, exist_ok=True)
+
+    _write(os.path.join(out_dir, name), bundle)
+    encodings = {'gzip': f"{name}.gz"}
+    _write(os.path.join(out_dir, encodings['gzip']), gzip.compress(bundle, compresslevel=9, mtime=0))
+    if brotli is not None:
+        encodings['br'] = f"{name}.br"
+        _write(os.path.join(out_dir, encodings['br']), brotli.compress(bundle, quality=11))
+
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    keep = set()
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            keep.update(_bundle_files(json.load(f)))
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        pass
+    manifest = {
+        'version': BUNDLE_VERSION,
+        'file': name,
+        'encodings': encodings,
+        'sha256': digest,
+        'bytes': len(bundle),
+        'nodes': node_count,
+        'edges': edge_count,
+    }
+    _write(manifest_path, json.dumps(manifest, indent=2).encode('utf-8'))
+
+    keep.update(_bundle_files(manifest))
+    for stale in os.listdir(out_dir):
+        if stale.startswith('results-') and '.bin' in stale and stale not in keep:
+            os.remove(os.path.join(out_dir, stale))
+    return manifest
+
+
+if __name__ == '__main__':
+    out_dir = get_flag(sys.argv, '--out', BUNDLE_DIR)
+    filenames = positional(sys.argv, ('--out',))
+    filename = filenames[0] if filenames else RESULTS_FILE
+    if not os.path.exists(filename):
+        print(f"Error: {filename} not found")
+        sys.exit(1)
+    manifest = export_bundle(filename, out_dir)
+    sizes = ', '.join(
+        f"{encoding} {os.path.getsize(os.path.join(out_dir, name)):,}"
+        for encoding, name in manifest['encodings'].items()
+    )
+    print(f"Exported {manifest['nodes']:,} locations and {manifest['edges']:,} hops to "
+          f"{os.path.join(out_dir, manifest['file'])} ({manifest['bytes']:,} bytes; {sizes})")
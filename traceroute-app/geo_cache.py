@@ -0,0 +1,151 @@
+"""
+Persistent geolocation cache shared across ip-geoloc.py runs.
+
+Lookups are kept in a SQLite table keyed by the IPv4 address as an integer, with a TTL for
+successful lookups and a shorter one for failed lookups (negative caching). The table is
+bounded to GEO_CACHE_MAX_ENTRIES, evicting the least recently used rows. Router interfaces
+in the same /24 usually sit in the same place, so lookup_prefix can answer from a neighbour.
+"""
+
+import json
+import sqlite3
+import time
+from typing import Dict, Optional, Tuple
+
+GEO_CACHE_FILE = "geo_cache.db"
+GEO_CACHE_TTL_DAYS = 30
+NEGATIVE_CACHE_TTL_DAYS = 1
+GEO_CACHE_MAX_ENTRIES = 500_000
+COMMIT_EVERY = 100
+
+_SECONDS_PER_DAY = 86400
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS geo (
+    ip INTEGER PRIMARY KEY,
+    geo TEXT,
+    fetched_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS geo_last_used ON geo (last_used);
+"""
+
+
+def ip_to_int(ip: str) -> Optional[int]:
+    """Convert a dotted IPv4 address to an integer, or None if it isn't one."""
+    parts = ip.split(".")
+    if len(parts) != 4:
+        return None
+    try:
+        octets = [int(part) for part in parts]
+    except ValueError:
+        return None
+    if any(octet < 0 or octet > 255 for octet in octets):
+        return None
+    return (octets[0] << 24) | (octets[1] << 16) | (octets[2] << 8) | octets[3]
+
+
+class GeoCache:
+    def __init__(
+        self,
+        filename: str = GEO_CACHE_FILE,
+        ttl_days: float = GEO_CACHE_TTL_DAYS,
+        negative_ttl_days: float = NEGATIVE_CACHE_TTL_DAYS,
+        max_entries: int = GEO_CACHE_MAX_ENTRIES,
+        clock=time.time,
+    ):
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(_SCHEMA)
+        self.ttl = ttl_days * _SECONDS_PER_DAY
+        self.negative_ttl = negative_ttl_days * _SECONDS_PER_DAY
+        self.max_entries = max_entries
+        self.clock = clock
+        self.writes = 0
+        self.stats = {"hits": 0, "negative_hits": 0, "prefix_hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+    def _is_fresh(self, geo_json: Optional[str], fetched_at: float, now: float) -> bool:
+        ttl = self.ttl if geo_json is not None else self.negative_ttl
+        return now - fetched_at < ttl
+
+    def _touch(self, ip_value: int, now: float):
+        self.connection.execute("UPDATE geo SET last_used = ? WHERE ip = ?", (now, ip_value))
+        self._maybe_commit()
+
+    def _maybe_commit(self):
+        self.writes += 1
+        if self.writes % COMMIT_EVERY == 0:
+            self.connection.commit()
+
+    def lookup(self, ip: str) -> Tuple[bool, Optional[Dict]]:
+        """Return (found, geo). A cached failed lookup is (True, None)."""
+        ip_value = ip_to_int(ip)
+        if ip_value is None:
+            return False, None
+        row = self.connection.execute("SELECT geo, fetched_at FROM geo WHERE ip = ?", (ip_value,)).fetchone()
+        now = self.clock()
+        if row is None:
+            self.stats["misses"] += 1
+            return False, None
+        geo_json, fetched_at = row
+        if not self._is_fresh(geo_json, fetched_at, now):
+            self.stats["expired"] += 1
+            return False, None
+        self._touch(ip_value, now)
+        if geo_json is None:
+            self.stats["negative_hits"] += 1
+            return True, None
+        self.stats["hits"] += 1
+        return True, json.loads(geo_json)
+
+    def lookup_prefix(self, ip: str) -> Optional[Dict]:
+        """Return a fresh successful lookup from another address in the same /24, if any."""
+        ip_value = ip_to_int(ip)
+        if ip_value is None:
+            return None
+        network = ip_value & 0xFFFFFF00
+        now = self.clock()
+        rows = self.connection.execute(
+            "SELECT geo, fetched_at FROM geo WHERE ip BETWEEN ? AND ? AND geo IS NOT NULL ORDER BY last_used DESC",
+            (network, network | 0xFF),
+        )
+        for geo_json, fetched_at in rows:
+            if self._is_fresh(geo_json, fetched_at, now):
+                self.stats["prefix_hits"] += 1
+                return json.loads(geo_json)
+        return None
+
+    def store(self, ip: str, geo: Optional[Dict]):
+        """Cache a lookup result; pass geo=None to remember a failed lookup."""
+        ip_value = ip_to_int(ip)
+        if ip_value is None:
+            return
+        now = self.clock()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO geo (ip, geo, fetched_at, last_used) VALUES (?, ?, ?, ?)",
+            (ip_value, None if geo is None else json.dumps(geo, ensure_ascii=False), now, now),
+        )
+        self._maybe_commit()
+
+    def evict(self):
+        """Drop the least recently used rows beyond max_entries."""
+        count = self.connection.execute("SELECT COUNT(*) FROM geo").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self.connection.execute(
+                "DELETE FROM geo WHERE ip IN (SELECT ip FROM geo ORDER BY last_used LIMIT ?)", (excess,)
+            )
+            self.stats["evicted"] += excess
+
+    def close(self):
+        self.evict()
+        self.connection.commit()
+        self.connection.close()
+
+    def summary(self) -> str:
+        lookups = self.stats["hits"] + self.stats["negative_hits"] + self.stats["misses"] + self.stats["expired"]
+        hit_rate = (self.stats["hits"] + self.stats["negative_hits"]) / lookups * 100 if lookups else 0.0
+        return (
+            f"Geolocation cache: {self.stats['hits']} hit(s), {self.stats['negative_hits']} negative hit(s), "
+            f"{self.stats['prefix_hits']} /24 hit(s), {self.stats['misses']} miss(es), "
+            f"{self.stats['expired']} expired, {self.stats['evicted']} evicted ({hit_rate:.1f}% hit rate)"
+        )
@@ -0,0 +1,140 @@
+"""
+Concurrent geolocation client for ipwhois-style JSON endpoints.
+
+Lookups share a pooled requests.Session, run on a thread pool, and go through a token bucket
+so the provider's quota is respected. Every request has a timeout and is retried with
+exponential backoff on connection errors, 429 and 5xx responses. The endpoint is a URL
+template, so a local stub server can stand in for ipwhois.app.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import instrumentation
+
+GEO_ENDPOINT = os.environ.get("GEO_ENDPOINT", "https://ipwhois.app/json/{ip}")
+GEO_RATE_LIMIT = 5.0  # requests per second
+GEO_BURST = 5
+GEO_TIMEOUT = 10
+GEO_RETRIES = 3
+GEO_BACKOFF_SECONDS = 1.0
+GEO_WORKERS = 8
+
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class GeoLookupError(Exception):
+    """Raised when a lookup still fails after every retry."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket: acquire() blocks until a token is available."""
+
+    def __init__(self, rate: float, capacity: int, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+def parse_geo_response(data: Dict) -> Optional[Dict]:
+    """Turn an ipwhois response into the geo dict stored in results, or None if it failed."""
+    return None if not data.get("success") else {
+        "country": data.get("country", ""),
+        "region": data.get("region", ""),
+        "city": data.get("city", ""),
+        "latitude": data.get("latitude"),
+        "longitude": data.get("longitude"),
+    }
+
+
+class GeoClient:
+    # Answers are worth keeping in the persistent geolocation cache
+    cacheable = True
+
+    def __init__(
+        self,
+        endpoint: str = GEO_ENDPOINT,
+        rate: float = GEO_RATE_LIMIT,
+        burst: int = GEO_BURST,
+        timeout: float = GEO_TIMEOUT,
+        retries: int = GEO_RETRIES,
+        workers: int = GEO_WORKERS,
+    ):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.retries = retries
+        self.workers = workers
+        self.bucket = TokenBucket(rate, burst)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def lookup(self, ip: str) -> Optional[Dict]:
+        """Look a single IP up. Returns None if the provider has no data for it,
+        raises GeoLookupError if the request kept failing."""
+        url = self.endpoint.format(ip=ip)
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                instrumentation.count("geo_retries")
+                time.sleep(GEO_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            with instrumentation.timer("geo_rate_wait"):
+                self.bucket.acquire()
+            try:
+                with instrumentation.timer("geo_request"):
+                    response = self.session.get(url, timeout=self.timeout)
+            except requests.RequestException as e:
+                last_error = e
+                continue
+            if response.status_code in _RETRY_STATUSES:
+                last_error = f"HTTP {response.status_code}"
+                continue
+            try:
+                return parse_geo_response(response.json())
+            except ValueError as e:
+                last_error = e
+                continue
+        instrumentation.count("geo_lookup_errors")
+        raise GeoLookupError(f"{ip}: {last_error}")
+
+    def lookup_many(self, ips: Iterable[str]) -> Iterator[Tuple[str, Optional[Dict], bool]]:
+        """Look up every distinct IP concurrently, yielding (ip, geo, ok) as lookups complete.
+        ok is False when the lookup failed after all retries."""
+        unique_ips = list(dict.fromkeys(ips))
+        if not unique_ips:
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.lookup, ip): ip for ip in unique_ips}
+            for future in as_completed(futures):
+                ip = futures[future]
+                try:
+                    yield ip, future.result(), True
+                except GeoLookupError as e:
+                    print(f"Error fetching geolocation for {e}")
+                    yield ip, None, False
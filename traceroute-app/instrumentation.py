@@ -0,0 +1,188 @@
+"""
+Where a run spends its time: stage timers, histograms and counters, and a report at the end.
+
+    with instrumentation.timer("parse"):
+        ...
+    instrumentation.count("clamped", clamped_count)
+
+Every timed stage keeps a histogram of how long each pass took (count, sum, min, max and
+DURATION_BUCKETS), so a thousand 50 ms traceroutes and one 50 s one look different. Timers
+and counters are thread-safe and cheap enough to leave on; they go around whole traceroutes,
+lookups and passes, not single lines.
+
+unix.py, ip-geoloc.py and analysis.py wrap their main in run_report, which adds
+
+    --metrics FILE   write a report when the run ends: Prometheus text format when FILE ends
+                     in .prom (point node exporter's textfile collector at its directory),
+                     JSON otherwise
+    --profile        run under cProfile, save the stats to <script>.prof and print the
+                     functions with the most cumulative time. Only the main thread is
+                     profiled, so use --workers 1 to see inside traceroutes and lookups
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from cli_args import get_flag
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0)  # Seconds
+METRIC_PREFIX = "traceroute"
+PROFILE_TOP = 25
+
+
+class Histogram:
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def to_dict(self) -> Dict:
+        cumulative, buckets = 0, {}
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "min": None if self.min is None else round(self.min, 6),
+            "max": None if self.max is None else round(self.max, 6),
+            "buckets": buckets,
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self.stages: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = {}
+        self.started = time.time()
+        self._started_monotonic = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def count(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self, script: str) -> Dict:
+        with self._lock:
+            return {
+                "script": script,
+                "started": round(self.started, 3),
+                "duration": round(time.perf_counter() - self._started_monotonic, 6),
+                "stages": {name: histogram.to_dict() for name, histogram in sorted(self.stages.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def to_prometheus(report: Dict) -> str:
+    """The report in the Prometheus text exposition format, labelled with the script's name"""
+    script = report["script"]
+    lines = [
+        f"# HELP {METRIC_PREFIX}_run_duration_seconds How long the last run took",
+        f"# TYPE {METRIC_PREFIX}_run_duration_seconds gauge",
+        f'{METRIC_PREFIX}_run_duration_seconds{{script="{script}"}} {report["duration"]}',
+        f"# HELP {METRIC_PREFIX}_run_timestamp_seconds When the last run started",
+        f"# TYPE {METRIC_PREFIX}_run_timestamp_seconds gauge",
+        f'{METRIC_PREFIX}_run_timestamp_seconds{{script="{script}"}} {report["started"]}',
+    ]
+    if report["stages"]:
+        name = f"{METRIC_PREFIX}_stage_duration_seconds"
+        lines += [f"# HELP {name} Time spent per pass of each stage", f"# TYPE {name} histogram"]
+        for stage, histogram in report["stages"].items():
+            labels = f'script="{script}",stage="{stage}"'
+            for bound, count in histogram["buckets"].items():
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram['sum']}")
+            lines.append(f"{name}_count{{{labels}}} {histogram['count']}")
+    for counter, value in report["counters"].items():
+        name = f"{METRIC_PREFIX}_{_metric_name(counter)}_total"
+        lines += [f"# TYPE {name} counter", f'{name}{{script="{script}"}} {value:g}']
+    return "\n".join(lines) + "\n"
+
+
+def write_report(report: Dict, filename: str):
+    """Write report atomically (the textfile collector may read at any time), as Prometheus
+    text if filename ends in .prom, JSON otherwise"""
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, "w", encoding="utf-8") as f:
+        if filename.endswith(".prom"):
+            f.write(to_prometheus(report))
+        else:
+            json.dump(report, f, indent=2)
+    os.replace(temp_filename, filename)
+
+
+metrics = Metrics()
+timer = metrics.timer
+observe = metrics.observe
+count = metrics.count
+
+_report_filename: Optional[str] = None
+_report_script = ""
+
+
+def flush_report():
+    """Write the --metrics report now, for a script about to exit without unwinding (os._exit).
+    Later calls do nothing."""
+    global _report_filename
+    if _report_filename is None:
+        return
+    filename, _report_filename = _report_filename, None
+    write_report(metrics.report(_report_script), filename)
+    print(f"Run report written to {filename}")
+
+
+@contextmanager
+def run_report(script: str, argv: List[str]) -> Iterator[Metrics]:
+    """Around a script's main: handles --metrics and --profile, see the module docstring"""
+    global _report_filename, _report_script
+    _report_filename, _report_script = get_flag(argv, "--metrics", None), script
+    profiler = cProfile.Profile() if "--profile" in argv else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield metrics
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profile_filename = f"{script}.prof"
+            profiler.dump_stats(profile_filename)
+            print(f"\nProfile saved to {profile_filename}, top {PROFILE_TOP} by cumulative time:")
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        flush_report()
@@ -1,7 +1,26 @@
+import hashlib
 import json
 import math
-import requests
-from typing import Dict, List, Optional, Tuple
+import mmap
+import os
+import time
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import compress
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from cli_args import get_flag
+from geo_cache import GeoCache
+from geo_client import GEO_ENDPOINT, GEO_RATE_LIMIT, GEO_WORKERS, GeoClient, GeoLookupError
+import instrumentation
+from offline_geo import OfflineGeoProvider
+import results_io
+from results_store import REMEASURED_FILE, load_remeasured
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 SPEED_OF_LIGHT_METERS = 299792458
 EARTH_RADIUS_METERS = 6371000
@@ -10,6 +29,19 @@ MAX_LAND_HOP_DISTANCE_KM = 3000
 PRINT_LIMIT = 10
 RESULTS_FILE = "results.json"
 GEOZONES_FILE = "geozones.json"
+JOURNAL_FILE = "results.geo.journal"
+JOURNAL_FLUSH_COUNT = 50
+JOURNAL_FLUSH_SECONDS = 30
+STATE_FILE = "results.geo.state.json"
+GEOZONE_GRID_DEGREES = 10.0
+GEOZONE_BOX_MARGIN = 1e-6  # Keeps float noise in the ray-casting intercept inside the box
+GEO_PROVIDERS = ("ipwhois", "offline")
+OFFLINE_GEO_DB_FILE = "ip-ranges.csv"
+PING_AGGREGATE_FIELDS = ("pingMin", "pingP90")  # Latency aggregates results_store exports next to pingTime
+GEO_FIELDS = (("origin", "origin_geo"), ("destination", "destination_geo"))
+DEFAULT_JOBS = 1
+CHUNKS_PER_JOB = 4  # More chunks than processes, so one slow chunk doesn't leave the others idle
+SCAN_BLOCK_BYTES = 1 << 24
 
 
 def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
@@ -27,21 +59,59 @@ def clamp_ping_time(ping_time: Optional[int], min_ping_time: float) -> Optional[
     return None if ping_time is None else max(ping_time, math.ceil(min_ping_time))
 
 
+GeoProvider = Union[GeoClient, OfflineGeoProvider]
+_geo_provider: Optional[GeoProvider] = None
+
+
+def select_geo_provider(provider: GeoProvider):
+    """Make get_geo_info use provider instead of the default ipwhois client."""
+    global _geo_provider
+    _geo_provider = provider
+
+
 def get_geo_info(ip: str) -> Optional[Dict]:
+    global _geo_provider
+    if _geo_provider is None:
+        _geo_provider = GeoClient()
     try:
-        data = requests.get(f"https://ipwhois.app/json/{ip}").json()
-        return None if not data.get("success") else {
-            "country": data.get("country", ""),
-            "region": data.get("region", ""),
-            "city": data.get("city", ""),
-            "latitude": data.get("latitude"),
-            "longitude": data.get("longitude"),
-        }
-    except Exception as e:
-        print(f"Error fetching geolocation for {ip}: {e}")
+        return _geo_provider.lookup(ip)
+    except GeoLookupError as e:
+        print(f"Error fetching geolocation for {e}")
         return None
 
 
+def resolve_ips(
+    ips: Iterable[str], geo_cache: GeoCache, client: GeoProvider, journal: "GeoJournal", prefix_fallback: bool = False
+) -> Dict[str, Optional[Dict]]:
+    """Resolve each IP from the persistent cache (optionally its /24 neighbours), and the rest
+    concurrently through client. Every answer is journaled; answers from the provider are cached."""
+    resolved: Dict[str, Optional[Dict]] = {}
+    remote_ips = []
+    if not client.cacheable:
+        ips, remote_ips = [], list(ips)
+    for ip in ips:
+        found, geo = geo_cache.lookup(ip)
+        if not found and prefix_fallback:
+            geo = geo_cache.lookup_prefix(ip)
+            found = geo is not None
+        if found:
+            resolved[ip] = geo
+            journal.record(ip, geo)
+        else:
+            remote_ips.append(ip)
+
+    if remote_ips:
+        print(f"Looking up {len(remote_ips)} IP(s) from {client.endpoint}")
+    for ip, geo, ok in client.lookup_many(remote_ips):
+        resolved[ip] = geo
+        journal.record(ip, geo)
+        if ok and client.cacheable:
+            geo_cache.store(ip, geo)
+        if len(resolved) % JOURNAL_FLUSH_COUNT == 0:
+            print(f"Resolved {len(resolved)} IP(s)")
+    return resolved
+
+
 def load_geozones() -> List[Dict]:
     """Load geozone polygons from GEOZONES_FILE (GeoJSON FeatureCollection)."""
     try:
@@ -109,97 +179,496 @@ def find_geozone_for_point(lat: float, lon: float, zones: List[Dict]) -> Optiona
             return zone.get("id"), zone.get("name")
     return None
 
-def save_results(results, filename: str = RESULTS_FILE):
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
+def _points_in_polygon(lats, lons, polygon: List[List[float]]):
+    """point_in_polygon for arrays of points at once, giving the same answer for each point."""
+    x, y = lons, lats
+    n = len(polygon)
+    if n < 3:
+        return np.zeros(len(x), dtype=bool)
+    inside = np.zeros(len(x), dtype=bool)
+    on_vertex = np.zeros(len(x), dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for i in range(n):
+            x1, y1 = polygon[i]
+            x2, y2 = polygon[(i + 1) % n]
+            on_vertex |= ((x == x1) & (y == y1)) | ((x == x2) & (y == y2))
+            inside ^= ((y1 > y) != (y2 > y)) & (x < (x2 - x1) * (y - y1) / (y2 - y1 + 1e-12) + x1)
+    return inside | on_vertex
+
+
+class GeozoneIndex:
+    """Geozones prepared once for repeated lookups: a padded bounding box per zone, a uniform
+    grid of GEOZONE_GRID_DEGREES cells listing the zones overlapping each cell, and a memo of
+    points already classified. Answers match find_geozone_for_point over the same zones."""
+
+    def __init__(self, zones: List[Dict]):
+        self.zones = [zone for zone in zones if zone.get("polygon")]
+        self.boxes: List[Tuple[float, float, float, float]] = []
+        self.grid: Dict[Tuple[int, int], List[int]] = {}
+        self.memo: Dict[Tuple[float, float], Optional[Tuple[str, str]]] = {}
+        for zone_index, zone in enumerate(self.zones):
+            lons = [vertex[0] for vertex in zone["polygon"]]
+            lats = [vertex[1] for vertex in zone["polygon"]]
+            box = (
+                min(lons) - GEOZONE_BOX_MARGIN, min(lats) - GEOZONE_BOX_MARGIN,
+                max(lons) + GEOZONE_BOX_MARGIN, max(lats) + GEOZONE_BOX_MARGIN,
+            )
+            self.boxes.append(box)
+            for cell_x in range(self._cell(box[0]), self._cell(box[2]) + 1):
+                for cell_y in range(self._cell(box[1]), self._cell(box[3]) + 1):
+                    self.grid.setdefault((cell_x, cell_y), []).append(zone_index)
+
+    def __len__(self) -> int:
+        return len(self.zones)
+
+    @staticmethod
+    def _cell(degrees: float) -> int:
+        return math.floor(degrees / GEOZONE_GRID_DEGREES)
+
+    def _zone(self, zone_index: int) -> Tuple[str, str]:
+        zone = self.zones[zone_index]
+        return zone.get("id"), zone.get("name")
+
+    def find(self, lat: float, lon: float) -> Optional[Tuple[str, str]]:
+        """Return (id, name) of the first geozone containing the point, or None."""
+        key = (lat, lon)
+        if key in self.memo:
+            return self.memo[key]
+        found = None
+        for zone_index in self.grid.get((self._cell(lon), self._cell(lat)), ()):
+            min_lon, min_lat, max_lon, max_lat = self.boxes[zone_index]
+            if min_lon <= lon <= max_lon and min_lat <= lat <= max_lat and point_in_polygon(
+                lat, lon, self.zones[zone_index]["polygon"]
+            ):
+                found = self._zone(zone_index)
+                break
+        self.memo[key] = found
+        return found
+
+    def find_many(self, points: List[Tuple[float, float]]) -> List[Optional[Tuple[str, str]]]:
+        """Classify many (lat, lon) points in one call, testing each zone against all the
+        new points in its bounding box at once when NumPy is available."""
+        pending = list(dict.fromkeys(point for point in points if point not in self.memo))
+        if pending and np is None:
+            for lat, lon in pending:
+                self.find(lat, lon)
+        elif pending:
+            lats = np.array([point[0] for point in pending], dtype=float)
+            lons = np.array([point[1] for point in pending], dtype=float)
+            unresolved = np.ones(len(pending), dtype=bool)
+            found: List[Optional[Tuple[str, str]]] = [None] * len(pending)
+            for zone_index, (min_lon, min_lat, max_lon, max_lat) in enumerate(self.boxes):
+                candidates = np.flatnonzero(
+                    unresolved & (lons >= min_lon) & (lons <= max_lon) & (lats >= min_lat) & (lats <= max_lat)
+                )
+                if len(candidates) == 0:
+                    continue
+                inside = _points_in_polygon(lats[candidates], lons[candidates], self.zones[zone_index]["polygon"])
+                for i in candidates[inside].tolist():
+                    found[i] = self._zone(zone_index)
+                unresolved[candidates[inside]] = False
+            self.memo.update(zip(pending, found))
+        return [self.memo[point] for point in points]
+
+
+Coordinates = Tuple[float, float, float, float]
+
+
+class ClampFilterStats:
+    """Counters and capped progress output shared by the serial and vectorized clamp/filter passes."""
+
+    def __init__(self):
+        self.clamped = 0
+        self.filtered = 0
+        self.bypassed = 0
+        self.updated = 0
+
+    def report(self, kind: str, count: int, message: str):
+        """Print the first PRINT_LIMIT messages of each kind"""
+        if count <= PRINT_LIMIT:
+            print(message)
+
+    def record_clamp(self, original_ping: Optional[int], clamped_ping: Optional[int], distance_km: float):
+        self.clamped += 1
+        self.report("clamped", self.clamped,
+                    f"Clamped ping {original_ping}ms -> {clamped_ping}ms (distance: {distance_km:.2f}km)")
+
+    def keep_long_hop(
+        self,
+        entry: Dict,
+        zone_origin: Optional[Tuple[str, str]],
+        zone_dest: Optional[Tuple[str, str]],
+        distance_km: float,
+    ) -> bool:
+        """Filter a long hop, unless both endpoints are within the same geozone."""
+        if zone_origin and zone_dest and zone_origin[0] == zone_dest[0]:
+            self.bypassed += 1
+            self.report(
+                "bypassed", self.bypassed,
+                f"Bypassed distance filter for hop {entry.get('origin')} -> "
+                f"{entry.get('destination')} ({distance_km:.2f}km) "
+                f"in geozone '{zone_origin[1] or zone_origin[0]}'"
+            )
+            return True
+        self.filtered += 1
+        self.report("filtered", self.filtered,
+                    f"Filtered hop {entry.get('origin')} -> {entry.get('destination')} ({distance_km:.2f}km)")
+        return False
 
 
-def process_results():
-    with open(RESULTS_FILE, "r", encoding="utf-8") as f:
-        results = json.load(f)
+def _entry_coordinates(entry: Dict) -> Optional[Coordinates]:
+    """Return (origin lat, origin lon, destination lat, destination lon) if both ends are geolocated."""
+    origin_geo = entry.get("origin_geo")
+    destination_geo = entry.get("destination_geo")
+    if not origin_geo or not destination_geo:
+        return None
+    o_lat, o_lon = origin_geo.get("latitude"), origin_geo.get("longitude")
+    d_lat, d_lon = destination_geo.get("latitude"), destination_geo.get("longitude")
+    if o_lat is None or o_lon is None or d_lat is None or d_lon is None:
+        return None
+    return o_lat, o_lon, d_lat, d_lon
 
-    geozones = load_geozones()
 
-    # Build cache and enrich in one pass
-    ip_cache: Dict[str, Dict] = {}
+def _clamp_aggregates(entry: Dict, min_ping: float):
+    """Clamp the latency aggregates too; only pingTime counts towards the clamp statistics."""
+    for field in PING_AGGREGATE_FIELDS:
+        if entry.get(field) is not None:
+            entry[field] = clamp_ping_time(entry[field], min_ping)
+
+
+def _clamp_entry(entry: Dict, distance: float, stats: ClampFilterStats):
+    """Clamp the entry's ping and latency aggregates to the physical minimum for distance."""
+    min_ping = calculate_minimum_ping_time(distance)
+    original_ping = entry.get("pingTime")
+    clamped_ping = clamp_ping_time(original_ping, min_ping)
+    if clamped_ping != original_ping:
+        entry["pingTime"] = clamped_ping
+        stats.record_clamp(original_ping, clamped_ping, distance / 1000)
+    _clamp_aggregates(entry, min_ping)
+
+
+def _clamp_and_filter_entry(
+    entry: Dict, coordinates: Coordinates, distance: float, geozones: GeozoneIndex, stats: ClampFilterStats
+) -> bool:
+    """Clamp the entry's ping to the physical minimum for distance; return False if it's filtered out."""
+    distance_km = distance / 1000
+    _clamp_entry(entry, distance, stats)
+
+    if distance_km > MAX_LAND_HOP_DISTANCE_KM:
+        o_lat, o_lon, d_lat, d_lon = coordinates
+        return stats.keep_long_hop(entry, geozones.find(o_lat, o_lon), geozones.find(d_lat, d_lon), distance_km)
+    return True
+
+
+def _clamp_and_filter_serial(results: List[Dict], geozones: GeozoneIndex, stats: ClampFilterStats) -> List[Dict]:
+    filtered_results = []
     for entry in results:
-        for ip_key, geo_key in [("origin", "origin_geo"), ("destination", "destination_geo")]:
-            ip = entry.get(ip_key)
-            if ip and ip != "unknown" and geo_key in entry and entry[geo_key]:
-                ip_cache.setdefault(ip, entry[geo_key])
+        coordinates = _entry_coordinates(entry)
+        if coordinates is not None:
+            distance = calculate_distance(*coordinates)
+            if not _clamp_and_filter_entry(entry, coordinates, distance, geozones, stats):
+                continue
+        filtered_results.append(entry)
+    return filtered_results
+
+
+def _clamp_and_filter_vectorized(results: List[Dict], geozones: GeozoneIndex, stats: ClampFilterStats) -> List[Dict]:
+    """Same as _clamp_and_filter_serial, but computes every distance, minimum ping and the long-hop
+    mask with NumPy, then only visits the entries that are clamped or too long.
+    Entries whose minimum ping or distance sits within float noise of a threshold are re-checked
+    with the scalar functions, so counters and output match the serial pass exactly."""
+    origin_geos = [entry.get("origin_geo") or {} for entry in results]
+    destination_geos = [entry.get("destination_geo") or {} for entry in results]
+    # None (missing) becomes NaN
+    lat1, lon1, lat2, lon2 = (
+        np.array([geo.get(key) for geo in geos], dtype=float)
+        for geos, key in [
+            (origin_geos, "latitude"), (origin_geos, "longitude"),
+            (destination_geos, "latitude"), (destination_geos, "longitude"),
+        ]
+    )
+    has_coordinates = ~(np.isnan(lat1) | np.isnan(lon1) | np.isnan(lat2) | np.isnan(lon2))
+    pings = np.array([entry.get("pingTime") for entry in results], dtype=float)
+    min_pings = np.array([entry.get("pingMin") for entry in results], dtype=float)
+
+    lat1, lon1, lat2, lon2 = np.radians(lat1), np.radians(lon1), np.radians(lat2), np.radians(lon2)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    distance = EARTH_RADIUS_METERS * 2 * np.arcsin(np.sqrt(a))
+    distance_km = distance / 1000
+    min_ping = (distance * SPEED_MULTIPLIER) / SPEED_OF_LIGHT_METERS * 1000
+    min_ping_ceil = np.ceil(min_ping)
+
+    clamp = has_coordinates & (pings < min_ping_ceil)  # NaN (no ping) never clamps
+    # The aggregates are never below pingMin, so they only need clamping when it does
+    clamp_aggregates = has_coordinates & (min_pings < min_ping_ceil)
+    too_long = has_coordinates & (distance_km > MAX_LAND_HOP_DISTANCE_KM)
+    # Zero distance is exact on both paths, anything else within 1e-9 of a threshold gets re-checked
+    borderline = has_coordinates & (distance > 0) & (
+        (np.abs(min_ping - np.round(min_ping)) < 1e-9) | (np.abs(distance_km - MAX_LAND_HOP_DISTANCE_KM) < 1e-9)
+    )
+
+    # Classify every long hop's endpoints in one batch
+    long_indices = np.flatnonzero(too_long & ~borderline).tolist()
+    endpoints = []
+    for i in long_indices:
+        o_lat, o_lon, d_lat, d_lon = _entry_coordinates(results[i])
+        endpoints += [(o_lat, o_lon), (d_lat, d_lon)]
+    endpoint_zones = geozones.find_many(endpoints)
+    zones = {i: (endpoint_zones[2 * n], endpoint_zones[2 * n + 1]) for n, i in enumerate(long_indices)}
+
+    keep = np.ones(len(results), dtype=bool)
+    for i in np.flatnonzero(clamp | clamp_aggregates | too_long | borderline).tolist():
+        entry = results[i]
+        coordinates = _entry_coordinates(entry)
+        if borderline[i]:
+            distance_i = calculate_distance(*coordinates)
+            keep[i] = _clamp_and_filter_entry(entry, coordinates, distance_i, geozones, stats)
+            continue
+        if clamp[i]:
+            original_ping = entry.get("pingTime")
+            entry["pingTime"] = int(min_ping_ceil[i])
+            stats.record_clamp(original_ping, entry["pingTime"], float(distance_km[i]))
+        if clamp_aggregates[i]:
+            _clamp_aggregates(entry, float(min_ping[i]))
+        if too_long[i]:
+            keep[i] = stats.keep_long_hop(entry, *zones[i], float(distance_km[i]))
+    return list(compress(results, keep.tolist()))
+
+
+def clamp_and_filter(
+    results: List[Dict], geozones: GeozoneIndex, stats: Optional[ClampFilterStats] = None
+) -> Tuple[List[Dict], ClampFilterStats]:
+    """Clamp pings to the physical minimum and drop long hops outside geozones.
+    Uses the NumPy path when NumPy is installed."""
+    stats = stats or ClampFilterStats()
+    if np is not None and results:
+        return _clamp_and_filter_vectorized(results, geozones, stats), stats
+    return _clamp_and_filter_serial(results, geozones, stats), stats
+
+
+def update_remeasured(
+    results: List[Dict], remeasured: Dict[Tuple[str, str], Dict], stats: ClampFilterStats
+) -> List[Dict]:
+    """Give the entries unix.py re-measured since it exported them their latest latency fields
+    (see results_store.load_remeasured). Returns those entries."""
+    updated = []
+    if remeasured:
+        for entry in results:
+            fields = remeasured.get((entry.get("origin", "unknown"), entry.get("destination", "")))
+            if fields is not None:
+                entry.update(fields)
+                updated.append(entry)
+    stats.updated += len(updated)
+    return updated
+
+
+def reclamp(
+    results: List[Dict], remeasured: Dict[Tuple[str, str], Dict], stats: Optional[ClampFilterStats] = None
+) -> ClampFilterStats:
+    """Update and clamp again the entries unix.py re-measured since they were processed. Their
+    endpoints haven't moved, so the distance filter would keep them again."""
+    stats = stats or ClampFilterStats()
+    for entry in update_remeasured(results, remeasured, stats):
+        coordinates = _entry_coordinates(entry)
+        if coordinates is not None:
+            _clamp_entry(entry, calculate_distance(*coordinates), stats)
+    return stats
+
+
+def save_results(results, filename: str = RESULTS_FILE, geozones: Optional[GeozoneIndex] = None):
+    """Write results atomically, keeping the file's layout. A normalized file also records each node's geozone."""
+
+    def geozone_of(lat: float, lon: float) -> Optional[str]:
+        zone = geozones.find(lat, lon)
+        return zone[0] if zone else None
+
+    results_io.save_results(results, filename, geozone_of=geozone_of if geozones is not None else None)
+
+
+def load_journal(filename: str = JOURNAL_FILE) -> Dict[str, Optional[Dict]]:
+    """Read the lookups an interrupted run saved to the journal. A torn last line is ignored."""
+    lookups: Dict[str, Optional[Dict]] = {}
+    try:
+        with open(filename, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                lookups[record["ip"]] = record["geo"]
+    except FileNotFoundError:
+        pass
+    return lookups
+
+
+class GeoJournal:
+    """Append-only checkpoint of geolocation lookups, flushed to disk every JOURNAL_FLUSH_COUNT
+    lookups or JOURNAL_FLUSH_SECONDS, whichever comes first."""
+
+    def __init__(self, filename: str = JOURNAL_FILE):
+        self.filename = filename
+        self.file = open(filename, "a", encoding="utf-8")
+        self.pending = 0
+        self.last_flush = time.monotonic()
+
+    def record(self, ip: str, geo: Optional[Dict]):
+        self.file.write(json.dumps({"ip": ip, "geo": geo}, ensure_ascii=False) + "\n")
+        self.pending += 1
+        if self.pending >= JOURNAL_FLUSH_COUNT or time.monotonic() - self.last_flush >= JOURNAL_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def _file_hash(filename: str) -> str:
+    try:
+        with open(filename, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return ""
+
+
+def _settings_hash() -> str:
+    """Hash of the constants the clamp and filter depend on."""
+    settings = [SPEED_OF_LIGHT_METERS, EARTH_RADIUS_METERS, SPEED_MULTIPLIER, MAX_LAND_HOP_DISTANCE_KM]
+    return hashlib.sha256(json.dumps(settings).encode()).hexdigest()
+
+
+def _entry_key(entry: Dict) -> List[str]:
+    return [entry.get("origin", "unknown"), entry.get("destination", "")]
+
+
+def load_state(filename: str = STATE_FILE) -> Optional[Dict]:
+    try:
+        with open(filename, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
 
-    # Enrich with geolocation
-    for i, entry in enumerate(results):
+def save_state(processed: int, last_key: Optional[List[str]], filename: str = STATE_FILE):
+    """Record how far results have been processed (how many entries, and the last one's key),
+    and with which geozones and settings."""
+    state = {
+        "processed": processed,
+        "last_key": last_key,
+        "geozones_hash": _file_hash(GEOZONES_FILE),
+        "settings_hash": _settings_hash(),
+    }
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(temp_filename, filename)
+
+
+def _incremental_start(count: int, key_of: Callable[[int], List[str]], state: Optional[Dict]) -> int:
+    """Return the index of the first of count entries not processed yet, or 0 when everything
+    must be redone. key_of(i) is the _entry_key of entry i."""
+    if state is None:
+        return 0
+    if state.get("geozones_hash") != _file_hash(GEOZONES_FILE):
+        print(f"{GEOZONES_FILE} changed since the last run, reprocessing every entry")
+        return 0
+    if state.get("settings_hash") != _settings_hash():
+        print("Distance/ping settings changed since the last run, reprocessing every entry")
+        return 0
+    processed = state.get("processed", 0)
+    if processed > count or (processed > 0 and key_of(processed - 1) != state.get("last_key")):
+        print(f"{RESULTS_FILE} was rewritten since the last run, reprocessing every entry")
+        return 0
+    return processed
+
+
+def _collect_geo(
+    results: List[Dict], ip_cache: Dict[str, Dict], pending_ips: Optional[Dict[str, None]] = None
+):
+    """Add the geolocation results already hold to ip_cache (the first one seen per IP wins), and
+    the IPs that still have to be looked up to pending_ips, in order."""
+    for entry in results:
+        for ip_key, geo_key in GEO_FIELDS:
+            ip = entry.get(ip_key)
+            if ip and ip != "unknown":
+                if geo_key not in entry:
+                    if pending_ips is not None:
+                        pending_ips[ip] = None
+                elif entry[geo_key]:
+                    ip_cache.setdefault(ip, entry[geo_key])
+
+
+def _resolve_pending(
+    pending_ips: Dict[str, None], ip_cache: Dict[str, Dict], client: Optional[GeoProvider], prefix_fallback: bool
+) -> GeoCache:
+    """Resume from the journal of an interrupted run, then look up the pending IPs ip_cache doesn't
+    have yet and add them to it. Returns the (closed) GeoCache for its statistics."""
+    journaled = load_journal()
+    if journaled:
+        print(f"Resuming with {len(journaled)} lookup(s) from {JOURNAL_FILE}")
+        for ip, geo in journaled.items():
+            ip_cache.setdefault(ip, geo)
+    for ip in [ip for ip in pending_ips if ip in ip_cache]:
+        del pending_ips[ip]
+
+    if client is None:
+        client = _geo_provider or GeoClient()
+    journal = GeoJournal()
+    geo_cache = GeoCache()
+    try:
+        with instrumentation.timer("geolocate"):
+            ip_cache.update(resolve_ips(pending_ips, geo_cache, client, journal, prefix_fallback))
+    finally:
+        journal.close()
+        geo_cache.close()
+        client.close()
+    for name, value in geo_cache.stats.items():
+        instrumentation.count(f"geo_cache_{name}", value)
+    instrumentation.count("ips_resolved", len(pending_ips))
+    return geo_cache
+
+
+def _enrich(results: List[Dict], ip_cache: Dict[str, Dict]) -> int:
+    """Fill in the geolocation results are missing from ip_cache. Returns how many entries changed"""
+    enriched_count = 0
+    for entry in results:
         updated = False
-        for ip_key, geo_key in [("origin", "origin_geo"), ("destination", "destination_geo")]:
+        for ip_key, geo_key in GEO_FIELDS:
             ip = entry.get(ip_key)
             if ip and ip != "unknown" and geo_key not in entry:
-                if ip not in ip_cache:
-                    ip_cache[ip] = get_geo_info(ip)
                 entry[geo_key] = ip_cache[ip]
                 updated = True
         if updated:
-            save_results(results)
-            print(f"Saved progress: entry {i + 1}/{len(results)}")
-
-    # Clamp and filter in one pass
-    clamped_count = 0
-    filtered_results = []
-    filtered_count = 0
-    bypass_count = 0
-
-    for entry in results:
-        origin_geo = entry.get("origin_geo")
-        destination_geo = entry.get("destination_geo")
-
-        if origin_geo and destination_geo:
-            o_lat, o_lon = origin_geo.get("latitude"), origin_geo.get("longitude")
-            d_lat, d_lon = destination_geo.get("latitude"), destination_geo.get("longitude")
-
-            if o_lat is not None and o_lon is not None and d_lat is not None and d_lon is not None:
-                distance = calculate_distance(o_lat, o_lon, d_lat, d_lon)
-                distance_km = distance / 1000
-
-                # Clamp ping time
-                min_ping = calculate_minimum_ping_time(distance)
-                original_ping = entry.get("pingTime")
-                clamped_ping = clamp_ping_time(original_ping, min_ping)
-                if clamped_ping != original_ping:
-                    entry["pingTime"] = clamped_ping
-                    clamped_count += 1
-                    if clamped_count <= PRINT_LIMIT:
-                        print(
-                            f"Clamped ping {original_ping}ms -> {clamped_ping}ms "
-                            f"(distance: {distance_km:.2f}km)"
-                        )
-
-                # Filter long hops, unless both endpoints are within the same geozone
-                if distance_km > MAX_LAND_HOP_DISTANCE_KM:
-                    zone_origin = find_geozone_for_point(o_lat, o_lon, geozones)
-                    zone_dest = find_geozone_for_point(d_lat, d_lon, geozones)
-
-                    if zone_origin and zone_dest and zone_origin[0] == zone_dest[0]:
-                        bypass_count += 1
-                        if bypass_count <= PRINT_LIMIT:
-                            print(
-                                f"Bypassed distance filter for hop {entry.get('origin')} -> "
-                                f"{entry.get('destination')} ({distance_km:.2f}km) "
-                                f"in geozone '{zone_origin[1] or zone_origin[0]}'"
-                            )
-                    else:
-                        filtered_count += 1
-                        if filtered_count <= PRINT_LIMIT:
-                            print(
-                                f"Filtered hop {entry.get('origin')} -> "
-                                f"{entry.get('destination')} ({distance_km:.2f}km)"
-                            )
-                        continue
-
-        filtered_results.append(entry)
-
-    # Save results
-    if clamped_count > 0 or filtered_count > 0 or bypass_count > 0:
-        save_results(filtered_results)
+            enriched_count += 1
+    return enriched_count
+
+
+def _print_incremental(start: int, new_count: int, remeasured: Dict[Tuple[str, str], Dict]) -> bool:
+    """Say what an incremental run will do; False if there's nothing to do."""
+    if start > 0:
+        print(f"Incremental run: {new_count} new entries after {start} already processed")
+        if remeasured:
+            print(f"Re-clamping {len(remeasured)} re-measured entries")
+    if not new_count and not remeasured:
+        print("Nothing new to process.")
+        return False
+    return True
+
+
+def _finish(kept_count: int, enriched_count: int, clamped_count: int, filtered_count: int, bypass_count: int):
+    """Count, drop the journal and remeasured files the saved results now hold, and print the summary"""
+    instrumentation.count("entries_enriched", enriched_count)
+    instrumentation.count("clamped", clamped_count)
+    instrumentation.count("filtered", filtered_count)
+    instrumentation.count("bypassed", bypass_count)
+    for filename in (JOURNAL_FILE, REMEASURED_FILE):
+        if os.path.exists(filename):
+            os.remove(filename)
     if clamped_count > PRINT_LIMIT:
         print(f"... and {clamped_count - PRINT_LIMIT} more clamped")
     if filtered_count > 0:
@@ -209,11 +678,285 @@ def process_results():
     if bypass_count > 0:
         print(f"Bypassed distance limit for {bypass_count} hop(s) inside a geozone")
 
-    print(f"\nProcessed {len(filtered_results)} entries.")
+    print(f"\nProcessed {kept_count} entries.")
     if clamped_count > 0:
         print(f"Clamped {clamped_count} ping times.")
     print(f"Updated {RESULTS_FILE}")
 
 
+def _can_split(filename: str) -> bool:
+    """Whether filename can be processed in chunks: compact flat, and written back the same way"""
+    return not results_io.PRETTY and results_io.is_line_per_entry(filename)
+
+
+def _skip_lines(mm: mmap.mmap, position: int, end: int, lines: float) -> Tuple[int, int]:
+    """Move past up to lines newlines from position, stopping at end. Returns the new position
+    and how many newlines were passed; counts a block at a time, only the last one line by line."""
+    skipped = 0
+    while position < end and skipped < lines:
+        block = mm[position:min(end, position + SCAN_BLOCK_BYTES)]
+        newlines = block.count(b"\n")
+        if skipped + newlines < lines:
+            skipped += newlines
+            position += len(block)
+            continue
+        offset = -1
+        for _ in range(int(lines) - skipped):
+            offset = block.find(b"\n", offset + 1)
+        return position + offset + 1, int(lines)
+    return position, skipped
+
+
+def _line_start(mm: mmap.mmap, position: int, end: int) -> int:
+    """The start of the first line at or after position"""
+    newline = mm.find(b"\n", position - 1, end)
+    return end if newline < 0 else newline + 1
+
+
+def _entry_lines(data: bytes) -> bytes:
+    """Whole lines of a compact flat file, without the comma and newline after the last"""
+    return data.rstrip().rstrip(b",")
+
+
+def _decode_lines(data: bytes) -> List[Dict]:
+    lines = _entry_lines(data)
+    return results_io.decode(b"[" + lines + b"]") if lines else []
+
+
+def _last_key(lines: bytes) -> Optional[List[str]]:
+    return _entry_key(results_io.decode(lines[lines.rfind(b"\n") + 1:])) if lines else None
+
+
+def _split_chunks(mm: mmap.mmap, start: int, end: int, split: int, count: int) -> List[Tuple[int, int, bool]]:
+    """Cut the lines between start and end into about count (start, end, new) byte ranges of
+    whole lines, with a cut at split: ranges from split on hold the new entries."""
+    step = max(1, -(-(end - start) // count))
+    cuts = {start, split, end}
+    cuts.update(_line_start(mm, position, end) for position in range(start + step, end, step))
+    cuts = sorted(cuts)
+    return [(a, b, a >= split) for a, b in zip(cuts, cuts[1:]) if a < b]
+
+
+class _ChunkStats(ClampFilterStats):
+    """ClampFilterStats of one chunk: keeps the messages instead of printing them, for the main
+    process to print in order once it knows how many earlier chunks reported"""
+
+    def __init__(self):
+        super().__init__()
+        self.messages: List[Tuple[str, int, str]] = []
+
+    def report(self, kind: str, count: int, message: str):
+        if count <= PRINT_LIMIT:
+            self.messages.append((kind, count, message))
+
+
+_worker: Dict = {}
+
+
+def _init_worker(filename: str, zones: Optional[List[Dict]] = None, ip_cache: Optional[Dict[str, Dict]] = None,
+                 remeasured: Optional[Dict[Tuple[str, str], Dict]] = None):
+    """Map the results file and build the geozone index once per worker process"""
+    with open(filename, "rb") as f:
+        _worker["mmap"] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    _worker["geozones"] = GeozoneIndex(zones or [])
+    _worker["ip_cache"] = ip_cache
+    _worker["remeasured"] = remeasured
+
+
+def _scan_chunk(chunk: Tuple[int, int, bool]) -> Tuple[Dict[str, Dict], List[str]]:
+    """The geolocation a chunk's entries hold, and the IPs of its new entries missing it"""
+    start, end, new = chunk
+    ip_cache: Dict[str, Dict] = {}
+    pending_ips: Dict[str, None] = {}
+    _collect_geo(_decode_lines(_worker["mmap"][start:end]), ip_cache, pending_ips if new else None)
+    return ip_cache, list(pending_ips)
+
+
+def _process_chunk(chunk: Tuple[int, int, bool]) -> Dict:
+    """Enrich, clamp and filter a chunk of new entries, or re-clamp the re-measured ones in a
+    chunk already processed. Returns the kept entries as lines, their count and last key,
+    the counters and the messages to print."""
+    start, end, new = chunk
+    data = _worker["mmap"][start:end]
+    stats = _ChunkStats()
+    remeasured = _worker["remeasured"]
+    enriched_count = 0
+    if not new and not remeasured:
+        lines = _entry_lines(data)
+        kept_count = lines.count(b"\n") + 1 if lines else 0
+    else:
+        results = _decode_lines(data)
+        if new:
+            update_remeasured(results, remeasured, stats)
+            enriched_count = _enrich(results, _worker["ip_cache"])
+            results, _ = clamp_and_filter(results, _worker["geozones"], stats)
+        else:
+            reclamp(results, remeasured, stats)
+        lines = b",\n".join(results_io.encode_entry(entry) for entry in results)
+        kept_count = len(results)
+    return {
+        "lines": lines, "kept": kept_count, "last_key": _last_key(lines), "new": new, "enriched": enriched_count,
+        "clamped": stats.clamped, "filtered": stats.filtered, "bypassed": stats.bypassed, "updated": stats.updated,
+        "messages": stats.messages,
+    }
+
+
+def _process_results_parallel(prefix_fallback: bool, client: Optional[GeoProvider], full: bool, jobs: int):
+    """process_results over byte ranges of the memory-mapped RESULTS_FILE in jobs processes.
+    Output, counters and messages match the single process run; entries already processed
+    and not re-measured are copied as they are."""
+    with open(RESULTS_FILE, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        with instrumentation.timer("load"):
+            # Entries sit one per line between the "[" line and the "]" line
+            body_start, body_end = mm.find(b"\n") + 1, mm.rfind(b"\n]") + 1
+            count = _skip_lines(mm, body_start, body_end, math.inf)[1]
+
+            def key_of(i: int) -> List[str]:
+                offset = _skip_lines(mm, body_start, body_end, i)[0]
+                return _entry_key(results_io.decode(_entry_lines(mm[offset:mm.find(b"\n", offset)])))
+
+            start = 0 if full else _incremental_start(count, key_of, load_state())
+            split = _skip_lines(mm, body_start, body_end, start)[0]
+        remeasured = load_remeasured(REMEASURED_FILE)
+        if not _print_incremental(start, count - start, remeasured):
+            return
+        chunks = _split_chunks(mm, body_start, body_end, split, jobs * CHUNKS_PER_JOB)
+
+        with instrumentation.timer("geozone_index"):
+            zones = load_geozones()
+
+        ip_cache: Dict[str, Dict] = {}
+        pending_ips: Dict[str, None] = {}
+        with instrumentation.timer("scan"):
+            with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(RESULTS_FILE,)) as pool:
+                for chunk_cache, chunk_pending in pool.map(_scan_chunk, chunks):
+                    for ip, geo in chunk_cache.items():
+                        ip_cache.setdefault(ip, geo)
+                    pending_ips.update(dict.fromkeys(chunk_pending))
+        geo_cache = _resolve_pending(pending_ips, ip_cache, client, prefix_fallback)
+
+        # Write the kept entries to a temp file as chunks finish, in order
+        totals = dict.fromkeys(("kept", "enriched", "clamped", "filtered", "bypassed", "updated"), 0)
+        last_key, replay = None, []
+        temp_filename = f"{RESULTS_FILE}.tmp"
+        with instrumentation.timer("clamp_filter"), open(temp_filename, "wb") as out:
+            initargs = (RESULTS_FILE, zones, ip_cache, remeasured)
+            with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=initargs) as pool:
+                out.write(b"[\n")
+                for outcome in pool.map(_process_chunk, chunks):
+                    if outcome["lines"]:
+                        out.write(b",\n" + outcome["lines"] if totals["kept"] else outcome["lines"])
+                        last_key = outcome["last_key"]
+                    counts = {kind: outcome[kind] for kind in ("clamped", "filtered", "bypassed")}
+                    replay.append((outcome["new"], counts, outcome["messages"]))
+                    for name in totals:
+                        totals[name] += outcome[name]
+            out.write(b"\n]\n" if totals["kept"] else b"]\n")
+            out.flush()
+            os.fsync(out.fileno())
+
+    if totals["enriched"] > 0:
+        print(f"Enriched {totals['enriched']} entries ({len(pending_ips)} IP(s) resolved)")
+        print(geo_cache.summary())
+    # Print the messages the single process run would: numbered across chunks, and separately
+    # for re-clamps and new entries as it keeps separate stats for them
+    reported: Dict[Tuple[bool, str], int] = {}
+    for new, counts, chunk_messages in replay:
+        for kind, number, message in chunk_messages:
+            if reported.get((new, kind), 0) + number <= PRINT_LIMIT:
+                print(message)
+        for kind, value in counts.items():
+            reported[new, kind] = reported.get((new, kind), 0) + value
+
+    with instrumentation.timer("save"):
+        if any(totals[name] > 0 for name in ("enriched", "clamped", "filtered", "bypassed", "updated")):
+            os.replace(temp_filename, RESULTS_FILE)
+        else:
+            os.remove(temp_filename)
+        save_state(totals["kept"], last_key)
+    _finish(totals["kept"], totals["enriched"], totals["clamped"], totals["filtered"], totals["bypassed"])
+
+
+def process_results(
+    prefix_fallback: bool = False, client: Optional[GeoProvider] = None, full: bool = False, jobs: int = DEFAULT_JOBS
+):
+    """Geolocate, clamp and filter the entries added to RESULTS_FILE since the last run
+    (every entry with full=True, or when geozones or settings changed). With jobs > 1 a
+    compact flat file is split into chunks processed by that many processes."""
+    if jobs > 1:
+        if _can_split(RESULTS_FILE):
+            return _process_results_parallel(prefix_fallback, client, full, jobs)
+        print(f"--jobs needs {RESULTS_FILE} in the compact flat layout (see results_io.py), using one process")
+
+    with instrumentation.timer("load"):
+        results = results_io.load_results(RESULTS_FILE)
+
+    start = 0 if full else _incremental_start(len(results), lambda i: _entry_key(results[i]), load_state())
+    processed_results, results = results[:start], results[start:]
+    # Entries re-measured since unix.py exported them get their latest latency, and the ones
+    # already processed need clamping again
+    remeasured = load_remeasured(REMEASURED_FILE)
+    if not _print_incremental(start, len(results), remeasured):
+        return
+
+    with instrumentation.timer("geozone_index"):
+        geozones = GeozoneIndex(load_geozones())
+
+    # Collect the geolocation entries already hold and the distinct IPs still missing it,
+    # then resolve those all at once
+    ip_cache: Dict[str, Dict] = {}
+    pending_ips: Dict[str, None] = {}
+    _collect_geo(processed_results, ip_cache)
+    _collect_geo(results, ip_cache, pending_ips)
+    geo_cache = _resolve_pending(pending_ips, ip_cache, client, prefix_fallback)
+
+    enriched_count = _enrich(results, ip_cache)
+    if enriched_count > 0:
+        print(f"Enriched {enriched_count} entries ({len(pending_ips)} IP(s) resolved)")
+        print(geo_cache.summary())
+
+    # Clamp and filter in one pass
+    with instrumentation.timer("clamp_filter"):
+        reclamp_stats = reclamp(processed_results, remeasured)
+        update_remeasured(results, remeasured, reclamp_stats)
+        filtered_results, stats = clamp_and_filter(results, geozones)
+    clamped_count, filtered_count, bypass_count = stats.clamped + reclamp_stats.clamped, stats.filtered, stats.bypassed
+    updated_count = reclamp_stats.updated
+
+    # Save results once, then drop the journal whose lookups they now hold
+    filtered_results = processed_results + filtered_results
+    with instrumentation.timer("save"):
+        if updated_count > 0 or enriched_count > 0 or clamped_count > 0 or filtered_count > 0 or bypass_count > 0:
+            save_results(filtered_results, geozones=geozones)
+        save_state(len(filtered_results), _entry_key(filtered_results[-1]) if filtered_results else None)
+    _finish(len(filtered_results), enriched_count, clamped_count, filtered_count, bypass_count)
+
+
 if __name__ == "__main__":
-    process_results()
+    provider = get_flag(sys.argv, "--provider", "ipwhois")
+    if provider not in GEO_PROVIDERS:
+        print(f"Unknown provider '{provider}', expected one of: {', '.join(GEO_PROVIDERS)}")
+        sys.exit(1)
+    with instrumentation.run_report("ip-geoloc", sys.argv):
+        if provider == "offline":
+            geo_db = get_flag(sys.argv, "--geo-db", OFFLINE_GEO_DB_FILE)
+            try:
+                with instrumentation.timer("geo_db_load"):
+                    client = OfflineGeoProvider(geo_db)
+            except FileNotFoundError:
+                print(f"Offline geolocation database '{geo_db}' not found")
+                sys.exit(1)
+            print(f"Using offline geolocation database {geo_db} ({len(client.database):,} ranges)")
+        else:
+            client = GeoClient(
+                endpoint=get_flag(sys.argv, "--endpoint", GEO_ENDPOINT),
+                rate=get_flag(sys.argv, "--rate", GEO_RATE_LIMIT, float),
+                workers=max(1, get_flag(sys.argv, "--workers", GEO_WORKERS, int)),
+            )
+        select_geo_provider(client)
+        process_results(
+            prefix_fallback="--prefix-fallback" in sys.argv,
+            client=client,
+            full="--full" in sys.argv,
+            jobs=max(1, get_flag(sys.argv, "--jobs", DEFAULT_JOBS, int)),
+        )
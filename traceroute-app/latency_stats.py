@@ -0,0 +1,101 @@
+"""
+Per-edge latency aggregates: sample count, min, max, sum and a small quantile sketch.
+
+The sketch is a fixed-size histogram with logarithmic buckets (each one GAMMA times wider
+than the previous), so any quantile is within about half a bucket (~7%) of the exact value,
+two sketches merge by adding their counts, and an edge never costs more than
+SKETCH_BUCKETS counters no matter how many times it's measured.
+"""
+
+import math
+from array import array
+from typing import Dict, Optional
+
+SKETCH_BUCKETS = 64
+SKETCH_GAMMA = 1.15  # bucket i >= 1 holds [GAMMA^(i-1), GAMMA^i) ms, bucket 0 holds 0ms
+
+_LOG_GAMMA = math.log(SKETCH_GAMMA)
+
+
+def _bucket(ping: int) -> int:
+    if ping <= 0:
+        return 0
+    return min(SKETCH_BUCKETS - 1, 1 + int(math.log(ping) / _LOG_GAMMA))
+
+
+def _bucket_value(bucket: int) -> float:
+    """Geometric midpoint of a bucket"""
+    return 0.0 if bucket == 0 else SKETCH_GAMMA ** (bucket - 0.5)
+
+
+class EdgeStats:
+    def __init__(self, samples: int = 0, minimum: int = 0, maximum: int = 0, total: int = 0,
+                 buckets: Optional[array] = None):
+        self.samples = samples
+        self.min = minimum
+        self.max = maximum
+        self.total = total
+        self.buckets = buckets if buckets is not None else array('I', bytes(4 * SKETCH_BUCKETS))
+
+    def add(self, ping: int):
+        ping = max(0, int(ping))
+        if self.samples == 0:
+            self.min = self.max = ping
+        else:
+            self.min = min(self.min, ping)
+            self.max = max(self.max, ping)
+        self.samples += 1
+        self.total += ping
+        self.buckets[_bucket(ping)] += 1
+
+    def merge(self, other: 'EdgeStats'):
+        if other.samples == 0:
+            return
+        if self.samples == 0:
+            self.min, self.max = other.min, other.max
+        else:
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        self.samples += other.samples
+        self.total += other.total
+        for i, count in enumerate(other.buckets):
+            self.buckets[i] += count
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.samples if self.samples else None
+
+    def quantile(self, q: float) -> Optional[int]:
+        """Nearest-rank quantile, estimated from the sketch and kept within [min, max]"""
+        if self.samples == 0:
+            return None
+        rank = max(1, math.ceil(q * self.samples))
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(self.max, max(self.min, round(_bucket_value(bucket))))
+        return self.max
+
+    def to_blob(self) -> bytes:
+        """The bucket counts, without trailing empty buckets"""
+        end = len(self.buckets)
+        while end > 0 and self.buckets[end - 1] == 0:
+            end -= 1
+        return self.buckets[:end].tobytes()
+
+    @classmethod
+    def from_row(cls, samples: int, minimum: int, maximum: int, total: int, blob: bytes) -> 'EdgeStats':
+        buckets = array('I')
+        buckets.frombytes(blob)
+        buckets.extend([0] * (SKETCH_BUCKETS - len(buckets)))
+        return cls(samples, minimum, maximum, total, buckets)
+
+    def summary(self) -> Dict[str, Optional[int]]:
+        """The fields exported to results.json: median as pingTime, plus min, p90 and sample count"""
+        return {
+            'pingTime': self.quantile(0.5),
+            'pingMin': self.min if self.samples else None,
+            'pingP90': self.quantile(0.9),
+            'samples': self.samples,
+        }
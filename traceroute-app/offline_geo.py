@@ -0,0 +1,198 @@
+"""
+Offline IP-range geolocation, as an alternative to querying ipwhois.app.
+
+Loads a CSV of IPv4 ranges (start, end, country, region, city, latitude, longitude) into
+sorted uint32 arrays, with country/region/city interned into a string table. Lookups are
+binary searches; lookup_many does them all at once with NumPy when it's installed.
+The parsed arrays are cached in a binary index next to the CSV, so later runs skip parsing.
+"""
+
+import csv
+import os
+import struct
+from array import array
+from bisect import bisect_right
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from geo_cache import ip_to_int
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+INDEX_MAGIC = b"WWMGEO1\n"
+# CSV size, CSV mtime (ns), range count, string count, string table size in bytes
+_INDEX_HEADER = struct.Struct("<QqIII")
+_UINT32_COLUMNS = ("starts", "ends", "countries", "regions", "cities")
+_FLOAT_COLUMNS = ("latitudes", "longitudes")
+
+
+def _parse_ip(value: str) -> Optional[int]:
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    return ip_to_int(value)
+
+
+class OfflineGeoDatabase:
+    def __init__(self):
+        self.starts = array("I")
+        self.ends = array("I")
+        self.countries = array("I")
+        self.regions = array("I")
+        self.cities = array("I")
+        self.latitudes = array("d")
+        self.longitudes = array("d")
+        self.strings: List[str] = []
+        self._np_starts = None
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @classmethod
+    def from_csv(cls, filename: str) -> "OfflineGeoDatabase":
+        """Parse a range CSV. A header row and rows with unparseable addresses are skipped."""
+        rows: List[Tuple[int, int, str, str, str, float, float]] = []
+        with open(filename, "r", encoding="utf-8", newline="") as f:
+            for row in csv.reader(f):
+                if len(row) < 7:
+                    continue
+                start, end = _parse_ip(row[0]), _parse_ip(row[1])
+                if start is None or end is None:
+                    continue
+                try:
+                    latitude, longitude = float(row[5]), float(row[6])
+                except ValueError:
+                    continue
+                rows.append((start, end, row[2], row[3], row[4], latitude, longitude))
+        rows.sort()
+
+        db = cls()
+        interned: Dict[str, int] = {}
+
+        def intern(value: str) -> int:
+            if value not in interned:
+                interned[value] = len(db.strings)
+                db.strings.append(value)
+            return interned[value]
+
+        for start, end, country, region, city, latitude, longitude in rows:
+            db.starts.append(start)
+            db.ends.append(end)
+            db.countries.append(intern(country))
+            db.regions.append(intern(region))
+            db.cities.append(intern(city))
+            db.latitudes.append(latitude)
+            db.longitudes.append(longitude)
+        return db
+
+    def save_index(self, filename: str, csv_filename: str):
+        """Write the arrays and string table to a binary index tagged with the CSV's size and mtime."""
+        stat = os.stat(csv_filename)
+        string_table = "\0".join(self.strings).encode("utf-8")
+        temp_filename = f"{filename}.tmp"
+        with open(temp_filename, "wb") as f:
+            f.write(INDEX_MAGIC)
+            f.write(
+                _INDEX_HEADER.pack(stat.st_size, stat.st_mtime_ns, len(self), len(self.strings), len(string_table))
+            )
+            for name in _UINT32_COLUMNS + _FLOAT_COLUMNS:
+                getattr(self, name).tofile(f)
+            f.write(string_table)
+        os.replace(temp_filename, filename)
+
+    @classmethod
+    def load_index(cls, filename: str, csv_filename: str) -> Optional["OfflineGeoDatabase"]:
+        """Load a binary index, or return None if it's missing, unreadable or older than the CSV."""
+        try:
+            with open(filename, "rb") as f:
+                if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                    return None
+                csv_size, csv_mtime, count, string_count, strings_size = _INDEX_HEADER.unpack(
+                    f.read(_INDEX_HEADER.size)
+                )
+                stat = os.stat(csv_filename)
+                if (csv_size, csv_mtime) != (stat.st_size, stat.st_mtime_ns):
+                    return None
+                db = cls()
+                for name in _UINT32_COLUMNS + _FLOAT_COLUMNS:
+                    getattr(db, name).fromfile(f, count)
+                string_table = f.read(strings_size)
+                if len(string_table) != strings_size:
+                    return None
+                string_table = string_table.decode("utf-8")
+        except (OSError, EOFError, ValueError, struct.error):
+            # Cut short or damaged: rebuilt from the CSV
+            return None
+        db.strings = string_table.split("\0") if string_count else []
+        return db
+
+    @classmethod
+    def load(cls, csv_filename: str, index_filename: Optional[str] = None) -> "OfflineGeoDatabase":
+        """Load from the binary index when it's up to date, otherwise parse the CSV and rebuild it."""
+        index_filename = index_filename or f"{csv_filename}.idx"
+        db = cls.load_index(index_filename, csv_filename)
+        if db is None:
+            db = cls.from_csv(csv_filename)
+            db.save_index(index_filename, csv_filename)
+        return db
+
+    def _geo(self, i: int) -> Dict:
+        return {
+            "country": self.strings[self.countries[i]],
+            "region": self.strings[self.regions[i]],
+            "city": self.strings[self.cities[i]],
+            "latitude": self.latitudes[i],
+            "longitude": self.longitudes[i],
+        }
+
+    def lookup(self, ip: str) -> Optional[Dict]:
+        """Return the geo dict of the range containing ip, or None."""
+        value = ip_to_int(ip)
+        if value is None:
+            return None
+        i = bisect_right(self.starts, value) - 1
+        if i < 0 or value > self.ends[i]:
+            return None
+        return self._geo(i)
+
+    def lookup_many(self, ips: List[str]) -> List[Optional[Dict]]:
+        """Look up a batch of IPs in one vectorized search (NumPy) or a bisect per IP."""
+        if np is None:
+            return [self.lookup(ip) for ip in ips]
+        if self._np_starts is None:
+            self._np_starts = np.frombuffer(self.starts, dtype=np.uint32)
+        values = [ip_to_int(ip) for ip in ips]
+        valid = np.array([v is not None for v in values], dtype=bool)
+        keys = np.array([v if v is not None else 0 for v in values], dtype=np.uint32)
+        positions = np.searchsorted(self._np_starts, keys, side="right") - 1
+        geos: List[Optional[Dict]] = []
+        for value, position, is_valid in zip(keys.tolist(), positions.tolist(), valid.tolist()):
+            if is_valid and position >= 0 and value <= self.ends[position]:
+                geos.append(self._geo(position))
+            else:
+                geos.append(None)
+        return geos
+
+
+class OfflineGeoProvider:
+    """Offline drop-in for GeoClient, so ip-geoloc.py can select either provider."""
+
+    # Local lookups are cheaper than the persistent cache, and shouldn't outlive the database
+    cacheable = False
+
+    def __init__(self, csv_filename: str, index_filename: Optional[str] = None):
+        self.endpoint = csv_filename
+        self.database = OfflineGeoDatabase.load(csv_filename, index_filename)
+
+    def close(self):
+        pass
+
+    def lookup(self, ip: str) -> Optional[Dict]:
+        return self.database.lookup(ip)
+
+    def lookup_many(self, ips: Iterable[str]) -> Iterator[Tuple[str, Optional[Dict], bool]]:
+        unique_ips = list(dict.fromkeys(ips))
+        for ip, geo in zip(unique_ips, self.database.lookup_many(unique_ips)):
+            yield ip, geo, True
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Publish results.json for the website as a base snapshot plus a patch per run, so a returning
+visitor downloads only what changed since the version it has cached.
+
+Each run rebuilds the last published version (the base with the patches after it applied),
+diffs results.json against it, nodes by IP and hops by (origin, destination), and writes the
+difference as the next version:
+
+    patch-<version>.json   {"format": "traceroute-results/patch", "version": 1, "from", "to",
+                            "edgeFields": ["origin", "destination", "pingTime", ...],
+                            "nodes": {"added": [[ip, geo]], "changed": [[ip, geo]], "removed": [ip]},
+                            "edges": {"added": [row], "changed": [row], "removed": [[origin, destination]]}}
+    base-<version>.json    the whole dataset in results_io's normalized layout. A new one is
+                           written (compacted) once the patches since the last one add up to
+                           COMPACT_RATIO of its size or number COMPACT_PATCHES, or with --compact
+    delta.json             the manifest: the head version, the base and the last KEEP_PATCHES
+                           patches, so visitors behind the base can still catch up
+
+A node's geo is its location, null when the lookup failed, or -1 when it wasn't looked up. An
+edge row holds the values of edgeFields, null when missing. Every file gets a gzip copy; files
+neither this manifest nor the previous one references are removed.
+
+    python3 publish_delta.py [results.json] [--out DIR] [--compact]
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import results_io
+from cli_args import get_flag, positional
+
+RESULTS_FILE = 'results.json'
+DELTA_DIR = os.path.join('..', 'website', 'public', 'data', 'delta')
+MANIFEST_FILE = 'delta.json'
+DELTA_VERSION = 1
+PATCH_FORMAT = 'traceroute-results/patch'
+COMPACT_RATIO = 0.25
+COMPACT_PATCHES = 50
+KEEP_PATCHES = 100
+NOT_LOOKED_UP = results_io.NOT_LOOKED_UP
+
+_ENDPOINT_FIELDS = ('origin', 'destination', 'origin_geo', 'destination_geo')
+
+EdgeKey = Tuple[str, str]
+
+
+def _edge_values(entry: Dict) -> Dict:
+    """An entry's fields besides its endpoints, missing and None alike (pingTime is always kept)"""
+    return {
+        field: value for field, value in entry.items()
+        if field not in _ENDPOINT_FIELDS and (value is not None or field == 'pingTime')
+    }
+
+
+class Snapshot:
+    """One version of the dataset: each node's geo by IP and each hop's fields by (origin, destination)"""
+
+    def __init__(self):
+        self.nodes: Dict[str, object] = {}
+        self.edges: Dict[EdgeKey, Dict] = {}
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Dict]) -> 'Snapshot':
+        snapshot = cls()
+        for entry in entries:
+            origin, destination = entry.get('origin', 'unknown'), entry.get('destination', '')
+            for ip, geo_key in ((origin, 'origin_geo'), (destination, 'destination_geo')):
+                if not ip or ip == 'unknown':
+                    continue
+                # As in results_io.to_normalized, the first entry with a lookup decides
+                if snapshot.nodes.get(ip, NOT_LOOKED_UP) == NOT_LOOKED_UP:
+                    snapshot.nodes[ip] = (entry[geo_key] or None) if geo_key in entry else NOT_LOOKED_UP
+            snapshot.edges[(origin, destination)] = _edge_values(entry)
+        return snapshot
+
+    def entries(self) -> Iterator[Dict]:
+        for (origin, destination), values in self.edges.items():
+            entry = {'origin': origin, 'destination': destination, **values}
+            for ip, geo_key in ((origin, 'origin_geo'), (destination, 'destination_geo')):
+                geo = self.nodes.get(ip, NOT_LOOKED_UP)
+                if geo != NOT_LOOKED_UP:
+                    entry[geo_key] = geo
+            yield entry
+
+
+def diff(previous: Snapshot, current: Snapshot, version: int) -> Dict:
+    """The patch from version (previous) to version + 1 (current)"""
+    nodes = {
+        'added': [[ip, geo] for ip, geo in current.nodes.items() if ip not in previous.nodes],
+        'changed': [[ip, geo] for ip, geo in current.nodes.items()
+                    if ip in previous.nodes and previous.nodes[ip] != geo],
+        'removed': [ip for ip in previous.nodes if ip not in current.nodes],
+    }
+    added = [key for key in current.edges if key not in previous.edges]
+    changed = [key for key, values in current.edges.items()
+               if key in previous.edges and previous.edges[key] != values]
+    edge_fields = ['origin', 'destination', 'pingTime']
+    for key in added + changed:
+        for field in current.edges[key]:
+            if field not in edge_fields:
+                edge_fields.append(field)
+
+    def row(key: EdgeKey) -> list:
+        values = current.edges[key]
+        return list(key) + [values.get(field) for field in edge_fields[2:]]
+
+    return {
+        'format': PATCH_FORMAT,
+        'version': DELTA_VERSION,
+        'from': version,
+        'to': version + 1,
+        'edgeFields': edge_fields,
+        'nodes': nodes,
+        'edges': {
+            'added': [row(key) for key in added],
+            'changed': [row(key) for key in changed],
+            'removed': [list(key) for key in previous.edges if key not in current.edges],
+        },
+    }
+
+
+def apply_patch(snapshot: Snapshot, patch: Dict):
+    """Bring snapshot from patch['from'] to patch['to'], as the website does"""
+    if patch.get('format') != PATCH_FORMAT or patch.get('version') != DELTA_VERSION:
+        raise ValueError(f"Unsupported patch format {patch.get('format')} v{patch.get('version')}")
+    for ip in patch['nodes']['removed']:
+        snapshot.nodes.pop(ip, None)
+    for ip, geo in patch['nodes']['added'] + patch['nodes']['changed']:
+        snapshot.nodes[ip] = geo
+    for origin, destination in patch['edges']['removed']:
+        snapshot.edges.pop((origin, destination), None)
+    fields = list(enumerate(patch['edgeFields']))[2:]
+    for row in patch['edges']['added'] + patch['edges']['changed']:
+        snapshot.edges[(row[0], row[1])] = {
+            field: row[i] for i, field in fields if row[i] is not None or field == 'pingTime'
+        }
+
+
+def _changes(patch: Dict) -> int:
+    return sum(len(patch[part][kind]) for part in ('nodes', 'edges') for kind in ('added', 'changed', 'removed'))
+
+
+def _write_file(out_dir: str, name: str, data: bytes) -> Dict:
+    """Write data and its gzip copy. Returns the manifest entry for them"""
+    results_io.write_atomic(os.path.join(out_dir, name), data)
+    encodings = {'gzip': f"{name}.gz"}
+    results_io.write_atomic(os.path.join(out_dir, encodings['gzip']), gzip.compress(data, compresslevel=9, mtime=0))
+    return {
+        'file': name,
+        'encodings': encodings,
+        'sha256': hashlib.sha256(data).hexdigest(),
+        'bytes': len(data),
+    }
+
+
+def _read_file(out_dir: str, entry: Dict):
+    with open(os.path.join(out_dir, entry['file']), 'rb') as f:
+        data = f.read()
+    if hashlib.sha256(data).hexdigest() != entry['sha256']:
+        raise ValueError(f"{entry['file']} doesn't match its checksum")
+    return results_io.decode(data)
+
+
+def write_base(snapshot: Snapshot, version: int, out_dir: str) -> Dict:
+    data = results_io.codec.dumps(results_io.to_normalized(list(snapshot.entries())), False)
+    base = _write_file(out_dir, f"base-{version}.json", data)
+    base['version'] = version
+    return base
+
+
+def load_manifest(out_dir: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(out_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return manifest if manifest.get('version') == DELTA_VERSION else None
+
+
+def load_published(out_dir: str, manifest: Dict) -> Snapshot:
+    """The head version of manifest, rebuilt from its base and patches"""
+    snapshot = Snapshot.from_entries(results_io.iter_normalized(_read_file(out_dir, manifest['base'])))
+    version = manifest['base']['version']
+    for patch in manifest['patches']:
+        if patch['from'] == version:
+            apply_patch(snapshot, _read_file(out_dir, patch))
+            version = patch['to']
+    if version != manifest['head']:
+        raise ValueError(f"no patches from version {version} to {manifest['head']}")
+    return snapshot
+
+
+def _published_files(manifest: Optional[Dict]) -> List[str]:
+    if manifest is None:
+        return []
+    return [name for entry in [manifest['base']] + manifest['patches']
+            for name in [entry['file']] + list(entry['encodings'].values())]
+
+
+def publish(filename: str = RESULTS_FILE, out_dir: str = DELTA_DIR, compact: bool = False) -> Tuple[Dict, Optional[Dict]]:
+    """Publish filename as the next version. Returns the manifest and the patch written,
+    None when nothing changed (or everything was republished as a base)."""
+    os.makedirs(out_dir, exist_ok=True)
+    current = Snapshot.from_entries(results_io.iter_results(filename))
+    previous_manifest = manifest = load_manifest(out_dir)
+    previous = None
+    if manifest is not None:
+        try:
+            previous = load_published(out_dir, manifest)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Could not rebuild version {manifest['head']} from {out_dir} ({e}), publishing a new base")
+
+    patch = None
+    if previous is None:
+        version = manifest['head'] + 1 if manifest is not None else 1
+        base, patches = write_base(current, version, out_dir), []
+    else:
+        version, base, patches = manifest['head'], manifest['base'], manifest['patches']
+        patch = diff(previous, current, version)
+        if _changes(patch):
+            version += 1
+            entry = _write_file(out_dir, f"patch-{version}.json", results_io.codec.dumps(patch, False))
+            entry.update({'from': version - 1, 'to': version})
+            for part in ('nodes', 'edges'):
+                entry[part] = {kind: len(patch[part][kind]) for kind in ('added', 'changed', 'removed')}
+            patches = (patches + [entry])[-KEEP_PATCHES:]
+        else:
+            patch = None
+            if not compact:
+                return manifest, None
+        since_base = [entry for entry in patches if entry['from'] >= base['version']]
+        if base['version'] != version and (
+            compact or len(since_base) >= COMPACT_PATCHES
+            or sum(entry['bytes'] for entry in since_base) > COMPACT_RATIO * base['bytes']
+        ):
+            base = write_base(current, version, out_dir)
+
+    manifest = {
+        'version': DELTA_VERSION,
+        'head': version,
+        'base': base,
+        'patches': patches,
+        'nodes': len(current.nodes),
+        'edges': len(current.edges),
+    }
+    results_io.write_atomic(os.path.join(out_dir, MANIFEST_FILE), json.dumps(manifest, indent=2).encode('utf-8'))
+
+    # Keep what the previous manifest pointed at for visitors still fetching it
+    keep = set(_published_files(manifest) + _published_files(previous_manifest))
+    for stale in os.listdir(out_dir):
+        if stale.startswith(('base-', 'patch-')) and stale not in keep:
+            os.remove(os.path.join(out_dir, stale))
+    return manifest, patch
+
+
+if __name__ == '__main__':
+    out_dir = get_flag(sys.argv, '--out', DELTA_DIR)
+    filenames = positional(sys.argv, ('--out',))
+    filename = filenames[0] if filenames else RESULTS_FILE
+    if not os.path.exists(filename):
+        print(f"Error: {filename} not found")
+        sys.exit(1)
+    previous = load_manifest(out_dir)
+    manifest, patch = publish(filename, out_dir, compact='--compact' in sys.argv)
+    if previous is not None and previous['head'] == manifest['head'] and patch is None \
+            and previous['base']['version'] == manifest['base']['version']:
+        print(f"Nothing changed since version {manifest['head']}")
+        sys.exit(0)
+    if patch is not None:
+        entry = manifest['patches'][-1]
+        counts = ', '.join(f"{count:,} {kind}" for kind, count in entry['edges'].items())
+        print(f"Published version {manifest['head']}: {entry['file']} ({entry['bytes']:,} bytes; hops {counts})")
+    if manifest['base']['version'] == manifest['head']:
+        print(f"Wrote base {manifest['base']['file']} ({manifest['base']['bytes']:,} bytes)")
+    print(f"{manifest['nodes']:,} nodes and {manifest['edges']:,} hops, "
+          f"{len(manifest['patches'])} patch(es) listed in {os.path.join(out_dir, MANIFEST_FILE)}")
@@ -0,0 +1,194 @@
+"""
+Traceroute without root or a network, for tests and benchmarks.
+
+ReplayTracer plugs into unix.py (see unix.Tracer) and serves `traceroute -I -n` output
+instead of running it: either recorded outputs, from a directory of <target>.txt files (what
+RecordingTracer writes next to a real run) or a JSON object mapping targets to outputs, or
+synthetic ones from SyntheticNetwork. Each hop line takes latency_ms to arrive, so timeouts,
+streaming and concurrency behave like they would against a real network.
+
+SyntheticNetwork makes up a deterministic path per target over a shared set of routers: a
+fixed first hop, a few access routers, a core most paths go through, then routers near the
+destination. Hops sometimes time out (* * *), and RTTs grow along the path with jitter.
+
+    python3 unix.py --synthetic [--latency MS]
+    python3 unix.py --replay recorded/ [--latency MS]
+    python3 unix.py --record recorded/
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from unix import MAX_SILENT_HOPS, Tracer
+
+DEFAULT_LATENCY_MS = 0.0
+SYNTHETIC_ROUTERS = 4096
+SILENT_HOP_CHANCE = 0.05
+
+_HOP_NUMBER_PATTERN = re.compile(r'^\s*(\d+)\s')
+_HOP_IP_PATTERN = re.compile(r'^\s*\d+\s+(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\s')
+_SILENT_PATTERN = re.compile(r'^\s*\d+\s+\*\s+\*\s+\*')
+_IPV4_PATTERN = re.compile(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$')
+
+
+def _seed(value: str) -> int:
+    return int.from_bytes(hashlib.sha1(value.encode('utf-8')).digest()[:8], 'big')
+
+
+def _address(rng: random.Random, first_octet: int) -> str:
+    return f"{first_octet}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+
+
+class SyntheticNetwork:
+    def __init__(self, routers: int = SYNTHETIC_ROUTERS, seed: int = 0,
+                 silent_hop_chance: float = SILENT_HOP_CHANCE):
+        rng = random.Random(seed)
+        self.seed = seed
+        self.silent_hop_chance = silent_hop_chance
+        self.gateway = '192.168.0.1'
+        self.access = [_address(rng, 100) for _ in range(max(4, routers // 16))]
+        self.core = [_address(rng, 62) for _ in range(max(4, routers // 64))]
+        self.edge = [_address(rng, 80) for _ in range(max(4, routers))]
+
+    def destination(self, target: str) -> str:
+        if _IPV4_PATTERN.match(target):
+            return target
+        return _address(random.Random(_seed(target)), 45)
+
+    def path(self, target: str) -> List[Tuple[Optional[str], List[float]]]:
+        """(IP, three RTTs in ms) per hop from TTL 1; IP is None for a hop that timed out"""
+        rng = random.Random(_seed(target) ^ self.seed)
+        # Core routers are Pareto-picked, so a handful carries most paths
+        routers = [self.gateway]
+        routers += rng.sample(self.access, rng.randint(1, 2))
+        routers += [self.core[min(int(rng.paretovariate(1.2)) - 1, len(self.core) - 1)]
+                    for _ in range(rng.randint(2, 4))]
+        routers += rng.sample(self.edge, rng.randint(1, 4))
+        routers.append(self.destination(target))
+
+        hops = []
+        rtt = 0.3
+        for i, ip in enumerate(routers):
+            rtt += rng.uniform(0.2, 2.0) if i < 3 else rng.expovariate(1 / 12)
+            if 0 < i < len(routers) - 1 and rng.random() < self.silent_hop_chance:
+                hops.append((None, []))
+            else:
+                hops.append((ip, [rtt + rng.uniform(0, 1.5) for _ in range(3)]))
+        return hops
+
+    def output(self, target: str) -> str:
+        lines = [f"traceroute to {target} ({self.destination(target)}), 30 hops max, 60 byte packets"]
+        for ttl, (ip, rtts) in enumerate(self.path(target), 1):
+            if ip is None:
+                lines.append(f"{ttl:2d}  * * *")
+            else:
+                lines.append(f"{ttl:2d}  {ip}  " + "  ".join(f"{rtt:.3f} ms" for rtt in rtts))
+        return '\n'.join(lines) + '\n'
+
+
+def load_recorded(path: str) -> Dict[str, str]:
+    """Recorded outputs by target, from a directory of <target>.txt files or a JSON object"""
+    if os.path.isdir(path):
+        outputs = {}
+        for name in sorted(os.listdir(path)):
+            if name.endswith('.txt'):
+                with open(os.path.join(path, name), 'r', encoding='utf-8') as f:
+                    outputs[name[:-len('.txt')]] = f.read()
+        return outputs
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class ReplayTracer(Tracer):
+    def __init__(self, outputs: Optional[Dict[str, str]] = None, network: Optional[SyntheticNetwork] = None,
+                 latency_ms: float = DEFAULT_LATENCY_MS, sleep=time.sleep):
+        self.outputs = outputs or {}
+        self.network = network
+        self.latency = latency_ms / 1000
+        self.sleep = sleep
+
+    def _lines(self, target: str) -> Optional[List[str]]:
+        if target in self.outputs:
+            output = self.outputs[target]
+        elif self.network is not None:
+            output = self.network.output(target)
+        else:
+            return None
+        return output.rstrip('\n').split('\n')
+
+    def _hops(self, target: str, first_ttl: int, max_ttl: Optional[int]):
+        """Yield the header, then each hop line in [first_ttl, max_ttl] as it 'arrives'"""
+        lines = self._lines(target)
+        for line in lines:
+            match = _HOP_NUMBER_PATTERN.match(line)
+            if match is None:
+                yield line
+                continue
+            ttl = int(match.group(1))
+            if ttl < first_ttl or (max_ttl is not None and ttl > max_ttl):
+                continue
+            if self.latency > 0:
+                self.sleep(self.latency)
+            yield line
+
+    def run(self, target: str, first_ttl: int = 1, max_ttl: Optional[int] = None) -> Tuple[List[str], List[str], int]:
+        if self._lines(target) is None:
+            return [], [f"{target}: Name or service not known"], 2
+        return list(self._hops(target, first_ttl, max_ttl)), [], 0
+
+    def stream(self, target: str, max_silent_hops: int = MAX_SILENT_HOPS,
+               first_ttl: int = 1) -> Tuple[List[str], List[str], int]:
+        """Like unix.stream_traceroute: stops at the destination or after max_silent_hops silent hops"""
+        if self._lines(target) is None:
+            return [], [f"{target}: Name or service not known"], 2
+        destination = self.network.destination(target) if self.network is not None else None
+        lines = []
+        silent_hops = 0
+        for line in self._hops(target, first_ttl, None):
+            lines.append(line)
+            if line.startswith('traceroute to '):
+                match = re.search(r'\((\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\)', line)
+                destination = match.group(1) if match else destination
+            elif _SILENT_PATTERN.match(line):
+                silent_hops += 1
+                if silent_hops >= max_silent_hops:
+                    break
+            else:
+                silent_hops = 0
+                match = _HOP_IP_PATTERN.match(line)
+                if match and match.group(1) == destination:
+                    break
+        return lines, [], 0
+
+
+class RecordingTracer(Tracer):
+    """Saves the full traces another tracer returns as <directory>/<target>.txt, for ReplayTracer"""
+
+    def __init__(self, tracer: Tracer, directory: str):
+        self.tracer = tracer
+        self.directory = directory
+        self.needs_sudo = tracer.needs_sudo
+        os.makedirs(directory, exist_ok=True)
+
+    def _save(self, target: str, stdout_lines: List[str]):
+        if stdout_lines and '/' not in target:
+            with open(os.path.join(self.directory, f"{target}.txt"), 'w', encoding='utf-8') as f:
+                f.write('\n'.join(stdout_lines).rstrip('\n') + '\n')
+
+    def run(self, target: str, first_ttl: int = 1, max_ttl: Optional[int] = None) -> Tuple[List[str], List[str], int]:
+        result = self.tracer.run(target, first_ttl=first_ttl, max_ttl=max_ttl)
+        if first_ttl == 1 and max_ttl is None:
+            self._save(target, result[0])
+        return result
+
+    def stream(self, target: str, max_silent_hops: int = MAX_SILENT_HOPS,
+               first_ttl: int = 1) -> Tuple[List[str], List[str], int]:
+        result = self.tracer.stream(target, max_silent_hops=max_silent_hops, first_ttl=first_ttl)
+        if first_ttl == 1:
+            self._save(target, result[0])
+        return result
@@ -0,0 +1,447 @@
+"""
+Shared reader/writer for results files, in either of two layouts.
+
+Flat (the original): a JSON array with one entry per hop, each carrying full origin_geo and
+destination_geo dicts, so a busy router's location is repeated in every hop that touches it.
+
+Normalized: a JSON object with three tables.
+    locations  distinct geo dicts ({country, region, city, latitude, longitude})
+    nodes      one row per IP: [ip, location, geozone]. location is an index into locations,
+               null when geolocation failed, or -1 when the IP hasn't been looked up yet
+    edges      one row per hop: the columns named in edgeFields, origin/destination being
+               indexes into nodes (origin is null when unknown)
+
+A node takes the geo of the first hop with a lookup for its IP. Hops without one (appended
+since ip-geoloc last ran) set bits in an extra notLookedUp column, 1 for the origin and 2 for
+the destination, so they load without geo as they were saved.
+
+Loading always returns flat entries, with entries sharing a node sharing the same geo dict,
+so callers work the same on both. Writers keep whatever layout the file already has.
+
+A flat file is written compact, one entry per line:
+
+    [
+    {"origin":"10.0.0.1","destination":"10.0.0.2","pingTime":3},
+    {"origin":"10.0.0.2","destination":"10.0.0.3","pingTime":null}
+    ]
+
+so results_store can still append to it in place, and readers can decode it a batch of lines
+at a time. RESULTS_PRETTY=1 writes the old json.dump(..., indent=2) layout instead; both
+are read either way.
+
+Encoding and decoding go through the fastest codec installed: msgspec, then orjson, then the
+standard library (RESULTS_CODEC=orjson|msgspec|json picks one). With msgspec, iter_endpoints
+decodes only origin and destination into structs, skipping every other field and the geo dicts.
+
+    python3 results_io.py normalize [results.json] [output]
+    python3 results_io.py flatten [results.json] [output]
+"""
+
+import gc
+import json
+import os
+import sys
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+RESULTS_FILE = "results.json"
+FLAT = "flat"
+NORMALIZED = "normalized"
+FORMAT_NAME = "traceroute-results/normalized"
+FORMAT_VERSION = 1
+CHUNK_SIZE = 1 << 20
+BATCH_LINES = 10_000  # Entries decoded per batch from a one-entry-per-line file
+PRETTY = os.environ.get("RESULTS_PRETTY", "") == "1"
+
+NOT_LOOKED_UP = -1
+NOT_LOOKED_UP_FIELD = "notLookedUp"  # Edge column flagging endpoints the hop has no lookup for
+_ENDPOINT_BITS = (("origin_geo", 1), ("destination_geo", 2))
+_MISSING = object()
+_REQUIRED_FIELDS = ("origin", "destination", "pingTime")
+_WHITESPACE = " \t\r\n"
+
+# Maps a location to its geozone id, or None outside every geozone
+GeozoneLookup = Callable[[float, float], Optional[str]]
+
+
+class Codec:
+    """loads(bytes) -> object and dumps(object, pretty) -> UTF-8 bytes; pretty is indent=2"""
+
+    def __init__(self, name: str, loads: Callable[[bytes], object], dumps: Callable[[object, bool], bytes]):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+
+
+def _json_dumps(data, pretty: bool = False) -> bytes:
+    if pretty:
+        return json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+CODECS: Dict[str, Codec] = {"json": Codec("json", json.loads, _json_dumps)}
+
+if orjson is not None:
+    def _orjson_dumps(data, pretty: bool = False) -> bytes:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else 0)
+
+    # orjson.JSONDecodeError is a json.JSONDecodeError, so callers catch it as before
+    CODECS["orjson"] = Codec("orjson", orjson.loads, _orjson_dumps)
+
+if msgspec is not None:
+    _msgspec_encoder = msgspec.json.Encoder()
+
+    class _Endpoints(msgspec.Struct):
+        origin: Optional[str] = "unknown"
+        destination: Optional[str] = ""
+
+    _endpoints_decoder = msgspec.json.Decoder(List[_Endpoints])
+
+    def _msgspec_decode(data: bytes, decode=msgspec.json.decode):
+        try:
+            return decode(data)
+        except msgspec.DecodeError as e:
+            raise json.JSONDecodeError(str(e), "", 0) from None
+
+    def _msgspec_dumps(data, pretty: bool = False) -> bytes:
+        encoded = _msgspec_encoder.encode(data)
+        return msgspec.json.format(encoded, indent=2) if pretty else encoded
+
+    CODECS["msgspec"] = Codec("msgspec", _msgspec_decode, _msgspec_dumps)
+
+    def _decode_endpoints(data: bytes) -> List[_Endpoints]:
+        return _msgspec_decode(data, _endpoints_decoder.decode)
+
+_preferred = os.environ.get("RESULTS_CODEC", "")
+codec = CODECS.get(_preferred) or next(CODECS[name] for name in ("msgspec", "orjson", "json") if name in CODECS)
+
+
+@contextmanager
+def _gc_paused():
+    """Decoding allocates a dict per entry, all of which stay alive: without pausing, the cyclic
+    garbage collector rescans them again and again while the file is decoded"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def decode(data: bytes, loads: Optional[Callable[[bytes], object]] = None):
+    with _gc_paused():
+        return (loads or codec.loads)(data)
+
+
+def _read(filename: str):
+    with open(filename, "rb") as f:
+        return decode(f.read())
+
+
+def write_atomic(filename: str, data: bytes):
+    """Write data to filename through a temp file, fsync and rename, so readers never see half of it"""
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_filename, filename)
+
+
+def encode_entry(entry: Dict) -> bytes:
+    """One entry as a line of a compact flat file (without the separating comma)"""
+    return codec.dumps(entry, False)
+
+
+def encode_flat(entries: List[Dict], pretty: bool = PRETTY) -> bytes:
+    if pretty:
+        return codec.dumps(entries, True) + b"\n"
+    if not entries:
+        return b"[\n]\n"
+    return b"[\n" + b",\n".join(codec.dumps(entry, False) for entry in entries) + b"\n]\n"
+
+
+def is_line_per_entry(filename: str) -> bool:
+    """Whether filename is a compact flat file: '[' alone on the first line, then one entry per line"""
+    try:
+        with open(filename, "rb") as f:
+            first, second = f.readline(), f.readline()
+    except FileNotFoundError:
+        return False
+    return first.strip() == b"[" and (second.startswith(b"{") or second.strip() == b"]")
+
+
+def detect_format(filename: str) -> Optional[str]:
+    """FLAT or NORMALIZED from the file's first character, None if it's missing or empty"""
+    try:
+        with open(filename, "r", encoding="utf-8") as f:
+            while True:
+                char = f.read(1)
+                if not char:
+                    return None
+                if char not in _WHITESPACE:
+                    return NORMALIZED if char == "{" else FLAT
+    except FileNotFoundError:
+        return None
+
+
+def _is_normalized(data) -> bool:
+    return isinstance(data, dict) and data.get("format") == FORMAT_NAME
+
+
+def to_normalized(entries: List[Dict], geozone_of: Optional[GeozoneLookup] = None) -> Dict:
+    """Convert flat entries to the normalized layout"""
+    locations: List[Dict] = []
+    location_ids: Dict[tuple, int] = {}
+    nodes: List[list] = []
+    node_ids: Dict[str, int] = {}
+    edge_fields = list(_REQUIRED_FIELDS)
+    for entry in entries:
+        for key in entry:
+            if key not in edge_fields and key not in ("origin_geo", "destination_geo"):
+                edge_fields.append(key)
+
+    def node_id(ip: str, entry: Dict, geo_key: str) -> Optional[int]:
+        if not ip or ip == "unknown":
+            return None
+        node = node_ids.get(ip)
+        if node is None:
+            node = node_ids[ip] = len(nodes)
+            nodes.append([ip, NOT_LOOKED_UP, None])
+        row = nodes[node]
+        if geo_key in entry and row[1] == NOT_LOOKED_UP:
+            geo = entry[geo_key]
+            if not geo:
+                row[1] = None
+            else:
+                location_key = tuple(sorted(geo.items()))
+                location = location_ids.get(location_key)
+                if location is None:
+                    location = location_ids[location_key] = len(locations)
+                    locations.append(geo)
+                row[1] = location
+                if geozone_of is not None and geo.get("latitude") is not None and geo.get("longitude") is not None:
+                    row[2] = geozone_of(geo["latitude"], geo["longitude"])
+        return node
+
+    edges = []
+    for entry in entries:
+        origin = node_id(entry.get("origin", "unknown"), entry, "origin_geo")
+        destination = node_id(entry.get("destination", ""), entry, "destination_geo")
+        edges.append([origin, destination] + [entry.get(field) for field in edge_fields[2:]])
+
+    # Flag the endpoints whose node got a lookup from another hop than this one
+    not_looked_up = []
+    for entry, row in zip(entries, edges):
+        bits = 0
+        for (geo_key, bit), node in zip(_ENDPOINT_BITS, row):
+            if node is not None and geo_key not in entry and nodes[node][1] != NOT_LOOKED_UP:
+                bits |= bit
+        not_looked_up.append(bits or None)
+    if any(not_looked_up):
+        edge_fields.append(NOT_LOOKED_UP_FIELD)
+        for row, bits in zip(edges, not_looked_up):
+            row.append(bits)
+    return {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "locations": locations,
+        "nodeFields": ["ip", "location", "geozone"],
+        "nodes": nodes,
+        "edgeFields": edge_fields,
+        "edges": edges,
+    }
+
+
+def iter_normalized(data: Dict) -> Iterator[Dict]:
+    """Yield the flat entries of normalized data one at a time"""
+    if data.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported results format version {data.get('version')}")
+    locations = data["locations"]
+    ips = [node[0] for node in data["nodes"]]
+    # Each node's geo dict, None if the lookup failed, or _MISSING to leave the key out
+    geos = [
+        _MISSING if location == NOT_LOOKED_UP else None if location is None else locations[location]
+        for _, location, _ in data["nodes"]
+    ]
+    edge_fields = data["edgeFields"]
+    fields = [(i, field) for i, field in enumerate(edge_fields) if i >= 2 and field != NOT_LOOKED_UP_FIELD]
+    marker = edge_fields.index(NOT_LOOKED_UP_FIELD) if NOT_LOOKED_UP_FIELD in edge_fields else None
+    for row in data["edges"]:
+        origin, destination = row[0], row[1]
+        entry = {
+            "origin": "unknown" if origin is None else ips[origin],
+            "destination": "" if destination is None else ips[destination],
+        }
+        for i, field in fields:
+            value = row[i]
+            if value is not None or field == "pingTime":
+                entry[field] = value
+        bits = (row[marker] or 0) if marker is not None else 0
+        if origin is not None and geos[origin] is not _MISSING and not bits & 1:
+            entry["origin_geo"] = geos[origin]
+        if destination is not None and geos[destination] is not _MISSING and not bits & 2:
+            entry["destination_geo"] = geos[destination]
+        yield entry
+
+
+def from_normalized(data: Dict) -> List[Dict]:
+    """Convert normalized data to flat entries"""
+    return list(iter_normalized(data))
+
+
+def _iter_flat(filename: str, chunk_size: int) -> Iterator[Dict]:
+    decoder = json.JSONDecoder()
+    with open(filename, "r", encoding="utf-8") as f:
+        buffer = ""
+        pos = 0
+        started = False
+        eof = False
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE + ("," if started else ""):
+                pos += 1
+            if pos >= len(buffer):
+                if eof:
+                    raise json.JSONDecodeError("Unexpected end of file", buffer, pos)
+                buffer, pos = f.read(chunk_size), 0
+                eof = not buffer
+                continue
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError(f"{filename} must contain an array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                entry, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                more = "" if eof else f.read(chunk_size)
+                if not more:
+                    raise
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+            yield entry
+            pos = end
+            if pos >= chunk_size:
+                buffer, pos = buffer[pos:], 0
+
+
+def _iter_line_batches(filename: str, batch_lines: int = BATCH_LINES) -> Iterator[bytes]:
+    """JSON arrays of up to batch_lines entries from a one-entry-per-line file"""
+    with open(filename, "rb") as f:
+        f.readline()
+        batch: List[bytes] = []
+        for line in f:
+            line = line.rstrip()
+            if line.endswith(b","):
+                line = line[:-1]
+            if not line or line == b"]":
+                continue
+            batch.append(line)
+            if len(batch) >= batch_lines:
+                yield b"[" + b",".join(batch) + b"]"
+                batch = []
+        if batch:
+            yield b"[" + b",".join(batch) + b"]"
+
+
+def iter_results(filename: str = RESULTS_FILE, chunk_size: int = CHUNK_SIZE) -> Iterator[Dict]:
+    """Yield flat entries one at a time. A flat file is parsed in chunks (batches of lines
+    when it's compact), so memory stays bounded; a normalized one is small enough to load whole."""
+    if detect_format(filename) == NORMALIZED:
+        yield from iter_normalized(_read(filename))
+    elif is_line_per_entry(filename):
+        for batch in _iter_line_batches(filename):
+            yield from decode(batch)
+    else:
+        yield from _iter_flat(filename, chunk_size)
+
+
+def iter_endpoints(filename: str = RESULTS_FILE) -> Iterator[Tuple[str, str]]:
+    """Yield (origin, destination) of every entry, "unknown" and "" when missing. Faster than
+    iter_results: with msgspec, nothing else in the entries is decoded."""
+    if detect_format(filename) == NORMALIZED:
+        data = _read(filename)
+        if data.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported results format version {data.get('version')}")
+        ips = [node[0] for node in data["nodes"]]
+        for row in data["edges"]:
+            yield ("unknown" if row[0] is None else ips[row[0]]), ("" if row[1] is None else ips[row[1]])
+    elif msgspec is not None and is_line_per_entry(filename):
+        for batch in _iter_line_batches(filename):
+            for entry in decode(batch, _decode_endpoints):
+                yield entry.origin or "unknown", entry.destination or ""
+    else:
+        for entry in iter_results(filename):
+            yield entry.get("origin", "unknown"), entry.get("destination", "")
+
+
+def load_results(filename: str = RESULTS_FILE) -> List[Dict]:
+    """Load a results file of either layout as flat entries"""
+    data = _read(filename)
+    if _is_normalized(data):
+        return from_normalized(data)
+    if not isinstance(data, list):
+        raise ValueError(f"{filename} must contain an array or normalized results")
+    return data
+
+
+def _saved_geozones(filename: str) -> GeozoneLookup:
+    """Geozone lookup answering from the node table of an existing normalized file"""
+    zones: Dict[tuple, Optional[str]] = {}
+    if detect_format(filename) == NORMALIZED:
+        data = _read(filename)
+        locations = data["locations"]
+        for _, location, geozone in data["nodes"]:
+            if location is not None and location != NOT_LOOKED_UP:
+                zones[(locations[location].get("latitude"), locations[location].get("longitude"))] = geozone
+    return lambda lat, lon: zones.get((lat, lon))
+
+
+def save_results(
+    entries: List[Dict],
+    filename: str = RESULTS_FILE,
+    layout: Optional[str] = None,
+    geozone_of: Optional[GeozoneLookup] = None,
+    pretty: bool = PRETTY,
+):
+    """Write entries atomically (temp file, fsync, rename). layout defaults to the layout
+    filename already has, or flat for a new file. Without geozone_of, a normalized file
+    keeps the geozones it already recorded."""
+    layout = layout or detect_format(filename) or FLAT
+    if layout == NORMALIZED:
+        if geozone_of is None:
+            geozone_of = _saved_geozones(filename)
+        data = codec.dumps(to_normalized(entries, geozone_of), False)
+    else:
+        data = encode_flat(entries, pretty)
+    write_atomic(filename, data)
+
+
+def main(argv: List[str]):
+    commands = {"normalize": NORMALIZED, "flatten": FLAT}
+    if len(argv) < 2 or argv[1] not in commands:
+        print("Usage: python3 results_io.py normalize|flatten [results.json] [output]")
+        sys.exit(1)
+    source = argv[2] if len(argv) > 2 else RESULTS_FILE
+    target = argv[3] if len(argv) > 3 else source
+    entries = load_results(source)
+    save_results(entries, target, layout=commands[argv[1]])
+    print(f"Wrote {len(entries):,} entries to {target} ({commands[argv[1]]}, {os.path.getsize(target):,} bytes)")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
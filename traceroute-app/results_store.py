@@ -0,0 +1,340 @@
+"""
+Append-only store for the hops collected by unix.py.
+
+Hops live in a SQLite database with a unique (origin, destination) index, so adding a run
+costs O(new hops) and a crash mid-run never leaves a half-written file behind.
+results.json is still what ip-geoloc.py and the website read: export_results appends only
+the hops it hasn't exported yet to the end of it, without rewriting what's already there
+(ip-geoloc.py adds geolocation data to those entries in place).
+
+Measuring a hop again doesn't add a row: the new RTT is merged into the hop's latency
+aggregates (see latency_stats.py), and the exported pingTime is the median. That holds within
+a run too: a hop seen twice in one batch gets both samples (it used to keep the first).
+results.json isn't rewritten for hops it already holds whose aggregates changed: the next export
+records their latest latency fields in results.json.remeasured instead, and ip-geoloc.py folds
+them into results.json as it clamps those entries again. Only a change to pingTime, pingMin or
+pingP90 counts: a sample that leaves them as they were (a route measured again at the same
+latency) isn't recorded, so the samples count in results.json can lag behind results.db.
+"""
+
+import json
+import os
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import results_io
+from latency_stats import EdgeStats
+
+STORE_FILE = 'results.db'
+RESULTS_FILE = 'results.json'
+REMEASURED_FILE = f"{RESULTS_FILE}.remeasured"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hops (
+    id INTEGER PRIMARY KEY,
+    origin TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    pingTime INTEGER,
+    UNIQUE (origin, destination)
+);
+CREATE TABLE IF NOT EXISTS edge_stats (
+    hop_id INTEGER PRIMARY KEY REFERENCES hops (id),
+    samples INTEGER NOT NULL,
+    min INTEGER NOT NULL,
+    max INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    sketch BLOB NOT NULL,
+    dirty INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS edge_stats_dirty ON edge_stats (dirty) WHERE dirty = 1;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def _format_entry(entry: Dict) -> str:
+    """Format an entry the way json.dump(..., indent=2) lays it out inside the results array,
+    for a results.json written with RESULTS_PRETTY=1 (see results_io)"""
+    return '\n'.join('  ' + line for line in json.dumps(entry, indent=2, ensure_ascii=False).split('\n'))
+
+
+def _latency(stats: Optional[EdgeStats], ping: Optional[int]) -> Tuple:
+    """The exported fields a re-measurement has to change to be recorded (see _export_remeasured)"""
+    if stats is None:
+        return ping, None, None
+    summary = stats.summary()
+    return summary['pingTime'], summary['pingMin'], summary['pingP90']
+
+
+def _entry(origin: str, destination: str, ping: Optional[int], stats: Optional[Tuple]) -> Dict:
+    """Build a results entry, with the latency aggregates when the hop has any"""
+    if stats is None or stats[0] is None:
+        return {'origin': origin, 'destination': destination, 'pingTime': ping}
+    return {'origin': origin, 'destination': destination, **EdgeStats.from_row(*stats).summary()}
+
+
+def load_remeasured(filename: str = REMEASURED_FILE) -> Dict[Tuple[str, str], Dict]:
+    """The latest latency fields of the results.json entries re-measured since ip-geoloc.py last ran,
+    by (origin, destination)"""
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    remeasured = {}
+    for item in data:
+        if isinstance(item, list):
+            # Written before the fields were recorded: only the key
+            remeasured[tuple(item)] = {}
+        else:
+            fields = dict(item)
+            remeasured[(fields.pop('origin'), fields.pop('destination'))] = fields
+    return remeasured
+
+
+def _tail(f, size: int, length: int = 64) -> Tuple[int, bytes]:
+    """Return (offset, bytes) of the last length bytes of an open binary file"""
+    offset = max(0, size - length)
+    f.seek(offset)
+    return offset, f.read()
+
+
+class ResultsStore:
+    def __init__(self, filename: str = STORE_FILE):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=FULL')
+        self.connection.executescript(_SCHEMA)
+
+    def __enter__(self) -> 'ResultsStore':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key: str, value: Optional[str]):
+        if value is None:
+            self.connection.execute('DELETE FROM meta WHERE key = ?', (key,))
+        else:
+            self.connection.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM hops').fetchone()[0]
+
+    def add(self, entries: Iterable[Dict], checkpoint: Optional[Tuple[str, int]] = None) -> Tuple[int, int]:
+        """Add entries. An (origin, destination) pair already stored gets the entry's pingTime
+        merged into its latency aggregates instead of a new row.
+        Returns (added, merged). The whole batch is committed atomically, along with
+        checkpoint (name, offset) if given, see merged_offset."""
+        rows = [(e.get('origin', 'unknown'), e.get('destination', ''), e.get('pingTime')) for e in entries]
+        added = 0
+        with self.connection:
+            if checkpoint is not None:
+                self._set_meta(f"merged:{checkpoint[0]}", str(checkpoint[1]))
+            exported_id = int(self._get_meta('exported_id', '0'))
+            for origin, destination, ping in rows:
+                cursor = self.connection.execute(
+                    'INSERT OR IGNORE INTO hops (origin, destination, pingTime) VALUES (?, ?, ?)',
+                    (origin, destination, ping),
+                )
+                if cursor.rowcount:
+                    added += 1
+                    hop_id, stored_ping = cursor.lastrowid, None
+                else:
+                    hop_id, stored_ping = self.connection.execute(
+                        'SELECT id, pingTime FROM hops WHERE origin = ? AND destination = ?', (origin, destination)
+                    ).fetchone()
+                if ping is not None:
+                    self._add_sample(hop_id, ping, stored_ping, hop_id <= exported_id)
+        return added, len(rows) - added
+
+    def merged_offset(self, name: str) -> int:
+        """How far into the file name the entries added so far came from (0 if none)"""
+        return int(self._get_meta(f"merged:{name}", '0'))
+
+    def _add_sample(self, hop_id: int, ping: int, stored_ping: Optional[int], exported: bool):
+        row = self.connection.execute(
+            'SELECT samples, min, max, total, sketch, dirty FROM edge_stats WHERE hop_id = ?', (hop_id,)
+        ).fetchone()
+        if row is not None:
+            stats = EdgeStats.from_row(*row[:5])
+            before, dirty = _latency(stats, None), row[5]
+        else:
+            before, dirty = _latency(None, stored_ping), 0
+            stats = EdgeStats()
+            if stored_ping is not None:
+                # A hop stored before aggregation existed: its single ping is the first sample
+                stats.add(stored_ping)
+        stats.add(ping)
+        # An exported hop needs recording once its exported latency changes, and until it's recorded
+        dirty = dirty or (exported and _latency(stats, None) != before)
+        self.connection.execute(
+            'INSERT OR REPLACE INTO edge_stats (hop_id, samples, min, max, total, sketch, dirty) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (hop_id, stats.samples, stats.min, stats.max, stats.total, stats.to_blob(), int(dirty)),
+        )
+        self.connection.execute('UPDATE hops SET pingTime = ? WHERE id = ?', (stats.quantile(0.5), hop_id))
+
+    def interfaces(self) -> Set[str]:
+        """Every IP seen as an origin or destination"""
+        rows = self.connection.execute(
+            "SELECT origin FROM hops WHERE origin != 'unknown' UNION SELECT destination FROM hops"
+        )
+        return {row[0] for row in rows if row[0]}
+
+    def import_results(self, filename: str = RESULTS_FILE) -> int:
+        """Seed an empty store from an existing results.json, marking its entries as already exported"""
+        if len(self) > 0 or not os.path.exists(filename):
+            return 0
+        try:
+            data = results_io.load_results(filename)
+        except (json.JSONDecodeError, IOError, ValueError) as e:
+            print(f"  Warning: Could not import existing results file: {e}")
+            return 0
+        added, _ = self.add(data)
+        with self.connection:
+            self._set_meta('exported_id', str(self._max_id()))
+        return added
+
+    def _max_id(self) -> int:
+        return self.connection.execute('SELECT COALESCE(MAX(id), 0) FROM hops').fetchone()[0]
+
+    def _recover_export(self, filename: str):
+        """Finish or roll back an export interrupted by a crash"""
+        pending = self._get_meta('export_pending')
+        if pending is None:
+            return
+        pending = json.loads(pending)
+        size = os.path.getsize(filename) if os.path.exists(filename) else -1
+        if size == pending['size']:
+            # The append reached the disk, only the watermark update was lost
+            with self.connection:
+                self._set_meta('exported_id', str(pending['end_id']))
+                self._set_meta('export_pending', None)
+            return
+        if size >= pending['offset']:
+            with open(filename, 'r+b') as f:
+                _, tail = _tail(f, size)
+            if not tail.rstrip().endswith(b']'):
+                # Torn append: put back the original end of the array
+                with open(filename, 'r+b') as f:
+                    f.truncate(pending['offset'])
+                    f.seek(pending['offset'])
+                    f.write(pending['tail'].encode('utf-8'))
+                    f.flush()
+                    os.fsync(f.fileno())
+                with self.connection:
+                    self._set_meta('export_pending', None)
+                return
+        # The file was rewritten since; skip rows it already holds on the next export
+        with self.connection:
+            self._set_meta('export_pending', None)
+            self._set_meta('export_verify', '1')
+
+    def _existing_keys(self, filename: str) -> Set[Tuple[str, str]]:
+        try:
+            return set(results_io.iter_endpoints(filename))
+        except (json.JSONDecodeError, IOError, ValueError):
+            return set()
+
+    def export_results(self, filename: str = RESULTS_FILE) -> int:
+        """Append the hops not exported yet to filename (a results.json array).
+        Returns how many entries were appended."""
+        self._recover_export(filename)
+        exported_id = int(self._get_meta('exported_id', '0'))
+        remeasured = self._export_remeasured(filename, exported_id)
+        rows = self.connection.execute(
+            'SELECT id, origin, destination, pingTime, samples, min, max, total, sketch '
+            'FROM hops LEFT JOIN edge_stats ON hop_id = id WHERE id > ? ORDER BY id', (exported_id,)
+        ).fetchall()
+        if not rows:
+            return remeasured
+        end_id = rows[-1][0]
+        entries = [_entry(o, d, p, stats) for _, o, d, p, *stats in rows]
+        if self._get_meta('export_verify') and os.path.exists(filename):
+            existing_keys = self._existing_keys(filename)
+            entries = [e for e in entries if (e['origin'], e['destination']) not in existing_keys]
+
+        layout = results_io.detect_format(filename)
+        if layout is None:
+            self._write_new(filename, entries)
+        elif entries and layout == results_io.NORMALIZED:
+            # The tables can't be appended to in place, so rewrite the file
+            results_io.save_results(results_io.load_results(filename) + entries, filename)
+        elif entries:
+            self._append(filename, entries, end_id)
+
+        with self.connection:
+            self._set_meta('exported_id', str(end_id))
+            self._set_meta('export_pending', None)
+            self._set_meta('export_verify', None)
+        return remeasured + len(entries)
+
+    def _export_remeasured(self, filename: str, exported_id: int) -> int:
+        """Record the latest latency of the exported hops whose aggregates changed in
+        filename.remeasured, leaving filename alone. Returns how many hops were recorded."""
+        rows = self.connection.execute(
+            'SELECT id, origin, destination, pingTime, samples, min, max, total, sketch '
+            'FROM edge_stats JOIN hops ON hop_id = id WHERE dirty = 1 AND id <= ?', (exported_id,)
+        ).fetchall()
+        if not rows or not os.path.exists(filename):
+            return 0
+        remeasured_filename = f"{filename}.remeasured"
+        remeasured = load_remeasured(remeasured_filename)
+        for _, origin, destination, ping, *stats in rows:
+            fields = _entry(origin, destination, ping, stats)
+            del fields['origin'], fields['destination']
+            remeasured[(origin, destination)] = fields
+        self._write_new(remeasured_filename, [
+            {'origin': origin, 'destination': destination, **fields}
+            for (origin, destination), fields in sorted(remeasured.items())
+        ])
+        with self.connection:
+            self.connection.executemany('UPDATE edge_stats SET dirty = 0 WHERE hop_id = ?', [(r[0],) for r in rows])
+        return len(rows)
+
+    def _write_new(self, filename: str, entries: List):
+        results_io.write_atomic(filename, results_io.encode_flat(entries))
+
+    def _append(self, filename: str, entries: List[Dict], end_id: int):
+        with open(filename, 'r+b') as f:
+            size = os.fstat(f.fileno()).st_size
+            tail_offset, tail = _tail(f, size)
+            body = tail.rstrip()
+            if not body.endswith(b']'):
+                raise ValueError(f"{filename} does not end with a JSON array")
+            body = body[:-1].rstrip()
+            # Cut right after the last entry's '}' (or the opening '['), keeping what follows to undo
+            offset = tail_offset + len(body)
+            is_empty = body.endswith(b'[')
+            if len(body) == 0:
+                raise ValueError(f"Could not find the end of the last entry in {filename}")
+            # Keep the file's layout: one compact entry per line, or indent=2
+            if results_io.is_line_per_entry(filename):
+                lines = [results_io.encode_entry(e) for e in entries]
+            else:
+                lines = [_format_entry(e).encode('utf-8') for e in entries]
+            payload = (b'\n' if is_empty else b',\n') + b',\n'.join(lines) + b'\n]'
+
+            with self.connection:
+                self._set_meta('export_pending', json.dumps({
+                    'end_id': end_id,
+                    'offset': offset,
+                    'size': offset + len(payload),
+                    'tail': tail[offset - tail_offset:].decode('utf-8'),
+                }))
+            f.truncate(offset)
+            f.seek(offset)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
@@ -0,0 +1,160 @@
+"""
+Sharded collection: targets.json split across workers that can be preempted at any time.
+
+Target t belongs to shard sha1(t) mod N, so every worker computes the same split on its own.
+Workers resolve the whole of targets.json first, so targets sharing an address are traced once
+across shards; a resolved address goes by (and is checkpointed under) the first target name it
+stands for, as DNS answers can differ between machines and runs.
+
+A worker appends one JSON line per finished target to its shard file,
+
+    shards/results.shard-<i>-of-<N>.jsonl    {"target": ..., "entries": [results entries]}
+
+flushed and fsynced before the next one is written. The shard is also the checkpoint: a
+restarted worker skips the targets already in it. A line cut short by a crash is dropped.
+
+On SIGTERM (a spot instance's 30 second warning) no new traceroute starts; those already
+running get SHUTDOWN_GRACE seconds to finish and be written before the worker exits.
+
+Merging goes through the ResultsStore like any other run, so (origin, destination) pairs are
+deduplicated and repeat pings merged into the latency aggregates. The store remembers how far
+into each shard it merged, so merging again (or after a worker resumed) only adds new lines.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import signal
+import threading
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from results_store import RESULTS_FILE, STORE_FILE, ResultsStore
+
+SHARD_DIR = 'shards'
+SHUTDOWN_GRACE = 20  # Seconds, within the 30 second preemption warning
+EXIT_PREEMPTED = 128 + signal.SIGTERM
+
+
+def parse_shard_spec(spec: str) -> Tuple[int, int]:
+    """(index, count) from "i/N", with 0 <= i < N"""
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard {spec!r}, expected i/N such as 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard {spec!r}, i must be between 0 and N-1")
+    return index, count
+
+
+def shard_of(target: str, count: int) -> int:
+    return int.from_bytes(hashlib.sha1(target.encode('utf-8')).digest()[:8], 'big') % count
+
+
+def shard_targets(targets: List[str], index: int, count: int, names: Optional[Dict[str, str]] = None) -> List[str]:
+    """The targets of shard index, in their targets.json order. A target in names (an address
+    unix.py resolved) goes by the name it maps to."""
+    names = names or {}
+    return [target for target in targets if shard_of(names.get(target, target), count) == index]
+
+
+def shard_filename(index: int, count: int, directory: str = SHARD_DIR) -> str:
+    return os.path.join(directory, f"results.shard-{index}-of-{count}.jsonl")
+
+
+def read_shard(filename: str, offset: int = 0) -> Iterator[Tuple[Dict, int]]:
+    """Yield (record, offset after it) for every complete line from offset on"""
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b'\n'):
+                return
+            offset += len(line)
+            if line.strip():
+                yield json.loads(line), offset
+
+
+class ShardWriter:
+    """Appends finished targets to a shard file; safe to call write from several threads"""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.done: Set[str] = set()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        end = 0
+        if os.path.exists(filename):
+            for record, end in read_shard(filename):
+                self.done.add(record['target'])
+        self._file = open(filename, 'ab')
+        # Drop a line torn by a crash, so the next one starts on a line of its own
+        self._file.truncate(end)
+
+    def __enter__(self) -> 'ShardWriter':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def write(self, target: str, entries: List[Dict]) -> bool:
+        """Record target as done with its entries. False once the writer is closed"""
+        line = json.dumps({'target': target, 'entries': entries}, ensure_ascii=False) + '\n'
+        with self._lock:
+            if self._file.closed:
+                return False
+            self._file.write(line.encode('utf-8'))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.done.add(target)
+        return True
+
+
+def stop_on_sigterm() -> threading.Event:
+    """Event set when SIGTERM arrives, instead of the process being killed outright"""
+    stop = threading.Event()
+
+    def handle(signum, frame):
+        print(f"\nReceived SIGTERM, finishing running traceroutes for up to {SHUTDOWN_GRACE}s")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handle)
+    return stop
+
+
+def find_shards(directory: str = SHARD_DIR) -> List[str]:
+    return sorted(glob.glob(os.path.join(directory, 'results.shard-*.jsonl')))
+
+
+def merge_shards(filenames: List[str], results_filename: str = RESULTS_FILE,
+                 store_filename: str = STORE_FILE) -> Tuple[int, int, int]:
+    """Add the shard lines not merged yet to the store and export them to results_filename.
+    Returns (targets, hops added, repeat measurements merged)"""
+    targets = added = merged = 0
+    with ResultsStore(store_filename) as store:
+        imported_count = store.import_results(results_filename)
+        if imported_count > 0:
+            print(f"  Imported {imported_count} existing hop(s) from {results_filename} into {store_filename}")
+        for filename in filenames:
+            name = os.path.abspath(filename)
+            offset = store.merged_offset(name)
+            if offset > os.path.getsize(filename):
+                # Shorter than what was merged: a new shard under the same name
+                offset = 0
+            entries: List[Dict] = []
+            end: Optional[int] = None
+            for record, end in read_shard(filename, offset):
+                targets += 1
+                entries.extend(record['entries'])
+            if end is None:
+                continue
+            shard_added, shard_merged = store.add(entries, checkpoint=(name, end))
+            added += shard_added
+            merged += shard_merged
+            print(f"  {filename}: {shard_added} new hop(s), {shard_merged} repeat measurement(s)")
+        store.export_results(results_filename)
+    return targets, added, merged
@@ -0,0 +1,209 @@
+"""
+Pre-flight for unix.py: resolve every target once, concurrently, and trace each address once.
+
+targets.json lists hostnames that traceroute would otherwise resolve inside every subprocess,
+and many of them land on the same address (shared hosting, CDNs). resolve_targets looks them
+all up on a thread pool, caching answers in dns_cache.db, then keeps one target per IPv4
+address (or per /24 with prefix_length=24) and gives the tracer that literal address.
+
+A destination is flagged as likely anycast when it's in a well-known anycast range. Its
+traceroute shows the path to the nearest site, not to where the hostname is hosted. Flagging
+a /24 that several targets resolve into (a CDN edge) is opt-in, with shared_targets: plain
+shared hosting looks just the same.
+
+A resolver is any callable hostname -> IPv4 addresses: system_resolver uses getaddrinfo, and
+HostsResolver answers from a JSON file ({"gov.uk": ["151.101.0.144"]}) to test without DNS.
+"""
+
+import ipaddress
+import json
+import socket
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Set
+
+DNS_CACHE_FILE = "dns_cache.db"
+DNS_CACHE_TTL_HOURS = 24
+NEGATIVE_DNS_TTL_HOURS = 1
+DNS_WORKERS = 16
+ANYCAST_SHARED_TARGETS = 0  # Targets in one /24 that flag it as anycast, 0 to rely on ANYCAST_RANGES alone
+
+# Anycast ranges of big CDNs and public resolvers (Cloudflare, Fastly, Google, Quad9)
+ANYCAST_RANGES = [
+    ipaddress.ip_network(network) for network in (
+        "1.0.0.0/24", "1.1.1.0/24", "104.16.0.0/13", "172.64.0.0/13", "162.158.0.0/15",
+        "188.114.96.0/20", "141.101.64.0/18", "108.162.192.0/18", "173.245.48.0/20",
+        "151.101.0.0/16", "199.232.0.0/16", "8.8.8.0/24", "8.8.4.0/24", "9.9.9.0/24",
+    )
+]
+
+_SECONDS_PER_HOUR = 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dns (
+    hostname TEXT PRIMARY KEY,
+    addresses TEXT NOT NULL,
+    resolved_at REAL NOT NULL
+);
+"""
+
+Resolver = Callable[[str], List[str]]
+
+
+def system_resolver(hostname: str) -> List[str]:
+    """IPv4 addresses of hostname from the system resolver, in the order it prefers them"""
+    try:
+        infos = socket.getaddrinfo(hostname, None, socket.AF_INET, socket.SOCK_STREAM)
+    except (OSError, UnicodeError):
+        return []
+    return list(dict.fromkeys(info[4][0] for info in infos))
+
+
+class HostsResolver:
+    """Resolves from a JSON object mapping hostnames to lists of addresses"""
+
+    def __init__(self, filename: str):
+        with open(filename, "r", encoding="utf-8") as f:
+            self.hosts: Dict[str, List[str]] = json.load(f)
+
+    def __call__(self, hostname: str) -> List[str]:
+        return list(self.hosts.get(hostname, []))
+
+
+class DnsCache:
+    def __init__(
+        self,
+        filename: str = DNS_CACHE_FILE,
+        ttl_hours: float = DNS_CACHE_TTL_HOURS,
+        negative_ttl_hours: float = NEGATIVE_DNS_TTL_HOURS,
+        clock=time.time,
+    ):
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(_SCHEMA)
+        self.ttl = ttl_hours * _SECONDS_PER_HOUR
+        self.negative_ttl = negative_ttl_hours * _SECONDS_PER_HOUR
+        self.clock = clock
+        self.stats = {"hits": 0, "misses": 0}
+
+    def lookup(self, hostname: str) -> Optional[List[str]]:
+        """Cached addresses, [] for a cached failure, None if not cached or expired"""
+        row = self.connection.execute(
+            "SELECT addresses, resolved_at FROM dns WHERE hostname = ?", (hostname,)
+        ).fetchone()
+        if row is not None:
+            addresses = json.loads(row[0])
+            if self.clock() - row[1] < (self.ttl if addresses else self.negative_ttl):
+                self.stats["hits"] += 1
+                return addresses
+        self.stats["misses"] += 1
+        return None
+
+    def store(self, hostname: str, addresses: List[str]):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO dns (hostname, addresses, resolved_at) VALUES (?, ?, ?)",
+            (hostname, json.dumps(addresses), self.clock()),
+        )
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+def _ipv4(value: str) -> Optional[str]:
+    try:
+        return str(ipaddress.IPv4Address(value))
+    except ValueError:
+        return None
+
+
+def _network(address: str, prefix_length: int) -> str:
+    return str(ipaddress.ip_network(f"{address}/{prefix_length}", strict=False))
+
+
+def is_anycast_range(address: str) -> bool:
+    ip = ipaddress.IPv4Address(address)
+    return any(ip in network for network in ANYCAST_RANGES)
+
+
+class TargetPlan:
+    """What to trace after resolution. traces are literal addresses in targets.json order;
+    targets_of maps each one to every target it stands for. resolved counts repeated
+    targets once per occurrence, as each would have been traced."""
+
+    def __init__(self):
+        self.traces: List[str] = []
+        self.targets_of: Dict[str, List[str]] = {}
+        self.unresolved: List[str] = []
+        self.anycast: Set[str] = set()
+        self.resolved = 0
+        self.cache_hits = 0
+
+    @property
+    def traces_avoided(self) -> int:
+        return self.resolved - len(self.traces)
+
+
+def resolve_all(hostnames: List[str], resolver: Resolver = system_resolver, cache: Optional[DnsCache] = None,
+                workers: int = DNS_WORKERS) -> Dict[str, List[str]]:
+    """Addresses of every distinct hostname; literal IPv4 targets resolve to themselves"""
+    answers: Dict[str, List[str]] = {}
+    pending = []
+    for hostname in dict.fromkeys(hostnames):
+        literal = _ipv4(hostname)
+        cached = None if literal or cache is None else cache.lookup(hostname)
+        if literal:
+            answers[hostname] = [literal]
+        elif cached is not None:
+            answers[hostname] = cached
+        else:
+            pending.append(hostname)
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {pool.submit(resolver, hostname): hostname for hostname in pending}
+            for future in as_completed(futures):
+                hostname = futures[future]
+                try:
+                    addresses = [address for address in future.result() if _ipv4(address)]
+                except Exception as e:
+                    print(f"  Warning: could not resolve {hostname}: {e}")
+                    addresses = []
+                answers[hostname] = addresses
+                if cache is not None:
+                    cache.store(hostname, addresses)
+    return answers
+
+
+def resolve_targets(targets: List[str], resolver: Resolver = system_resolver, cache: Optional[DnsCache] = None,
+                    workers: int = DNS_WORKERS, prefix_length: int = 32,
+                    shared_targets: int = ANYCAST_SHARED_TARGETS) -> TargetPlan:
+    """Resolve targets and keep the first one per address, or per /prefix_length network.
+    With shared_targets > 0, a /24 that many targets resolve into is flagged as anycast too."""
+    hits_before = cache.stats["hits"] if cache is not None else 0
+    answers = resolve_all(targets, resolver, cache, workers)
+    plan = TargetPlan()
+    plan.cache_hits = (cache.stats["hits"] if cache is not None else 0) - hits_before
+
+    trace_of_group: Dict[str, str] = {}
+    targets_in_24: Dict[str, Set[str]] = {}
+    for target in targets:
+        addresses = answers.get(target)
+        if not addresses:
+            if target not in plan.unresolved:
+                plan.unresolved.append(target)
+            continue
+        plan.resolved += 1
+        address = addresses[0]
+        group = address if prefix_length >= 32 else _network(address, prefix_length)
+        trace = trace_of_group.setdefault(group, address)
+        if trace == address and trace not in plan.targets_of:
+            plan.traces.append(trace)
+        if target not in plan.targets_of.setdefault(trace, []):
+            plan.targets_of[trace].append(target)
+        targets_in_24.setdefault(_network(address, 24), set()).add(target)
+
+    for trace in plan.traces:
+        shared = shared_targets > 0 and len(targets_in_24[_network(trace, 24)]) >= shared_targets
+        if shared or is_anycast_range(trace):
+            plan.anycast.add(trace)
+    return plan
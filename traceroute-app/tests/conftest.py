@@ -0,0 +1,19 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The scripts aren't a package: import them from the app directory
+sys.path.insert(0, APP_DIR)
+
+
+@pytest.fixture(scope="session")
+def geoloc():
+    """ip-geoloc.py, which can't be imported by name"""
+    spec = importlib.util.spec_from_file_location("ip_geoloc", os.path.join(APP_DIR, "ip-geoloc.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
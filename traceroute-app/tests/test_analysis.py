@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+import results_io
+from analysis import HopGraph, _degree_bins, analyze_results
+
+# A tree (B and C are on the paths between the others), a 4-cycle (two shortest paths between
+# opposite corners), a self-loop, a hop from an unknown origin and one seen both ways
+HOPS = [
+    ("A", "B"), ("B", "C"), ("C", "D"), ("B", "E"), ("B", "A"), ("unknown", "A"), ("F", "F"),
+    ("P", "Q"), ("Q", "R"), ("R", "S"), ("S", "P"),
+]
+
+
+def graph() -> HopGraph:
+    hop_graph = HopGraph()
+    for origin, destination in HOPS:
+        hop_graph.add(origin, destination)
+    hop_graph.build_csr()
+    return hop_graph
+
+
+def by_ip(hop_graph, values):
+    return {ip: values[node] for ip, node in hop_graph.ids.items()}
+
+
+def test_degrees_and_components():
+    hop_graph = graph()
+    assert len(hop_graph) == 10
+    assert by_ip(hop_graph, hop_graph.connections) == {
+        "A": 3, "B": 4, "C": 2, "D": 1, "E": 1, "F": 2, "P": 2, "Q": 2, "R": 2, "S": 2}
+    assert {ip: sorted(hop_graph.ips[n] for n in hop_graph.neighbors_of(node))
+            for ip, node in hop_graph.ids.items()} == {
+        "A": ["B"], "B": ["A", "C", "E"], "C": ["B", "D"], "D": ["C"], "E": ["B"], "F": [],
+        "P": ["Q", "S"], "Q": ["P", "R"], "R": ["Q", "S"], "S": ["P", "R"]}
+    assert hop_graph.degree_distribution() == {0: 1, 1: 3, 2: 5, 3: 1}
+    assert hop_graph.components() == [5, 4, 1]
+    assert _degree_bins({0: 1, 1: 3, 2: 5, 3: 1, 4: 2, 7: 1, 8: 1}) == [(0, 0, 1), (1, 1, 3), (2, 3, 6), (4, 7, 3),
+                                                                       (8, 15, 1)]
+
+
+def test_betweenness_from_every_source_is_exact():
+    hop_graph = graph()
+    assert by_ip(hop_graph, hop_graph.betweenness(samples=100, seed=0)) == pytest.approx({
+        "A": 0, "B": 5, "C": 3, "D": 0, "E": 0, "F": 0, "P": 0.5, "Q": 0.5, "R": 0.5, "S": 0.5})
+
+
+def test_sampled_betweenness_repeats_with_a_seed():
+    hop_graph = graph()
+    assert list(hop_graph.betweenness(samples=4, seed=7)) == list(hop_graph.betweenness(samples=4, seed=7))
+    assert list(HopGraph().betweenness()) == []
+
+
+@pytest.mark.parametrize("layout", ["flat", "normalized"])
+def test_metrics_report(tmp_path, monkeypatch, capsys, layout):
+    monkeypatch.chdir(tmp_path)
+    entries = [{"origin": origin, "destination": destination, "pingTime": 1} for origin, destination in HOPS]
+    results_io.save_results(entries, "results.json", layout=getattr(results_io, layout.upper()))
+    (tmp_path / "targets.json").write_text(json.dumps(["a.example", "b.example"]))
+
+    analyze_results("results.json", "metrics.json", samples=100, seed=0)
+    assert "Top 10 chokepoints by betweenness (sampled from 10 IPs):" in capsys.readouterr().out
+    with open("metrics.json", encoding="utf-8") as f:
+        metrics = json.load(f)
+    assert metrics == {
+        "file": "results.json",
+        "totalHops": len(HOPS),
+        "uniqueIps": 10,
+        "targets": 2,
+        "topConnections": [{"ip": ip, "connections": count} for ip, count in [
+            ("B", 4), ("A", 3), ("C", 2), ("F", 2), ("P", 2), ("Q", 2), ("R", 2), ("S", 2), ("D", 1), ("E", 1)]],
+        "degreeDistribution": {"0": 1, "1": 3, "2": 5, "3": 1},
+        "components": {"count": 3, "largest": 5, "sizes": [5, 4, 1]},
+        "betweenness": {"samples": 10, "top": [{"ip": ip, "score": score} for ip, score in [
+            ("B", 5.0), ("C", 3.0), ("P", 0.5), ("Q", 0.5), ("R", 0.5), ("S", 0.5)]]},
+    }
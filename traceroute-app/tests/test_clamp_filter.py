@@ -0,0 +1,67 @@
+import copy
+import math
+import random
+
+import pytest
+
+from benchmarks.bench_clamp_filter import synthetic_entries
+
+# Zones taking in some of the long hops below, so they're bypassed: the borderline ones along the
+# meridian, and the synthetic ones with both ends in the western hemisphere
+ZONES = [
+    {"id": "meridian", "name": "Meridian", "polygon": [[-5, -10], [5, -10], [5, 50], [-5, 50]]},
+    {"id": "west", "name": "West", "polygon": [[-180, -60], [0, -60], [0, 70], [-180, 70]]},
+]
+
+
+def geo(lat, lon):
+    return {"country": "", "region": "", "city": "", "latitude": lat, "longitude": lon}
+
+
+def borderline_entries(geoloc):
+    """Hops whose minimum ping is a whole number of ms, or whose length is MAX_LAND_HOP_DISTANCE_KM,
+    give or take float noise: the cases the vectorized pass re-checks with the scalar functions"""
+    meters_per_ms = geoloc.SPEED_OF_LIGHT_METERS / geoloc.SPEED_MULTIPLIER / 1000
+    lengths = [k * meters_per_ms for k in range(1, 40)] + [geoloc.MAX_LAND_HOP_DISTANCE_KM * 1000]
+    entries = []
+    for n, length in enumerate(lengths):
+        degrees = math.degrees(length / geoloc.EARTH_RADIUS_METERS)
+        for start, lon in [(0.0, 0.0), (-3.5, 2.0), (20.0, 40.0)]:
+            for noise in (-1e-12, 0.0, 1e-12):
+                min_ping = round(length / meters_per_ms)
+                for ping in (None, min_ping - 1, min_ping, min_ping + 1):
+                    entry = {"origin": f"10.0.{n}.{len(entries) % 250}", "destination": f"11.0.{n}.1",
+                             "pingTime": ping, "origin_geo": geo(start, lon),
+                             "destination_geo": geo(start + degrees + noise, lon)}
+                    if ping is not None:
+                        entry.update(pingMin=ping - 1, pingP90=ping + 1, samples=3)
+                    entries.append(entry)
+    # No distance at all, and hops missing a location or a coordinate
+    entries += [
+        {"origin": "10.1.0.1", "destination": "10.1.0.2", "pingTime": 0,
+         "origin_geo": geo(1.0, 1.0), "destination_geo": geo(1.0, 1.0)},
+        {"origin": "10.1.0.3", "destination": "10.1.0.4", "pingTime": 1, "origin_geo": geo(1.0, 1.0)},
+        {"origin": "10.1.0.5", "destination": "10.1.0.6", "pingTime": 1,
+         "origin_geo": geo(1.0, None), "destination_geo": geo(80.0, 1.0)},
+    ]
+    return entries
+
+
+def run(geoloc, clamp_and_filter, entries, zones, capsys):
+    entries = copy.deepcopy(entries)
+    stats = geoloc.ClampFilterStats()
+    kept = clamp_and_filter(entries, geoloc.GeozoneIndex(zones), stats)
+    return kept, vars(stats), capsys.readouterr().out
+
+
+@pytest.mark.parametrize("corpus", ["borderline", "synthetic"])
+def test_vectorized_matches_serial(geoloc, capsys, monkeypatch, corpus):
+    entries = borderline_entries(geoloc) if corpus == "borderline" else synthetic_entries(20000, seed=5)
+    random.Random(1).shuffle(entries)
+    # Every message, so their order is compared too
+    monkeypatch.setattr(geoloc, "PRINT_LIMIT", len(entries))
+    serial = run(geoloc, geoloc._clamp_and_filter_serial, entries, ZONES, capsys)
+    vectorized = run(geoloc, geoloc._clamp_and_filter_vectorized, entries, ZONES, capsys)
+    assert vectorized == serial
+    stats = serial[1]
+    assert stats["clamped"] and stats["filtered"] and stats["bypassed"]
@@ -0,0 +1,19 @@
+from cli_args import get_flag, positional
+
+
+def test_positional_after_a_switch():
+    argv = ['tile_results.py', '--full', 'results.json', '--out', 'tiles']
+    assert positional(argv, ('--out',)) == ['results.json']
+
+
+def test_positional_skips_option_values():
+    argv = ['analysis.py', '--json', 'metrics.json', '--metrics', 'run.json', '--profile', 'results.json']
+    assert positional(argv, ('--json',)) == ['results.json']
+
+
+def test_get_flag():
+    argv = ['unix.py', '--workers', '4', '--first-ttl', 'x', '--shard']
+    assert get_flag(argv, '--workers', 1, int) == 4
+    assert get_flag(argv, '--first-ttl', 6, int) == 6
+    assert get_flag(argv, '--shard', None) is None
+    assert get_flag(argv, '--hosts', 'hosts.json') == 'hosts.json'
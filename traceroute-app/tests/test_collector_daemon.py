@@ -0,0 +1,116 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from collector_daemon import BASE_INTERVAL, CHANGED, CHURN, NEW, STABLE, CollectorDaemon, next_interval
+from unix import Tracer
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MIN_INTERVAL = 10 * 60
+MAX_INTERVAL = 8 * 60 * 60
+PATH_A = ['10.0.0.2', '10.0.1.1', '10.0.2.1']
+PATH_B = ['10.0.0.2', '10.0.1.2', '10.0.2.1']  # TTL 3 moves to an IP never seen there
+PATH_C = ['10.0.0.2', '10.0.1.3', '10.0.2.1']
+
+
+class PathTracer(Tracer):
+    """Serves the next of paths, as traceroute -n output, for every trace"""
+
+    def __init__(self, paths):
+        self.paths = iter(paths)
+
+    def run(self, target, first_ttl=1, max_ttl=None):
+        lines = [f"traceroute to {target} ({target}), 30 hops max, 60 byte packets",
+                 " 1  192.168.0.1  1.0 ms  1.0 ms  1.0 ms"]
+        lines += [f" {ttl}  {ip}  {ttl}.0 ms  {ttl}.0 ms  {ttl}.0 ms" for ttl, ip in enumerate(next(self.paths), 2)]
+        return lines, [], 0
+
+    def stream(self, target, max_silent_hops=5, first_ttl=1):
+        return self.run(target, first_ttl=first_ttl)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+def test_schedule_follows_route_changes(tmp_path):
+    clock = FakeClock()
+    tracer = PathTracer([PATH_A, PATH_B, PATH_B, PATH_B, PATH_A, PATH_C])
+    daemon = CollectorDaemon(
+        ['10.0.2.1'], tracer,
+        db_filename=str(tmp_path / 'daemon.db'), diffs_filename=str(tmp_path / 'route_diffs.jsonl'),
+        results_filename=str(tmp_path / 'results.json'), store_filename=str(tmp_path / 'results.db'),
+        min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL, clock=clock, sleep=clock.sleep,
+    )
+    try:
+        expected = [
+            (NEW, BASE_INTERVAL),
+            (CHANGED, MIN_INTERVAL),
+            (STABLE, 2 * MIN_INTERVAL),
+            (STABLE, 4 * MIN_INTERVAL),
+            (CHURN, 2 * MIN_INTERVAL),  # Back to PATH_A, whose IPs were all seen before
+            (CHANGED, MIN_INTERVAL),
+        ]
+        for kind, interval in expected:
+            daemon.run(max_rounds=1)
+            assert daemon.stats[kind] >= 1
+            assert daemon.interval_of('10.0.2.1') == interval
+            assert daemon.queue[0][0] == clock.now + interval
+            # Not traced again before it's due
+            assert daemon.run_once() == 0
+            clock.sleep(interval)
+        assert daemon.stats == {NEW: 1, CHANGED: 2, CHURN: 1, STABLE: 2, 'failed': 0}
+    finally:
+        daemon.close()
+
+    with open(tmp_path / 'route_diffs.jsonl', encoding='utf-8') as f:
+        diffs = [json.loads(line) for line in f]
+    assert [diff['kind'] for diff in diffs] == [NEW, CHANGED, CHURN, CHANGED]
+    assert diffs[1]['changed'] == [[3, '10.0.1.1', '10.0.1.2']]
+
+
+def test_churn_backs_off_to_the_minimum_interval():
+    assert next_interval(CHURN, 1.5 * MIN_INTERVAL, MIN_INTERVAL, MAX_INTERVAL) == MIN_INTERVAL
+    assert next_interval(CHURN, 4 * MIN_INTERVAL, MIN_INTERVAL, MAX_INTERVAL) == 2 * MIN_INTERVAL
+
+
+def test_tracer_missing_a_method_fails_on_construction():
+    class RunOnly(Tracer):
+        def run(self, target, first_ttl=1, max_ttl=None):
+            return [], [], 0
+
+    with pytest.raises(TypeError):
+        RunOnly()
+
+
+def test_synthetic_daemon_runs_without_root(tmp_path):
+    with open(tmp_path / 'targets.json', 'w', encoding='utf-8') as f:
+        json.dump([f"45.0.0.{i}" for i in range(1, 6)], f)
+    daemon = subprocess.Popen(
+        [sys.executable, os.path.join(APP_DIR, 'collector_daemon.py'), '--synthetic', '--no-resolve', '--batch', '5'],
+        cwd=tmp_path, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while not (tmp_path / 'results.json').exists() and time.monotonic() < deadline:
+            time.sleep(0.1)
+    finally:
+        daemon.send_signal(signal.SIGTERM)
+        output = daemon.communicate(timeout=30)[0]
+    assert daemon.returncode == 0, output
+    assert "Stopped: 5 new" in output
+    with open(tmp_path / 'route_diffs.jsonl', encoding='utf-8') as f:
+        assert [json.loads(line)['kind'] for line in f] == [NEW] * 5
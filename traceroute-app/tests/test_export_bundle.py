@@ -0,0 +1,135 @@
+import gzip
+import hashlib
+import json
+import os
+import struct
+from array import array
+
+import pytest
+
+import export_bundle
+import results_io
+from export_bundle import BUNDLE_MAGIC, BUNDLE_VERSION, NO_PING, build_bundle
+
+PARIS = {"country": "France", "region": "Île-de-France", "city": "Paris", "latitude": 48.8566, "longitude": 2.3522}
+TOKYO = {"country": "Japan", "region": "Tokyo", "city": "東京", "latitude": 35.6762, "longitude": 139.6503}
+NOWHERE = {"country": "", "region": None, "city": None, "latitude": 0.0, "longitude": 0.0}
+
+ENTRIES = [
+    {"origin": "10.0.0.1", "destination": "10.0.0.2", "pingTime": 5, "origin_geo": PARIS,
+     "destination_geo": dict(PARIS, city="Paris, again")},
+    {"origin": "10.0.0.2", "destination": "10.0.0.3", "pingTime": None, "origin_geo": PARIS,
+     "destination_geo": TOKYO},
+    {"origin": "10.0.0.3", "destination": "10.0.0.4", "pingTime": 230, "pingMin": 221, "pingP90": None,
+     "samples": 4, "origin_geo": TOKYO, "destination_geo": NOWHERE},
+    # Not drawn: an end without a location
+    {"origin": "unknown", "destination": "10.0.0.1", "pingTime": 1, "destination_geo": PARIS},
+    {"origin": "10.0.0.4", "destination": "10.0.0.5", "pingTime": 3, "origin_geo": NOWHERE, "destination_geo": None},
+    {"origin": "10.0.0.5", "destination": "10.0.0.6", "pingTime": 3, "origin_geo": TOKYO,
+     "destination_geo": dict(TOKYO, latitude=None)},
+]
+
+
+def read_bundle(bundle: bytes):
+    """Decode a bundle the way website/src/utils/bundle.ts does"""
+    magic, version, string_bytes, node_count, edge_count, reserved = struct.unpack_from("<4sIIIII", bundle)
+    assert (magic, version, reserved) == (BUNDLE_MAGIC, BUNDLE_VERSION, 0)
+    offset = 24
+    strings = bundle[offset:offset + string_bytes].decode("utf-8").split("\0")
+    offset += string_bytes
+
+    def column(typecode, count):
+        nonlocal offset
+        assert offset % 8 == 0 or typecode in "Ii"
+        values = array(typecode, bundle[offset:offset + count * array(typecode).itemsize])
+        offset += count * values.itemsize
+        return list(values)
+
+    offset += -offset % 8
+    latitudes, longitudes = column("d", node_count), column("d", node_count)
+    countries, regions, cities = (column("I", node_count) for _ in range(3))
+    offset += -offset % 8
+    nodes = [{"country": strings[countries[i]], "region": strings[regions[i]], "city": strings[cities[i]],
+              "latitude": latitudes[i], "longitude": longitudes[i]} for i in range(node_count)]
+    origins, destinations = column("I", edge_count), column("I", edge_count)
+    pings, ping_mins, ping_p90s = (column("i", edge_count) for _ in range(3))
+    samples = column("I", edge_count)
+    assert offset == len(bundle)
+
+    def ping(value):
+        return None if value == NO_PING else value
+
+    entries = []
+    for i in range(edge_count):
+        entry = {"pingTime": ping(pings[i]), "origin_geo": nodes[origins[i]], "destination_geo": nodes[destinations[i]]}
+        if samples[i] > 0:
+            entry.update(pingMin=ping(ping_mins[i]), pingP90=ping(ping_p90s[i]), samples=samples[i])
+        entries.append(entry)
+    return nodes, entries
+
+
+def expected_entries():
+    """What the bundle keeps of ENTRIES: located hops, a location's first geo, empty strings for None"""
+    def located(geo):
+        first = next(g for e in ENTRIES for g in (e.get("origin_geo"), e.get("destination_geo"))
+                     if g and (g["latitude"], g["longitude"]) == (geo["latitude"], geo["longitude"]))
+        return {key: (first[key] if first[key] is not None else "") for key in first}
+
+    kept = []
+    for entry in ENTRIES[:3]:
+        kept_entry = {"pingTime": entry["pingTime"], "origin_geo": located(entry["origin_geo"]),
+                      "destination_geo": located(entry["destination_geo"])}
+        kept_entry.update({key: entry[key] for key in ("pingMin", "pingP90", "samples") if key in entry})
+        kept.append(kept_entry)
+    return kept
+
+
+def test_bundle_round_trip():
+    bundle, node_count, edge_count = build_bundle(ENTRIES)
+    nodes, entries = read_bundle(bundle)
+    assert (node_count, edge_count) == (3, 3) == (len(nodes), len(entries))
+    assert entries == expected_entries()
+    # Locations are shared by the hops that reach them
+    assert nodes == [PARIS, TOKYO, dict(NOWHERE, region="", city="")]
+
+
+def test_empty_bundle():
+    bundle, node_count, edge_count = build_bundle([])
+    assert (node_count, edge_count) == (0, 0)
+    assert read_bundle(bundle) == ([], [])
+
+
+@pytest.fixture
+def results_file(tmp_path):
+    filename = str(tmp_path / "results.json")
+    results_io.save_results(ENTRIES, filename)
+    return filename
+
+
+def test_export_writes_the_bundle_manifest_and_copies(tmp_path, results_file):
+    out_dir = str(tmp_path / "data")
+    manifest = export_bundle.export_bundle(results_file, out_dir)
+    with open(os.path.join(out_dir, manifest["file"]), "rb") as f:
+        bundle = f.read()
+    digest = hashlib.sha256(bundle).hexdigest()
+    assert manifest["file"] == f"results-{digest[:16]}.bin" and manifest["sha256"] == digest
+    assert (manifest["bytes"], manifest["nodes"], manifest["edges"]) == (len(bundle), 3, 3)
+    with open(os.path.join(out_dir, manifest["encodings"]["gzip"]), "rb") as f:
+        assert gzip.decompress(f.read()) == bundle
+    with open(os.path.join(out_dir, export_bundle.MANIFEST_FILE), encoding="utf-8") as f:
+        assert json.load(f) == manifest
+    assert read_bundle(bundle)[1] == expected_entries()
+
+
+def test_export_keeps_only_the_current_and_previous_bundles(tmp_path, results_file):
+    out_dir = str(tmp_path / "data")
+    names = []
+    for ping in (5, 6, 7):
+        results_io.save_results([dict(ENTRIES[0], pingTime=ping)] + ENTRIES[1:], results_file)
+        names.append(export_bundle.export_bundle(results_file, out_dir)["file"])
+    assert len(set(names)) == 3
+    listed = sorted(name for name in os.listdir(out_dir) if name.startswith("results-"))
+    assert listed == sorted(name + suffix for name in names[1:] for suffix in ("", ".gz")
+                            + ((".br",) if export_bundle.brotli else ()))
+    # The same data gives the same file
+    assert export_bundle.export_bundle(results_file, out_dir)["file"] == names[-1]
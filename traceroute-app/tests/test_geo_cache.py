@@ -0,0 +1,100 @@
+from geo_cache import GeoCache, ip_to_int
+
+DAY = 86400
+PARIS = {"country": "France", "region": "IDF", "city": "Paris", "latitude": 48.85, "longitude": 2.35}
+LYON = {"country": "France", "region": "ARA", "city": "Lyon", "latitude": 45.76, "longitude": 4.84}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def cache(tmp_path, clock, **options) -> GeoCache:
+    return GeoCache(str(tmp_path / "geo_cache.db"), ttl_days=30, negative_ttl_days=1, clock=clock, **options)
+
+
+def test_lookups_expire_after_their_ttl(tmp_path):
+    clock = Clock()
+    geo_cache = cache(tmp_path, clock)
+    geo_cache.store("10.0.0.1", PARIS)
+    geo_cache.store("10.0.0.2", None)
+    assert geo_cache.lookup("10.0.0.1") == (True, PARIS)
+    assert geo_cache.lookup("10.0.0.2") == (True, None)
+    assert geo_cache.lookup("10.0.0.3") == (False, None)
+
+    # A failed lookup is retried after a day, a successful one after 30
+    clock.now += DAY
+    assert geo_cache.lookup("10.0.0.2") == (False, None)
+    assert geo_cache.lookup("10.0.0.1") == (True, PARIS)
+    clock.now += 29 * DAY - 1
+    assert geo_cache.lookup("10.0.0.1") == (True, PARIS)
+    clock.now += 1
+    assert geo_cache.lookup("10.0.0.1") == (False, None)
+    assert geo_cache.stats == {"hits": 3, "negative_hits": 1, "prefix_hits": 0, "misses": 1, "expired": 2,
+                               "evicted": 0}
+
+    # Storing again starts the TTL over
+    geo_cache.store("10.0.0.1", LYON)
+    assert geo_cache.lookup("10.0.0.1") == (True, LYON)
+    geo_cache.close()
+
+
+def test_lookups_survive_a_restart(tmp_path):
+    clock = Clock()
+    geo_cache = cache(tmp_path, clock)
+    geo_cache.store("10.0.0.1", PARIS)
+    geo_cache.close()
+    geo_cache = cache(tmp_path, clock)
+    assert geo_cache.lookup("10.0.0.1") == (True, PARIS)
+    geo_cache.close()
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    clock = Clock()
+    geo_cache = cache(tmp_path, clock, max_entries=3)
+    for last in range(1, 6):
+        clock.now += 1
+        geo_cache.store(f"10.0.0.{last}", PARIS)
+    # Using the oldest two keeps them
+    for last in (1, 2):
+        clock.now += 1
+        geo_cache.lookup(f"10.0.0.{last}")
+    geo_cache.close()
+
+    geo_cache = cache(tmp_path, clock, max_entries=3)
+    assert [geo_cache.lookup(f"10.0.0.{last}")[0] for last in range(1, 6)] == [True, True, False, False, True]
+    geo_cache.close()
+
+
+def test_prefix_lookup_answers_from_the_same_24(tmp_path):
+    clock = Clock()
+    geo_cache = cache(tmp_path, clock)
+    geo_cache.store("10.0.1.7", None)
+    assert geo_cache.lookup_prefix("10.0.1.8") is None
+    geo_cache.store("10.0.1.9", PARIS)
+    clock.now += 1
+    geo_cache.store("10.0.1.255", LYON)
+    geo_cache.store("10.0.2.0", PARIS)
+
+    # The most recently used neighbour wins; failed lookups and other /24s don't count
+    assert geo_cache.lookup_prefix("10.0.1.8") == LYON
+    clock.now += 1
+    geo_cache.lookup("10.0.1.9")
+    assert geo_cache.lookup_prefix("10.0.1.0") == PARIS
+    assert geo_cache.lookup_prefix("10.0.0.255") is None
+    assert geo_cache.lookup_prefix("not an ip") is None
+    # Stale neighbours aren't used either
+    clock.now += 30 * DAY
+    assert geo_cache.lookup_prefix("10.0.1.8") is None
+    assert geo_cache.stats["prefix_hits"] == 2
+    geo_cache.close()
+
+
+def test_ip_to_int():
+    assert ip_to_int("1.2.3.4") == 0x01020304
+    assert ip_to_int("255.255.255.255") == 0xFFFFFFFF
+    assert [ip_to_int(ip) for ip in ("256.0.0.1", "1.2.3", "a.b.c.d", "-1.0.0.0", "")] == [None] * 5
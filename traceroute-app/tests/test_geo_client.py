@@ -0,0 +1,149 @@
+import threading
+
+import pytest
+import requests
+
+import geo_client
+from geo_client import GeoClient, GeoLookupError, TokenBucket
+
+
+class Response:
+    def __init__(self, status_code: int, data=None):
+        self.status_code = status_code
+        self.data = data
+
+    def json(self):
+        if self.data is None:
+            raise ValueError("not JSON")
+        return self.data
+
+
+def found(ip: str) -> Response:
+    return Response(200, {"success": True, "country": "C", "region": "R", "city": ip, "latitude": 1.0,
+                          "longitude": 2.0})
+
+
+class StubSession:
+    """Answers each URL from its own script of responses (or exceptions to raise), then with found()"""
+
+    def __init__(self, scripts=None):
+        self.scripts = {url: list(script) for url, script in (scripts or {}).items()}
+        self.urls = []
+        self.lock = threading.Lock()
+
+    def get(self, url, timeout):
+        with self.lock:
+            self.urls.append(url)
+            script = self.scripts.get(url)
+            answer = script.pop(0) if script else found(url)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    def close(self):
+        pass
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def backoffs(monkeypatch):
+    """The backoff sleeps between retries, which don't really sleep"""
+    slept = []
+    monkeypatch.setattr(geo_client.time, "sleep", slept.append)
+    return slept
+
+
+def client_with(session, **options) -> GeoClient:
+    client = GeoClient(endpoint="{ip}", rate=1000, burst=1000, **options)
+    client.session = session
+    return client
+
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+    clock = FakeClock()
+    # Waits of 1/4 s keep the fake clock exact
+    bucket = TokenBucket(rate=4, capacity=3, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.slept == []
+    for _ in range(10):
+        bucket.acquire()
+    assert clock.slept == [0.25] * 10 and clock.now == 100.0 + 10 / 4
+    # Idle time refills the bucket up to its capacity only
+    clock.now += 60
+    clock.slept.clear()
+    for _ in range(4):
+        bucket.acquire()
+    assert clock.slept == [0.25]
+
+
+def test_retries_429_and_5xx_with_backoff(backoffs):
+    session = StubSession({"10.0.0.1": [Response(429), Response(503), Response(500, {"success": True})]})
+    client = client_with(session, retries=3)
+    # The 500 carried a body, but only a success counts
+    assert client.lookup("10.0.0.1")["city"] == "10.0.0.1"
+    assert session.urls == ["10.0.0.1"] * 4
+    assert backoffs == [1.0, 2.0, 4.0]
+
+
+def test_retries_connection_errors_and_bad_bodies(backoffs):
+    session = StubSession({"10.0.0.1": [requests.ConnectionError("reset"), Response(200)]})
+    assert client_with(session).lookup("10.0.0.1")["city"] == "10.0.0.1"
+    assert backoffs == [1.0, 2.0]
+
+
+def test_gives_up_after_the_retries(backoffs):
+    session = StubSession({"10.0.0.1": [Response(502)] * 3})
+    with pytest.raises(GeoLookupError, match="10.0.0.1: HTTP 502"):
+        client_with(session, retries=2).lookup("10.0.0.1")
+    assert len(session.urls) == 3
+
+
+def test_client_errors_and_failed_lookups_are_not_retried(backoffs):
+    session = StubSession({"10.0.0.1": [Response(404, {"success": False, "message": "reserved range"})]})
+    assert client_with(session).lookup("10.0.0.1") is None
+    assert session.urls == ["10.0.0.1"] and backoffs == []
+
+
+def test_lookup_many_pairs_each_ip_with_its_answer(backoffs):
+    ips = [f"10.0.0.{i}" for i in range(8)]
+    done = {ip: threading.Event() for ip in ips}
+
+    class ReversedSession(StubSession):
+        """Each lookup waits for the next IP's to finish, so they complete in reverse order"""
+
+        def get(self, url, timeout):
+            position = ips.index(url)
+            if position + 1 < len(ips):
+                assert done[ips[position + 1]].wait(5), "lookups didn't run concurrently"
+            response = super().get(url, timeout)
+            done[url].set()
+            return response
+
+    session = ReversedSession({"10.0.0.3": [Response(503)] * 4, "10.0.0.5": [Response(200, {"success": False})]})
+    client = client_with(session, workers=len(ips))
+    results = list(client.lookup_many(ips + ips[::2]))
+
+    # Every distinct IP once, whatever order they complete in
+    assert sorted(ip for ip, _, _ in results) == ips
+    for ip, geo, ok in results:
+        if ip == "10.0.0.3":
+            assert (geo, ok) == (None, False)
+        elif ip == "10.0.0.5":
+            assert (geo, ok) == (None, True)
+        else:
+            assert ok and geo["city"] == ip
+    assert sorted(set(session.urls)) == ips
+    assert list(client.lookup_many([])) == []
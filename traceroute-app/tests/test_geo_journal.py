@@ -0,0 +1,70 @@
+import json
+import os
+
+import results_io
+from benchmarks.generate_synthetic import generate
+from offline_geo import OfflineGeoProvider
+
+JOURNALED_GEO = {"country": "Journaled", "region": "", "city": "", "latitude": 1.5, "longitude": 2.5}
+
+
+class CountingProvider(OfflineGeoProvider):
+    """The offline provider, keeping the IPs it was asked for"""
+
+    def __init__(self, csv_filename: str):
+        super().__init__(csv_filename)
+        self.asked = []
+
+    def lookup_many(self, ips):
+        ips = list(ips)
+        self.asked += ips
+        return super().lookup_many(ips)
+
+
+def test_journal_round_trip_ignores_a_torn_last_line(geoloc, tmp_path):
+    filename = str(tmp_path / "results.geo.journal")
+    journal = geoloc.GeoJournal(filename)
+    journal.record("10.0.0.1", JOURNALED_GEO)
+    journal.record("10.0.0.2", None)
+    journal.close()
+    with open(filename, "a", encoding="utf-8") as f:
+        f.write('{"ip": "10.0.0.3", "geo": {"coun')
+    assert geoloc.load_journal(filename) == {"10.0.0.1": JOURNALED_GEO, "10.0.0.2": None}
+    # Appending after a torn line still gives readable records
+    journal = geoloc.GeoJournal(filename)
+    journal.record("10.0.0.3", JOURNALED_GEO)
+    journal.close()
+    assert geoloc.load_journal(filename)["10.0.0.1"] == JOURNALED_GEO
+    assert geoloc.load_journal(str(tmp_path / "missing")) == {}
+
+
+def test_interrupted_run_resumes_from_the_journal(geoloc, tmp_path, monkeypatch, capsys):
+    generate(300, str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    raw = results_io.load_results("results.json")
+    ips = list(dict.fromkeys(ip for entry in raw for ip in (entry["origin"], entry["destination"]) if ip != "unknown"))
+
+    # The interrupted run had looked up the first half of the IPs, the last one only partly written.
+    # Its answers are told apart by the city, the coordinates are the database's
+    client = CountingProvider("ip-ranges.csv")
+    journaled, torn = ips[:len(ips) // 2], ips[len(ips) // 2]
+    journaled_geo = {ip: dict(client.lookup(ip), city="Journaled") for ip in journaled + [torn]}
+    with open(geoloc.JOURNAL_FILE, "w", encoding="utf-8") as f:
+        for ip in journaled:
+            f.write(json.dumps({"ip": ip, "geo": journaled_geo[ip]}) + "\n")
+        f.write(json.dumps({"ip": torn, "geo": journaled_geo[torn]})[:20])
+
+    geoloc.process_results(client=client, full=True)
+    assert f"Resuming with {len(journaled)} lookup(s) from {geoloc.JOURNAL_FILE}" in capsys.readouterr().out
+    assert sorted(client.asked) == sorted(ips[len(ips) // 2:])
+
+    located = {}
+    for entry in results_io.load_results("results.json"):
+        for ip_key, geo_key in geoloc.GEO_FIELDS:
+            if geo_key in entry:
+                located[entry[ip_key]] = entry[geo_key]
+    kept = [ip for ip in journaled if ip in located]
+    assert kept and all(located[ip]["city"] == "Journaled" for ip in kept)
+    assert located[torn] == client.lookup(torn)
+    # The saved results hold every lookup now
+    assert not os.path.exists(geoloc.JOURNAL_FILE)
@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+import results_io
+from benchmarks.generate_synthetic import generate
+from offline_geo import OfflineGeoProvider
+
+FIRST_RUN = 6000
+
+
+@pytest.fixture
+def raw(tmp_path, monkeypatch):
+    """A synthetic results.json as unix.py exports it, without geolocation; runs happen in its directory"""
+    generate(8000, str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    return results_io.load_results("results.json")
+
+
+def run(geoloc, capsys, **options) -> str:
+    geoloc.process_results(client=OfflineGeoProvider("ip-ranges.csv"), **options)
+    return capsys.readouterr().out
+
+
+def first_run(geoloc, capsys, raw):
+    results_io.save_results(raw[:FIRST_RUN], "results.json")
+    run(geoloc, capsys)
+    return results_io.load_results("results.json")
+
+
+def tamper(geoloc, results) -> int:
+    """Zero the ping of a processed entry the clamp would raise; returns its index"""
+    for i, entry in enumerate(results):
+        coordinates = geoloc._entry_coordinates(entry)
+        if entry["pingTime"] and coordinates and geoloc.calculate_distance(*coordinates) > 1e5:
+            entry["pingTime"] = 0
+            results_io.save_results(results, "results.json")
+            return i
+    raise AssertionError("no entry to tamper with")
+
+
+def test_watermark_and_resume(geoloc, capsys, raw):
+    processed = first_run(geoloc, capsys, raw)
+    state = geoloc.load_state()
+    assert state == {
+        "processed": len(processed),
+        "last_key": geoloc._entry_key(processed[-1]),
+        "geozones_hash": geoloc._file_hash("geozones.json"),
+        "settings_hash": geoloc._settings_hash(),
+    }
+    assert len(processed) < FIRST_RUN  # Some long hops were filtered out
+
+    # unix.py appends new entries: only those are processed, and the result matches a full run
+    results_io.save_results(processed + raw[FIRST_RUN:], "results.json")
+    out = run(geoloc, capsys)
+    assert f"Incremental run: {len(raw) - FIRST_RUN} new entries after {len(processed)} already processed" in out
+    incremental = results_io.load_results("results.json")
+    assert incremental[:len(processed)] == processed
+    assert geoloc.load_state()["processed"] == len(incremental)
+
+    with open("results.json", "rb") as f:
+        saved = f.read()
+    assert "Nothing new to process." in run(geoloc, capsys)
+    with open("results.json", "rb") as f:
+        assert f.read() == saved
+
+    results_io.save_results(raw, "results.json")
+    os.remove(geoloc.STATE_FILE)
+    run(geoloc, capsys)
+    assert results_io.load_results("results.json") == incremental
+
+
+@pytest.mark.parametrize("drop", ["first", "last"])
+def test_rewritten_results_are_reprocessed(geoloc, capsys, raw, drop):
+    processed = first_run(geoloc, capsys, raw)
+    index = tamper(geoloc, processed)
+    # Without the first entry the watermark's key no longer matches, without the last it's past the end
+    if drop == "first":
+        rewritten, index = processed[1:] + raw[FIRST_RUN:], index - 1
+    else:
+        rewritten = processed[:-1]
+    results_io.save_results(rewritten, "results.json")
+    assert "was rewritten since the last run, reprocessing every entry" in run(geoloc, capsys)
+    results = results_io.load_results("results.json")
+    assert all("destination_geo" in entry for entry in results)
+    assert results[index]["pingTime"] > 0
+
+
+@pytest.mark.parametrize("change", ["geozones", "settings"])
+def test_changed_geozones_or_settings_reprocess_everything(geoloc, capsys, monkeypatch, raw, change):
+    processed = first_run(geoloc, capsys, raw)
+    index = tamper(geoloc, processed)
+    assert "Nothing new to process." in run(geoloc, capsys)
+    assert results_io.load_results("results.json")[index]["pingTime"] == 0
+
+    if change == "geozones":
+        with open("geozones.json", "a", encoding="utf-8") as f:
+            f.write("\n")
+        message = "geozones.json changed since the last run, reprocessing every entry"
+    else:
+        monkeypatch.setattr(geoloc, "MAX_LAND_HOP_DISTANCE_KM", geoloc.MAX_LAND_HOP_DISTANCE_KM + 1)
+        message = "Distance/ping settings changed since the last run, reprocessing every entry"
+    assert message in run(geoloc, capsys)
+    assert results_io.load_results("results.json")[index]["pingTime"] > 0
+    # The new hashes are the watermark's from now on
+    assert "Nothing new to process." in run(geoloc, capsys)
+
+
+def test_full_reprocesses_everything(geoloc, capsys, raw):
+    processed = first_run(geoloc, capsys, raw)
+    index = tamper(geoloc, processed)
+    out = run(geoloc, capsys, full=True)
+    assert "Incremental run" not in out and "Nothing new to process." not in out
+    results = results_io.load_results("results.json")
+    assert results[index]["pingTime"] > 0
+    assert geoloc.load_state()["processed"] == len(results)
@@ -0,0 +1,115 @@
+import json
+import mmap
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+import results_io
+from benchmarks.generate_synthetic import generate
+from conftest import APP_DIR
+
+FIRST_RUN = 6000
+
+
+def ip_geoloc(directory: str, *options: str) -> str:
+    completed = subprocess.run(
+        [sys.executable, os.path.join(APP_DIR, "ip-geoloc.py"), "--provider", "offline", "--geo-db", "ip-ranges.csv",
+         *options], cwd=directory, capture_output=True, text=True, check=True,
+    )
+    return completed.stdout
+
+
+def read(directory: str, filename: str) -> bytes:
+    with open(os.path.join(directory, filename), "rb") as f:
+        return f.read()
+
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("synthetic"))
+    generate(8000, directory)
+    return directory
+
+
+def copies(dataset, tmp_path, jobs):
+    """A copy of the dataset per process count"""
+    directories = {}
+    for count in jobs:
+        directories[count] = str(tmp_path / f"jobs-{count}")
+        shutil.copytree(dataset, directories[count])
+    return directories
+
+
+@pytest.mark.parametrize("jobs", [2, 3])
+def test_jobs_match_one_process(dataset, tmp_path, jobs):
+    directories = copies(dataset, tmp_path, [1, jobs])
+    outputs = {count: ip_geoloc(directory, "--jobs", str(count)) for count, directory in directories.items()}
+    assert "using one process" not in outputs[jobs]
+    assert outputs[jobs] == outputs[1]
+    for filename in ("results.json", "results.geo.state.json"):
+        assert read(directories[jobs], filename) == read(directories[1], filename)
+
+
+def test_jobs_resume_and_reclamp_like_one_process(dataset, tmp_path):
+    directories = copies(dataset, tmp_path, [1, 4])
+    raw = results_io.load_results(os.path.join(dataset, "results.json"))
+    for directory in directories.values():
+        results_io.save_results(raw[:FIRST_RUN], os.path.join(directory, "results.json"))
+        ip_geoloc(directory)
+        # unix.py appends new hops and records re-measured ones in the sidecar
+        processed = results_io.load_results(os.path.join(directory, "results.json"))
+        results_io.save_results(processed + raw[FIRST_RUN:], os.path.join(directory, "results.json"))
+        remeasured = [{"origin": e["origin"], "destination": e["destination"], "pingTime": 0, "pingMin": 0,
+                       "pingP90": 1, "samples": 2} for e in processed[::40]]
+        with open(os.path.join(directory, "results.json.remeasured"), "w", encoding="utf-8") as f:
+            json.dump(remeasured, f)
+
+    outputs = {count: ip_geoloc(directory, "--jobs", str(count)) for count, directory in directories.items()}
+    assert "Re-clamping" in outputs[1] and "Incremental run" in outputs[1]
+    assert outputs[4] == outputs[1]
+    for filename in ("results.json", "results.geo.state.json"):
+        assert read(directories[4], filename) == read(directories[1], filename)
+    assert not os.path.exists(os.path.join(directories[4], "results.json.remeasured"))
+
+
+@pytest.fixture
+def lines_file(tmp_path):
+    """A file of lines of every length from 0 to 40 bytes, mapped"""
+    data = b"".join(b"x" * (n % 41) + b"\n" for n in range(200)) + b"tail"
+    filename = tmp_path / "lines"
+    filename.write_bytes(data)
+    with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        yield data, mm
+
+
+@pytest.mark.parametrize("block", [7, 64, 1 << 24])
+def test_skip_lines_with_blocks_ending_mid_line(geoloc, monkeypatch, lines_file, block):
+    data, mm = lines_file
+    monkeypatch.setattr(geoloc, "SCAN_BLOCK_BYTES", block)
+    for start in range(0, len(data), 97):
+        for end in (len(data), len(data) - 3, start + 150):
+            end = min(end, len(data))
+            newlines = [i + 1 for i in range(start, end) if data[i:i + 1] == b"\n"]
+            for lines in range(len(newlines) + 2):
+                expected = (newlines[lines - 1], lines) if 0 < lines <= len(newlines) else \
+                    ((start, 0) if lines == 0 else (end, len(newlines)))
+                assert geoloc._skip_lines(mm, start, end, lines) == expected, (start, end, lines)
+            assert geoloc._skip_lines(mm, start, end, float("inf")) == (end, len(newlines))
+
+
+def test_chunks_are_whole_lines(geoloc, lines_file):
+    data, mm = lines_file
+    end = data.rfind(b"\n") + 1
+    line_starts = {0} | {i + 1 for i in range(end) if data[i:i + 1] == b"\n"}
+    for split in sorted(line_starts):
+        for count in (1, 3, 8, 50, 1000):
+            chunks = geoloc._split_chunks(mm, 0, end, split, count)
+            # Contiguous, cut at line starts only, and new from the split on
+            assert chunks[0][0] == 0 and chunks[-1][1] == end
+            assert all(a[1] == b[0] for a, b in zip(chunks, chunks[1:]))
+            assert {start for start, _, _ in chunks} <= line_starts
+            assert all(new == (start >= split) for start, _, new in chunks)
+            assert len(chunks) <= count + 1
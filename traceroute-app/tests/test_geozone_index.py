@@ -0,0 +1,76 @@
+import os
+import random
+
+import pytest
+
+from conftest import APP_DIR
+
+# A square on grid-cell boundaries, a concave zone with horizontal and vertical edges, and one
+# crossing several cells, next to the shipped zones
+ZONES = [
+    {"id": "square", "name": "Square", "polygon": [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]},
+    {"id": "notch", "name": "Notch", "polygon": [[20, 20], [40, 20], [40, 40], [30, 30], [20, 40]]},
+    {"id": "slanted", "name": "Slanted", "polygon": [[-35.5, -12.25], [-5.75, -30], [-14.2, 9.9], [-40, 3.3]]},
+]
+
+
+@pytest.fixture(scope="module")
+def zones(geoloc):
+    default, geoloc.GEOZONES_FILE = geoloc.GEOZONES_FILE, os.path.join(APP_DIR, "geozones.json")
+    try:
+        return ZONES + geoloc.load_geozones()
+    finally:
+        geoloc.GEOZONES_FILE = default
+
+
+def edge_points(zones):
+    """Every vertex, and points along every edge"""
+    points = []
+    for zone in zones:
+        polygon = zone["polygon"]
+        for (x1, y1), (x2, y2) in zip(polygon, polygon[1:] + polygon[:1]):
+            points += [(y1 + (y2 - y1) * t, x1 + (x2 - x1) * t) for t in (0, 0.25, 0.5, 1 / 3, 1)]
+    return points
+
+
+def grid_points():
+    """Points on grid-cell lines and corners, and just either side of them"""
+    step = 10.0
+    points = []
+    for lat in range(-90, 91, 10):
+        for lon in range(-180, 181, 10):
+            points.append((float(lat), float(lon)))
+            points += [(lat + 1e-9, lon - 1e-9), (lat + step / 2, float(lon)), (float(lat), lon + step / 2)]
+    return points
+
+
+def random_points(count=3000, seed=11):
+    rng = random.Random(seed)
+    return [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(count)]
+
+
+@pytest.mark.parametrize("points", [random_points(), edge_points(ZONES), grid_points()],
+                         ids=["random", "edges", "grid"])
+def test_index_matches_linear_scan(geoloc, zones, points):
+    points = points + edge_points(zones)
+    expected = [geoloc.find_geozone_for_point(lat, lon, zones) for lat, lon in points]
+    assert [geoloc.GeozoneIndex(zones).find(lat, lon) for lat, lon in points] == expected
+    assert geoloc.GeozoneIndex(zones).find_many(points) == expected
+    # Found zones come back from the memo, in the order asked for
+    index = geoloc.GeozoneIndex(zones)
+    assert index.find_many(points[::-1] + points) == expected[::-1] + expected
+
+
+def test_find_many_without_numpy(geoloc, zones, monkeypatch):
+    points = random_points(500) + edge_points(zones) + grid_points()
+    expected = [geoloc.find_geozone_for_point(lat, lon, zones) for lat, lon in points]
+    monkeypatch.setattr(geoloc, "np", None)
+    assert geoloc.GeozoneIndex(zones).find_many(points) == expected
+
+
+def test_points_on_the_boundary_are_inside(geoloc, zones):
+    index = geoloc.GeozoneIndex(zones)
+    assert index.find(0.0, 0.0) == ("square", "Square")
+    assert index.find(10.0, 10.0) == ("square", "Square")
+    assert index.find(30.0, 30.0) == ("notch", "Notch")
+    assert index.find(35.0, 30.0) is None
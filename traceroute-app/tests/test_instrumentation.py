@@ -0,0 +1,114 @@
+import json
+import re
+
+import pytest
+
+import instrumentation
+from instrumentation import Histogram, Metrics, to_prometheus, write_report
+
+SAMPLE_LINE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*\{(?:[a-z]+="[^"]*",?)+\} -?[0-9.]+(?:e[+-]?[0-9]+)?$')
+
+
+def test_histogram_buckets_are_cumulative_and_inclusive():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 1.0, 3.0):
+        histogram.observe(value)
+    assert histogram.to_dict() == {"count": 5, "sum": 4.65, "min": 0.05, "max": 3.0,
+                                   "buckets": {"0.1": 2, "1.0": 4, "+Inf": 5}}
+    assert Histogram().to_dict()["min"] is None
+
+
+def test_report_counts_stages_and_counters():
+    metrics = Metrics()
+    for seconds in (0.002, 0.2):
+        metrics.observe("parse", seconds)
+    with metrics.timer("save"):
+        pass
+    metrics.count("clamped", 3)
+    metrics.count("clamped")
+    metrics.count("cache hits", 0.5)
+    report = metrics.report("unix")
+    assert report["script"] == "unix" and report["duration"] >= 0
+    assert list(report["stages"]) == ["parse", "save"]
+    assert report["stages"]["parse"]["count"] == 2 and report["stages"]["parse"]["buckets"]["0.005"] == 1
+    assert report["stages"]["save"]["count"] == 1
+    assert report["counters"] == {"cache hits": 0.5, "clamped": 4}
+
+
+REPORT = {
+    "script": "ip-geoloc",
+    "started": 1700000000.5,
+    "duration": 2.25,
+    "stages": {"geolocate": {"count": 2, "sum": 1.5, "min": 0.5, "max": 1.0,
+                             "buckets": {"0.5": 1, "1.0": 2, "+Inf": 2}}},
+    "counters": {"clamped": 3, "geo_cache_hits": 12.0, "odd-name.x": 1},
+}
+
+
+def test_prometheus_text():
+    assert to_prometheus(REPORT) == """\
+# HELP traceroute_run_duration_seconds How long the last run took
+# TYPE traceroute_run_duration_seconds gauge
+traceroute_run_duration_seconds{script="ip-geoloc"} 2.25
+# HELP traceroute_run_timestamp_seconds When the last run started
+# TYPE traceroute_run_timestamp_seconds gauge
+traceroute_run_timestamp_seconds{script="ip-geoloc"} 1700000000.5
+# HELP traceroute_stage_duration_seconds Time spent per pass of each stage
+# TYPE traceroute_stage_duration_seconds histogram
+traceroute_stage_duration_seconds_bucket{script="ip-geoloc",stage="geolocate",le="0.5"} 1
+traceroute_stage_duration_seconds_bucket{script="ip-geoloc",stage="geolocate",le="1.0"} 2
+traceroute_stage_duration_seconds_bucket{script="ip-geoloc",stage="geolocate",le="+Inf"} 2
+traceroute_stage_duration_seconds_sum{script="ip-geoloc",stage="geolocate"} 1.5
+traceroute_stage_duration_seconds_count{script="ip-geoloc",stage="geolocate"} 2
+# TYPE traceroute_clamped_total counter
+traceroute_clamped_total{script="ip-geoloc"} 3
+# TYPE traceroute_geo_cache_hits_total counter
+traceroute_geo_cache_hits_total{script="ip-geoloc"} 12
+# TYPE traceroute_odd_name_x_total counter
+traceroute_odd_name_x_total{script="ip-geoloc"} 1
+"""
+
+
+def test_prometheus_text_of_a_real_run_is_well_formed():
+    metrics = Metrics()
+    for seconds in (0.0005, 0.01, 0.7, 200.0):
+        metrics.observe("trace", seconds)
+    metrics.count("hops", 42)
+    text = to_prometheus(metrics.report("unix"))
+    samples = [line for line in text.splitlines() if not line.startswith("#")]
+    assert all(SAMPLE_LINE.match(line) for line in samples), samples
+    buckets = [int(line.rsplit(" ", 1)[1]) for line in samples if "_bucket{" in line]
+    assert buckets == sorted(buckets) and buckets[-1] == 4
+    assert len(buckets) == len(instrumentation.DURATION_BUCKETS) + 1
+
+
+@pytest.mark.parametrize("filename", ["report.json", "report.prom"])
+def test_write_report(tmp_path, filename):
+    path = tmp_path / filename
+    write_report(REPORT, str(path))
+    text = path.read_text(encoding="utf-8")
+    assert text == (to_prometheus(REPORT) if filename.endswith(".prom") else json.dumps(REPORT, indent=2))
+    assert [p.name for p in tmp_path.iterdir()] == [filename]
+
+
+def test_run_report_writes_the_metrics_file_once(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(instrumentation, "metrics", Metrics())
+    filename = str(tmp_path / "unix.prom")
+    with instrumentation.run_report("unix", ["unix.py", "--metrics", filename]) as metrics:
+        metrics.count("hops", 7)
+        with metrics.timer("parse"):
+            pass
+        # A script exiting through os._exit writes it early; the end of the run doesn't again
+        instrumentation.flush_report()
+        metrics.count("hops", 1)
+    assert capsys.readouterr().out.count(f"Run report written to {filename}") == 1
+    text = (tmp_path / "unix.prom").read_text(encoding="utf-8")
+    assert 'traceroute_hops_total{script="unix"} 7\n' in text
+    assert 'traceroute_stage_duration_seconds_count{script="unix",stage="parse"} 1\n' in text
+
+
+def test_run_report_without_metrics_writes_nothing(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    with instrumentation.run_report("analysis", ["analysis.py"]):
+        pass
+    assert list(tmp_path.iterdir()) == [] and capsys.readouterr().out == ""
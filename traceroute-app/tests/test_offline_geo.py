@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+import offline_geo
+from offline_geo import OfflineGeoDatabase
+
+CSV = """start,end,country,region,city,latitude,longitude
+0.0.0.0,0.255.255.255,Z,,Zero,0,0
+10.0.0.0,10.0.0.127,A,Ra,Alpha,1.5,2.5
+10.0.0.128,10.0.0.255,B,Rb,Beta,-3,4
+167772672,167772927,C,Rc,Gamma,5,6
+10.0.5.0,bad,D,,,0,0
+10.0.6.0,10.0.6.255,E,,,north,0
+short,row
+255.255.255.0,255.255.255.255,T,,Top,9,9
+"""
+
+EXPECTED = {
+    "0.0.0.0": "Zero", "0.255.255.255": "Zero", "1.0.0.0": None,
+    "9.255.255.255": None, "10.0.0.0": "Alpha", "10.0.0.127": "Alpha", "10.0.0.128": "Beta",
+    "10.0.0.255": "Beta", "10.0.1.0": None,
+    # 167772672-167772927 is 10.0.2.0-10.0.2.255
+    "10.0.2.0": "Gamma", "10.0.2.255": "Gamma", "10.0.3.0": None,
+    # Rows with an unparseable address or coordinate are skipped
+    "10.0.5.1": None, "10.0.6.1": None,
+    "255.255.254.255": None, "255.255.255.0": "Top", "255.255.255.255": "Top",
+    "256.0.0.1": None, "10.0.0": None, "unknown": None,
+}
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    filename = tmp_path / "ip-ranges.csv"
+    filename.write_text(CSV, encoding="utf-8")
+    return str(filename)
+
+
+def cities(geos):
+    return [geo and geo["city"] for geo in geos]
+
+
+def test_range_boundaries(csv_file):
+    db = OfflineGeoDatabase.from_csv(csv_file)
+    assert len(db) == 5
+    assert cities(db.lookup(ip) for ip in EXPECTED) == list(EXPECTED.values())
+    assert db.lookup("10.0.0.1") == {"country": "A", "region": "Ra", "city": "Alpha", "latitude": 1.5,
+                                     "longitude": 2.5}
+
+
+@pytest.mark.parametrize("numpy", [True, False])
+def test_lookup_many_matches_lookup(csv_file, monkeypatch, numpy):
+    if not numpy:
+        monkeypatch.setattr(offline_geo, "np", None)
+    db = OfflineGeoDatabase.from_csv(csv_file)
+    ips = list(EXPECTED) * 2
+    assert cities(db.lookup_many(ips)) == list(EXPECTED.values()) * 2
+    assert db.lookup_many([]) == []
+
+
+def test_index_is_used_until_the_csv_changes(csv_file, monkeypatch):
+    index_file = csv_file + ".idx"
+    db = OfflineGeoDatabase.load(csv_file)
+    assert os.path.exists(index_file)
+
+    # An index as new as the CSV is loaded without parsing it
+    def no_parsing(filename):
+        raise AssertionError("parsed the CSV")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(OfflineGeoDatabase, "from_csv", classmethod(lambda cls, filename: no_parsing(filename)))
+        indexed = OfflineGeoDatabase.load(csv_file)
+    assert indexed.strings == db.strings
+    assert cities(indexed.lookup(ip) for ip in EXPECTED) == list(EXPECTED.values())
+
+    # Rewriting the CSV (same size, new mtime) rebuilds it
+    with open(csv_file, "w", encoding="utf-8") as f:
+        f.write(CSV.replace("Alpha", "Omega"))
+    stat = os.stat(csv_file)
+    os.utime(csv_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert OfflineGeoDatabase.load(csv_file).lookup("10.0.0.1")["city"] == "Omega"
+    assert OfflineGeoDatabase.load_index(index_file, csv_file).lookup("10.0.0.1")["city"] == "Omega"
+
+
+@pytest.mark.parametrize("damage", ["replaced", "columns cut", "strings cut"])
+def test_unreadable_index_is_rebuilt(csv_file, damage):
+    index_file = csv_file + ".idx"
+    OfflineGeoDatabase.load(csv_file)
+    with open(index_file, "rb") as f:
+        data = f.read()
+    with open(index_file, "wb") as f:
+        f.write({"replaced": b"not an index", "columns cut": data[:len(data) // 2], "strings cut": data[:-3]}[damage])
+    assert OfflineGeoDatabase.load_index(index_file, csv_file) is None
+    assert cities(OfflineGeoDatabase.load(csv_file).lookup(ip) for ip in EXPECTED) == list(EXPECTED.values())
+    assert OfflineGeoDatabase.load_index(index_file, csv_file) is not None
@@ -0,0 +1,88 @@
+from replay_tracer import SyntheticNetwork
+from unix import (FIRST_HOP_FILTER, _extract_ip_from_line, columns_to_entries, format_results,
+                  parse_traceroute_line, parse_traceroute_outputs)
+
+# Outputs the batch parser must read exactly like the per-line one
+CORPUS = [
+    """traceroute to example.com (93.184.216.34), 30 hops max, 60 byte packets
+ 1  _gateway (192.168.1.1)  0.458 ms  0.442 ms  0.440 ms
+ 2  10.10.0.1 (10.10.0.1)  8.201 ms  8.190 ms  8.650 ms
+ 3  * * *
+ 4  ae-1.core.example.net (62.115.40.2)  12.5 ms *  11.49 ms
+ 5  93.184.216.34  20.010 ms  19.995 ms  20.002 ms
+""",
+    # -n output, a partial timeout and a line with a second responder
+    """traceroute to 8.8.8.8 (8.8.8.8), 30 hops max, 60 byte packets
+ 1  172.24.96.1  0.458 ms  0.442 ms  0.440 ms
+ 2  * 100.64.0.1  4.000 ms *
+ 3  72.14.204.1  9.1 ms  72.14.204.5  9.3 ms  9.2 ms
+ 4  * * *
+ 5  * * *
+ 6  8.8.8.8  14.000 ms  13.600 ms  13.500 ms
+""",
+    # Octets above 255 still make a hop, here and in the standalone lines
+    """traceroute to 300.1.2.3 (300.1.2.3), 30 hops max, 60 byte packets
+ 1  10.0.0.1  1.000 ms  1.000 ms  1.000 ms
+ 2  999.1.1.1  2.000 ms  2.000 ms  2.000 ms
+ 3  * 256.0.0.1 (256.0.0.1)  3.000 ms *
+ 4  300.1.2.3  4.500 ms  4.499 ms  4.498 ms
+""",
+    # Every probe timed out, blank and garbled lines
+    """traceroute to 1.1.1.1 (1.1.1.1), 30 hops max, 60 byte packets
+
+ 1  10.0.0.1  *  *  * ms
+ 2  10.0.0.2 (10.0.0.2)  * ms  * ms  * ms
+garbage 10.0.0.3
+""",
+    # Leading zeros, tabs, CRLF line ends, and two-probe lines a match mustn't complete from the next line
+    "traceroute to 10.0.0.9 (10.0.0.9), 30 hops max, 60 byte packets\r\n"
+    " 1  010.0.0.1  1.000 ms  1.000 ms  1.000 ms\r\n"
+    " 2\t10.0.0.2\t2.000 ms\t2.100 ms\t2.200 ms\r\n"
+    " 3  10.0.0.3  3.000 ms  3.100 ms\n"
+    "  4.000 ms\n"
+    " 4  10.0.0.4  4.000 ms  4.100 ms\n"
+    "\n"
+    " 5  10.0.0.9  5.500 ms  5.500 ms  5.500 ms",
+    "",
+] + [SyntheticNetwork(seed=3).output(f"target-{i}.example") for i in range(20)]
+
+
+def parse_by_line(output):
+    hops, standalone_ips = [], []
+    for line in output.split('\n'):
+        hop = parse_traceroute_line(line)
+        if hop:
+            hops.append(hop)
+        else:
+            ip = _extract_ip_from_line(line)
+            if ip:
+                standalone_ips.append(ip)
+    return hops, standalone_ips
+
+
+def test_batch_parser_matches_line_parser():
+    columns = parse_traceroute_outputs(CORPUS)
+    assert columns.trace_count == len(CORPUS)
+    for trace, output in enumerate(CORPUS):
+        hops, standalone_ips = parse_by_line(output)
+        assert columns.to_hops(trace) == hops, output
+        assert [ip for t, ip in columns.standalone if t == trace] == standalone_ips, output
+
+
+def test_octets_above_255_are_kept():
+    columns = parse_traceroute_outputs([CORPUS[2]])
+    assert [hop.ip for hop in columns.to_hops(0)] == ['10.0.0.1', '999.1.1.1', '300.1.2.3']
+
+
+def test_batch_entries_match_format_results():
+    expected = []
+    for output in CORPUS:
+        hops, standalone_ips = parse_by_line(output)
+        hops = [hop for hop in hops if hop.hop > FIRST_HOP_FILTER]
+        expected += [entry.model_dump() for entry in format_results(hops, standalone_ips)]
+    assert columns_to_entries(parse_traceroute_outputs(CORPUS)) == expected
+
+
+def test_leading_zeros_are_kept():
+    columns = parse_traceroute_outputs([CORPUS[4]])
+    assert columns.to_hops(0)[0].ip == '010.0.0.1'
@@ -0,0 +1,148 @@
+import copy
+import os
+
+import pytest
+
+import publish_delta
+import results_io
+from publish_delta import PATCH_FORMAT, Snapshot, apply_patch, load_manifest, load_published, publish
+
+
+def geo(city, lat, lon):
+    return {"country": "C", "region": "R", "city": city, "latitude": lat, "longitude": lon}
+
+
+def versions():
+    """results.json as it changes between runs: hops added, re-measured, removed and geolocated"""
+    first = [
+        {"origin": "unknown", "destination": "10.0.0.1", "pingTime": 1, "destination_geo": geo("A", 1.0, 1.0)},
+        {"origin": "10.0.0.1", "destination": "10.0.0.2", "pingTime": 5,
+         "origin_geo": geo("A", 1.0, 1.0), "destination_geo": None},
+        {"origin": "10.0.0.2", "destination": "10.0.0.3", "pingTime": None},
+    ]
+    second = copy.deepcopy(first) + [
+        {"origin": "10.0.0.3", "destination": "10.0.0.4", "pingTime": 9, "pingMin": 7, "pingP90": 12, "samples": 4,
+         "origin_geo": geo("B", 2.0, 2.0), "destination_geo": geo("C", 3.0, 3.0)},
+    ]
+    second[1]["pingTime"] = 6
+    third = copy.deepcopy(second)
+    del third[0]
+    # The failed lookup was retried, and the hop without one looked up
+    third[0]["destination_geo"] = geo("B", 2.0, 2.0)
+    third[1].update(origin_geo=geo("B", 2.0, 2.0), destination_geo=geo("C", 3.0, 3.0))
+    third[2].update(pingTime=10, samples=5)
+    fourth = copy.deepcopy(third) + [{"origin": "10.0.0.4", "destination": "10.0.0.1", "pingTime": 3}]
+    fourth[0]["destination_geo"] = geo("A2", 1.5, 1.0)
+    return [first, second, third, fourth]
+
+
+def same(a: Snapshot, b: Snapshot) -> bool:
+    return a.nodes == b.nodes and a.edges == b.edges
+
+
+def publish_version(tmp_path, entries, **options):
+    filename = str(tmp_path / "results.json")
+    results_io.save_results(entries, filename)
+    return publish(filename, str(tmp_path / "delta"), **options)
+
+
+def catch_up(out_dir, manifest, snapshot, version):
+    """What a visitor holding version does: apply the patches from it, or start over from the base"""
+    for entry in manifest["patches"]:
+        if entry["from"] == version:
+            apply_patch(snapshot, publish_delta._read_file(out_dir, entry))
+            version = entry["to"]
+    if version != manifest["head"]:
+        return load_published(out_dir, manifest), manifest["head"]
+    return snapshot, version
+
+
+def test_base_plus_patches_equals_the_snapshot(tmp_path):
+    out_dir = str(tmp_path / "delta")
+    cached = []
+    for number, entries in enumerate(versions(), 1):
+        manifest, patch = publish_version(tmp_path, entries)
+        assert manifest["head"] == number
+        current = Snapshot.from_entries(entries)
+        assert same(load_published(out_dir, manifest), current)
+        assert same(Snapshot.from_entries(load_published(out_dir, manifest).entries()), current)
+        if number > 1:
+            assert patch["format"] == PATCH_FORMAT and (patch["from"], patch["to"]) == (number - 1, number)
+            assert patch["edgeFields"][:3] == ["origin", "destination", "pingTime"]
+            assert [len(row) for row in patch["edges"]["added"] + patch["edges"]["changed"]] == \
+                [len(patch["edgeFields"])] * len(patch["edges"]["added"] + patch["edges"]["changed"])
+        # Every visitor, whichever version they have cached, ends up with this one
+        for version, snapshot in cached:
+            assert same(catch_up(out_dir, manifest, copy.deepcopy(snapshot), version)[0], current)
+        cached.append((number, current))
+
+    # Publishing the same results.json again writes nothing
+    assert publish_version(tmp_path, versions()[-1]) == (load_manifest(out_dir), None)
+    # Version 3: a failed lookup and a location replaced, the first hop removed
+    patch = publish_delta._read_file(out_dir, load_manifest(out_dir)["patches"][1])
+    assert patch["nodes"]["changed"] == [["10.0.0.2", geo("B", 2.0, 2.0)], ["10.0.0.3", geo("C", 3.0, 3.0)]]
+    assert patch["nodes"]["removed"] == [] and patch["edges"]["removed"] == [["unknown", "10.0.0.1"]]
+
+
+@pytest.fixture
+def no_auto_compaction(monkeypatch):
+    monkeypatch.setattr(publish_delta, "COMPACT_RATIO", 1e9)
+
+
+def test_visitors_behind_a_compacted_base_catch_up(tmp_path, no_auto_compaction):
+    out_dir = str(tmp_path / "delta")
+    data = versions()
+    for entries in data[:2]:
+        publish_version(tmp_path, entries)
+    manifest, _ = publish_version(tmp_path, data[2], compact=True)
+    assert manifest["base"]["version"] == manifest["head"] == 3
+    # The patches before the new base stay listed, and its files stay for visitors of the old manifest
+    assert [(entry["from"], entry["to"]) for entry in manifest["patches"]] == [(1, 2), (2, 3)]
+    assert os.path.exists(os.path.join(out_dir, "base-1.json"))
+
+    manifest, _ = publish_version(tmp_path, data[3])
+    assert manifest["base"]["version"] == 3 and manifest["head"] == 4
+    assert not os.path.exists(os.path.join(out_dir, "base-1.json"))
+    assert os.path.exists(os.path.join(out_dir, "patch-2.json.gz"))
+    current = Snapshot.from_entries(data[3])
+    # Rebuilding starts from the new base; a visitor from before it still only needs patches
+    assert same(load_published(out_dir, manifest), current)
+    for version in (1, 2, 3):
+        snapshot, caught_up = catch_up(out_dir, manifest, Snapshot.from_entries(data[version - 1]), version)
+        assert same(snapshot, current) and caught_up == 4
+
+    # Compacting with nothing new rewrites the base at the head, without a patch
+    manifest, patch = publish_version(tmp_path, data[3], compact=True)
+    assert patch is None and manifest["base"]["version"] == manifest["head"] == 4
+    assert same(load_published(out_dir, manifest), current)
+
+
+def test_patches_add_up_to_a_new_base(tmp_path, monkeypatch):
+    monkeypatch.setattr(publish_delta, "COMPACT_PATCHES", 2)
+    monkeypatch.setattr(publish_delta, "COMPACT_RATIO", 1e9)
+    bases = [publish_version(tmp_path, entries)[0]["base"]["version"] for entries in versions()]
+    assert bases == [1, 1, 3, 3]
+
+
+@pytest.mark.parametrize("damage", ["removed", "modified"])
+def test_broken_patch_chain_is_republished_as_a_base(tmp_path, capsys, no_auto_compaction, damage):
+    out_dir = str(tmp_path / "delta")
+    data = versions()
+    for entries in data[:3]:
+        publish_version(tmp_path, entries)
+    patch_file = os.path.join(out_dir, "patch-3.json")
+    if damage == "removed":
+        os.remove(patch_file)
+    else:
+        with open(patch_file, "ab") as f:
+            f.write(b" ")
+    with pytest.raises((OSError, ValueError)):
+        load_published(out_dir, load_manifest(out_dir))
+
+    manifest, patch = publish_version(tmp_path, data[3])
+    assert "Could not rebuild version 3" in capsys.readouterr().out
+    # Version 4 is a base no patch leads to: every visitor starts over from it
+    assert patch is None and manifest["head"] == manifest["base"]["version"] == 4 and manifest["patches"] == []
+    current = Snapshot.from_entries(data[3])
+    assert same(load_published(out_dir, manifest), current)
+    assert same(catch_up(out_dir, manifest, Snapshot.from_entries(data[1]), 2)[0], current)
@@ -0,0 +1,26 @@
+import results_io
+
+PARIS = {'country': 'FR', 'region': 'IDF', 'city': 'Paris', 'latitude': 48.85, 'longitude': 2.35}
+BERLIN = {'country': 'DE', 'region': 'BE', 'city': 'Berlin', 'latitude': 52.52, 'longitude': 13.4}
+
+# Geolocated hops, then hops appended since ip-geoloc last ran that share their IPs
+ENTRIES = [
+    {'origin': '10.0.0.1', 'destination': '10.0.0.2', 'pingTime': 3, 'origin_geo': PARIS, 'destination_geo': BERLIN},
+    {'origin': '10.0.0.2', 'destination': '10.0.0.3', 'pingTime': 5, 'origin_geo': BERLIN, 'destination_geo': None},
+    {'origin': '10.0.0.3', 'destination': '10.0.0.1', 'pingTime': 7},
+    {'origin': 'unknown', 'destination': '10.0.0.2', 'pingTime': None},
+    {'origin': '10.0.0.4', 'destination': '10.0.0.2', 'pingTime': 2, 'destination_geo': BERLIN},
+]
+
+
+def test_round_trip_keeps_hops_without_lookup():
+    normalized = results_io.to_normalized(ENTRIES)
+    assert results_io.from_normalized(normalized) == ENTRIES
+    assert [node[1] for node in normalized['nodes']] == [0, 1, None, results_io.NOT_LOOKED_UP]
+
+
+def test_marker_only_when_needed():
+    looked_up = ENTRIES[:2]
+    normalized = results_io.to_normalized(looked_up)
+    assert results_io.NOT_LOOKED_UP_FIELD not in normalized['edgeFields']
+    assert results_io.from_normalized(normalized) == looked_up
@@ -0,0 +1,123 @@
+import os
+
+import pytest
+
+import results_io
+from results_store import ResultsStore, load_remeasured
+
+
+def test_remeasured_hops_go_to_the_sidecar(tmp_path):
+    results_file = str(tmp_path / 'results.json')
+    with ResultsStore(str(tmp_path / 'results.db')) as store:
+        store.add([
+            {'origin': 'unknown', 'destination': '10.0.0.1', 'pingTime': 5},
+            {'origin': '10.0.0.1', 'destination': '10.0.0.2', 'pingTime': 3},
+            {'origin': '10.0.0.1', 'destination': '10.0.0.2', 'pingTime': 7},
+        ])
+        assert store.export_results(results_file) == 2
+        exported = results_io.load_results(results_file)
+        assert exported[1]['samples'] == 2
+        with open(results_file, 'rb') as f:
+            before = f.read()
+
+        store.add([{'origin': '10.0.0.1', 'destination': '10.0.0.2', 'pingTime': 9},
+                   {'origin': '10.0.0.2', 'destination': '10.0.0.3', 'pingTime': 1}])
+        assert store.export_results(results_file) == 2
+
+    # The new hop is appended, the re-measured one isn't rewritten
+    with open(results_file, 'rb') as f:
+        after = f.read()
+    assert after.startswith(before.rstrip()[:-1].rstrip())
+    assert [e['destination'] for e in results_io.load_results(results_file)] == ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+    remeasured = load_remeasured(results_file + '.remeasured')
+    assert remeasured == {('10.0.0.1', '10.0.0.2'): {'pingTime': 7, 'pingMin': 3, 'pingP90': 9, 'samples': 3}}
+    assert os.path.exists(results_file)
+
+
+def test_measuring_the_same_latency_again_is_not_recorded(tmp_path):
+    results_file = str(tmp_path / 'results.json')
+    run = [{'origin': 'unknown', 'destination': '10.0.0.1', 'pingTime': 5},
+           {'origin': '10.0.0.1', 'destination': '10.0.0.2', 'pingTime': 8},
+           {'origin': '10.0.0.2', 'destination': '10.0.0.3', 'pingTime': 12}]
+    with ResultsStore(str(tmp_path / 'results.db')) as store:
+        store.add(run)
+        assert store.export_results(results_file) == 3
+        # An identical run only adds samples: pingTime, pingMin and pingP90 stay as exported
+        store.add(run)
+        store.add(run)
+        store.export_results(results_file)
+        assert load_remeasured(results_file + '.remeasured') == {}
+
+        store.add([{'origin': '10.0.0.1', 'destination': '10.0.0.2', 'pingTime': 30}] + run)
+        store.export_results(results_file)
+    remeasured = load_remeasured(results_file + '.remeasured')
+    assert list(remeasured) == [('10.0.0.1', '10.0.0.2')]
+    assert remeasured[('10.0.0.1', '10.0.0.2')]['pingP90'] == 30
+
+
+class Crash(Exception):
+    """Stands in for the process dying"""
+
+
+def keys(filename):
+    return [(e['origin'], e['destination']) for e in results_io.load_results(filename)]
+
+
+def interrupted_export(tmp_path, monkeypatch, after_append):
+    """Export two hops, then three more with the process dying after the append and before the
+    watermark is committed; after_append(filename) runs just before. Returns the results filename"""
+    results_file = str(tmp_path / 'results.json')
+    append = ResultsStore._append
+
+    def append_then_crash(self, filename, entries, end_id):
+        append(self, filename, entries, end_id)
+        after_append(filename)
+        raise Crash()
+
+    with ResultsStore(str(tmp_path / 'results.db')) as store:
+        store.add([{'origin': '10.0.0.1', 'destination': f'10.0.1.{i}', 'pingTime': i} for i in range(2)])
+        store.export_results(results_file)
+        store.add([{'origin': '10.0.0.1', 'destination': f'10.0.1.{i}', 'pingTime': i} for i in range(2, 5)])
+        with monkeypatch.context() as patch:
+            patch.setattr(ResultsStore, '_append', append_then_crash)
+            with pytest.raises(Crash):
+                store.export_results(results_file)
+    return results_file
+
+
+def export_after_restart(tmp_path, results_file):
+    with ResultsStore(str(tmp_path / 'results.db')) as store:
+        appended = store.export_results(results_file)
+        store.add([{'origin': '10.0.0.1', 'destination': '10.0.1.9', 'pingTime': 9}])
+        assert store.export_results(results_file) == 1
+    return appended
+
+
+EXPECTED_KEYS = [('10.0.0.1', f'10.0.1.{i}') for i in (0, 1, 2, 3, 4, 9)]
+
+
+def test_export_interrupted_before_the_commit_isnt_repeated(tmp_path, monkeypatch):
+    results_file = interrupted_export(tmp_path, monkeypatch, lambda filename: None)
+    # The append reached the disk: the restart only moves the watermark
+    assert export_after_restart(tmp_path, results_file) == 0
+    assert keys(results_file) == EXPECTED_KEYS
+
+
+def test_torn_append_is_undone_and_redone(tmp_path, monkeypatch):
+    def tear(filename):
+        with open(filename, 'r+b') as f:
+            f.truncate(os.path.getsize(filename) - 20)
+
+    results_file = interrupted_export(tmp_path, monkeypatch, tear)
+    assert export_after_restart(tmp_path, results_file) == 3
+    assert keys(results_file) == EXPECTED_KEYS
+
+
+def test_file_rewritten_after_an_interrupted_export_isnt_appended_to_twice(tmp_path, monkeypatch):
+    results_file = interrupted_export(tmp_path, monkeypatch, lambda filename: None)
+    # ip-geoloc.py ran in between and rewrote results.json with the appended entries geolocated
+    geo = {'country': 'C', 'region': 'R', 'city': 'City', 'latitude': 1.0, 'longitude': 2.0}
+    entries = [dict(e, origin_geo=geo, destination_geo=geo) for e in results_io.load_results(results_file)]
+    results_io.save_results(entries, results_file)
+    assert export_after_restart(tmp_path, results_file) == 0
+    assert keys(results_file) == EXPECTED_KEYS
@@ -0,0 +1,89 @@
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+
+import shards
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHARD_COUNT = 3
+TARGETS = [f"45.{i}.{i * 7 % 256}.{i + 1}" for i in range(24)]
+
+
+def start_shard(cwd, index):
+    return subprocess.Popen(
+        [sys.executable, os.path.join(APP_DIR, 'unix.py'), '--synthetic', '--latency', '25', '--no-resolve',
+         '--shard', f'{index}/{SHARD_COUNT}'],
+        cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+    )
+
+
+def shard_targets(cwd, index):
+    filename = os.path.join(cwd, shards.shard_filename(index, SHARD_COUNT))
+    if not os.path.exists(filename):
+        return []
+    return [record['target'] for record, _ in shards.read_shard(filename)]
+
+
+def checkpointed(output):
+    return int(re.search(r'Checkpointed (\d+) target\(s\) to', output).group(1))
+
+
+def test_sigterm_stops_shards_and_they_resume(tmp_path):
+    with open(tmp_path / 'targets.json', 'w', encoding='utf-8') as f:
+        json.dump(TARGETS, f)
+
+    workers = [start_shard(tmp_path, index) for index in range(SHARD_COUNT)]
+    deadline = time.time() + 60
+    while not all(shard_targets(tmp_path, index) for index in range(SHARD_COUNT)):
+        assert time.time() < deadline, 'shards never checkpointed a target'
+        time.sleep(0.05)
+    for worker in workers:
+        worker.send_signal(signal.SIGTERM)
+    stopped = []
+    for index, worker in enumerate(workers):
+        output, _ = worker.communicate(timeout=shards.SHUTDOWN_GRACE + 30)
+        assert worker.returncode == shards.EXIT_PREEMPTED, output
+        # Every line is complete, and the count printed matches what's on disk
+        assert checkpointed(output) == len(shard_targets(tmp_path, index))
+        stopped.append(shard_targets(tmp_path, index))
+    assert sum(len(done) for done in stopped) < len(TARGETS)
+
+    workers = [start_shard(tmp_path, index) for index in range(SHARD_COUNT)]
+    for index, worker in enumerate(workers):
+        output, _ = worker.communicate(timeout=120)
+        assert worker.returncode == 0, output
+        done = shard_targets(tmp_path, index)
+        assert checkpointed(output) == len(done) - len(stopped[index])
+        assert done[:len(stopped[index])] == stopped[index]
+        assert sorted(done) == sorted(shards.shard_targets(TARGETS, index, SHARD_COUNT))
+
+    merge = subprocess.run([sys.executable, os.path.join(APP_DIR, 'unix.py'), '--merge'],
+                           cwd=tmp_path, capture_output=True, text=True)
+    assert f"Merged {len(TARGETS)} target(s)" in merge.stdout, merge.stdout + merge.stderr
+
+
+def test_shards_split_resolved_targets_by_name(tmp_path):
+    names = [f"host-{i}.example" for i in range(12)]
+    # Pairs of names share an address, so each address is traced once across the shards
+    hosts = {name: [f"45.0.0.{i // 2 + 1}"] for i, name in enumerate(names)}
+    with open(tmp_path / 'targets.json', 'w', encoding='utf-8') as f:
+        json.dump(names, f)
+    with open(tmp_path / 'hosts.json', 'w', encoding='utf-8') as f:
+        json.dump(hosts, f)
+
+    recorded = []
+    for index in range(2):
+        completed = subprocess.run(
+            [sys.executable, os.path.join(APP_DIR, 'unix.py'), '--synthetic', '--latency', '0', '--hosts', 'hosts.json',
+             '--shard', f'{index}/2'],
+            cwd=tmp_path, capture_output=True, text=True,
+        )
+        assert completed.returncode == 0, completed.stdout + completed.stderr
+        filename = tmp_path / shards.shard_filename(index, 2)
+        recorded += [record['target'] for record, _ in shards.read_shard(str(filename))] if filename.exists() else []
+    # Each address is recorded once, under the first name resolving to it
+    assert sorted(recorded) == sorted(names[::2])
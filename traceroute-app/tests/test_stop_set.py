@@ -0,0 +1,38 @@
+from replay_tracer import ReplayTracer
+from unix import PROBES_PER_HOP, format_results, outcome_results, process_traceroute_with_stop_set
+
+TRACE = """traceroute to 10.0.0.9 (10.0.0.9), 30 hops max, 60 byte packets
+ 1  192.168.0.1  1.000 ms  1.000 ms  1.000 ms
+ 2  10.0.0.2  2.000 ms  2.000 ms  2.000 ms
+ 3  10.0.0.3  3.000 ms  3.000 ms  3.000 ms
+ 4  10.0.0.4  4.000 ms  4.000 ms  4.000 ms
+ 5  10.0.0.5  5.000 ms  5.000 ms  5.000 ms
+ 6  10.0.0.6  6.000 ms  6.000 ms  6.000 ms
+ 7  10.0.0.9  9.000 ms  9.000 ms  9.000 ms
+"""
+
+
+def trace(stop_set):
+    tracer = ReplayTracer({'10.0.0.9': TRACE}, latency_ms=0)
+    return process_traceroute_with_stop_set('10.0.0.9', stop_set, first_ttl=6, tracer=tracer)
+
+
+def test_stop_set_hop_only_starts_the_next_edge():
+    outcome = trace({'10.0.0.4'})
+    hops, _, probes_saved, anchor = outcome
+    assert anchor.ip == '10.0.0.4'
+    assert [hop.ip for hop in hops] == ['10.0.0.5', '10.0.0.6', '10.0.0.9']
+    edges = [(entry.origin, entry.destination, entry.pingTime) for entry in outcome_results(outcome)[:len(hops)]]
+    assert edges == [('10.0.0.4', '10.0.0.5', 1), ('10.0.0.5', '10.0.0.6', 1), ('10.0.0.6', '10.0.0.9', 3)]
+    # TTLs 1-3 never probed, TTLs 5 and 4 probed by separate backward runs
+    assert probes_saved == (3 - 2) * PROBES_PER_HOP
+
+
+def test_stop_set_miss_saves_nothing():
+    stop_set = set()
+    hops, _, probes_saved, anchor = trace(stop_set)
+    assert anchor is None
+    assert [hop.ip for hop in hops][0] == '10.0.0.2'
+    assert format_results(hops)[0].origin == 'unknown'
+    assert probes_saved == -4 * PROBES_PER_HOP
+    assert {'10.0.0.2', '10.0.0.6', '10.0.0.9'} <= stop_set
@@ -0,0 +1,21 @@
+from target_resolver import resolve_targets
+
+HOSTS = {
+    'a.example': ['1.2.3.4'],
+    'b.example': ['1.2.3.5'],
+    'c.example': ['1.2.3.6'],
+    'www.a.example': ['1.2.3.4'],
+    'cdn.example': ['151.101.1.1'],
+}
+
+
+def test_shared_hosting_is_not_anycast_by_default():
+    plan = resolve_targets(list(HOSTS), resolver=lambda name: HOSTS[name])
+    assert plan.traces == ['1.2.3.4', '1.2.3.5', '1.2.3.6', '151.101.1.1']
+    assert plan.targets_of['1.2.3.4'] == ['a.example', 'www.a.example']
+    assert plan.anycast == {'151.101.1.1'}
+
+
+def test_shared_24_heuristic_is_opt_in():
+    plan = resolve_targets(list(HOSTS), resolver=lambda name: HOSTS[name], shared_targets=3)
+    assert plan.anycast == {'1.2.3.4', '1.2.3.5', '1.2.3.6', '151.101.1.1'}
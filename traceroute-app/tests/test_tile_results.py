@@ -0,0 +1,114 @@
+import copy
+import json
+import os
+import random
+import sqlite3
+
+import results_io
+import tile_results
+
+
+def make_entries(count, seed=0):
+    rng = random.Random(seed)
+    # Close together, so edges cross few tiles
+    cities = [{'country': f"C{i}", 'city': f"City {i}", 'latitude': rng.uniform(40, 55),
+               'longitude': rng.uniform(-5, 20)} for i in range(40)]
+    entries = []
+    for i in range(count):
+        entry = {'origin': f"10.0.{i >> 8}.{i & 255}", 'destination': f"11.0.{i >> 8}.{i & 255}",
+                 'pingTime': rng.choice([None, rng.randint(1, 200)])}
+        if rng.random() < 0.9:
+            entry['origin_geo'] = rng.choice(cities)
+        if rng.random() < 0.9:
+            entry['destination_geo'] = rng.choice(cities)
+        entries.append(entry)
+    return entries
+
+
+def build(entries, directory, full=False):
+    os.makedirs(directory, exist_ok=True)
+    filename = os.path.join(directory, 'results.json')
+    results_io.save_results(entries, filename)
+    tile_results.build_tiles(filename, os.path.join(directory, 'tiles'), os.path.join(directory, 'tiles.db'), full)
+
+
+def read_tiles(directory):
+    tiles = {}
+    for root, _, files in os.walk(os.path.join(directory, 'tiles')):
+        for name in files:
+            with open(os.path.join(root, name), encoding='utf-8') as f:
+                data = json.load(f)
+            data.pop('revision', None)
+            tiles[os.path.relpath(os.path.join(root, name), directory)] = data
+    return tiles
+
+
+def remeasure(entries, positions, seed=1):
+    """Give the entries at positions a new pingTime, as ip-geoloc.py does for re-measured hops"""
+    rng = random.Random(seed)
+    for position in positions:
+        entry = entries[position]
+        entry['pingTime'] = None if entry['pingTime'] is not None and rng.random() < 0.2 else rng.randint(1, 400)
+
+
+def test_incremental_equals_full_rebuild(tmp_path):
+    entries = make_entries(600)
+    incremental, full = tmp_path / 'incremental', tmp_path / 'full'
+    build(entries[:300], incremental)
+    # Later runs append entries and re-measure some already tiled, extremes included
+    remeasure(entries, range(0, 300, 7))
+    build(entries[:450], incremental)
+    remeasure(entries, range(1, 450, 5), seed=2)
+    build(entries, incremental)
+    build(entries, full, full=True)
+    assert read_tiles(incremental) == read_tiles(full)
+
+
+def test_only_touched_tiles_are_rewritten(tmp_path):
+    entries = make_entries(400)
+    build(entries, tmp_path)
+    before = read_tiles(tmp_path)
+    position = next(i for i, entry in enumerate(entries)
+                    if entry['pingTime'] is not None and tile_results._edge_keys(entry))
+    with sqlite3.connect(tmp_path / 'tiles.db') as connection:
+        expected = {
+            os.path.join('tiles', str(zoom), str(x), f"{y}.json")
+            for zoom, a, b in tile_results._edge_keys(entries[position])
+            for x, y in connection.execute(
+                'SELECT t.x, t.y FROM edge_tiles t JOIN edges e ON e.id = t.edge_id '
+                'WHERE e.zoom = ? AND e.a_x = ? AND e.a_y = ? AND e.b_x = ? AND e.b_y = ?', (zoom, *a, *b)
+            )
+        }
+    assert expected
+    for name in before:
+        if name != os.path.join('tiles', 'index.json'):
+            os.remove(tmp_path / name)
+
+    entries = copy.deepcopy(entries)
+    entries[position]['pingTime'] += 1000
+    build(entries, tmp_path)
+    after = read_tiles(tmp_path)
+    assert set(after) - {os.path.join('tiles', 'index.json')} == expected
+    assert any(before[name] != after[name] for name in expected)
+
+
+def test_changed_location_rebuilds(tmp_path):
+    entries = make_entries(200)
+    build(entries, tmp_path)
+    located = next(entry for entry in entries if 'origin_geo' in entry)
+    located['origin_geo'] = {'country': 'XX', 'city': 'Elsewhere', 'latitude': 1.5, 'longitude': 2.5}
+    build(entries, tmp_path)
+    build(entries, tmp_path / 'full', full=True)
+    assert read_tiles(tmp_path) == read_tiles(tmp_path / 'full')
+
+
+def test_full_rebuild_keeps_other_files(tmp_path):
+    out_dir = tmp_path / 'tiles'
+    (out_dir / '9' / '0').mkdir(parents=True)
+    (out_dir / '9' / '0' / '0.json').write_text('{}')
+    (out_dir / 'custom').mkdir()
+    (out_dir / 'README.txt').write_text('not a tile')
+    build(make_entries(50), tmp_path, full=True)
+    assert (out_dir / 'README.txt').exists() and (out_dir / 'custom').is_dir()
+    assert not (out_dir / '9').exists()
+    assert (out_dir / 'index.json').exists()
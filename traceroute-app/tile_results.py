@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+Level-of-detail map tiles for the website, built from results.json after ip-geoloc.py.
+
+For every zoom level in TILE_ZOOMS, locations are clustered on a grid of Web Mercator cells
+(2^CLUSTER_BITS per tile side), and hops between the same two clusters are merged into one
+edge with aggregated RTT (hop count, min, mean, max of pingTime). Each z/x/y tile file holds
+the clusters inside it and the edges crossing it, so the website only fetches what's in view.
+An edge spanning more than MAX_EDGE_TILES tiles at a zoom is left out of it (and deeper
+zooms); it still shows when zoomed out.
+
+Clusters sit at the first location that fell into them and never move, so adding hops only
+rewrites the tiles holding clusters or edges they changed. Accumulators live in tiles.db,
+which remembers how far into results.json it got, and each tiled entry's pingTime along with
+a digest of its endpoints and locations. An entry whose pingTime changed since (ip-geoloc.py
+folds in the hops unix.py re-measured) has its old sample swapped for the new one in its
+edges, whose tiles are rewritten. Any other change to a tiled entry, or --full, rebuilds
+everything.
+
+    python3 tile_results.py [results.json] [--out DIR] [--full]
+"""
+
+import hashlib
+import json
+import math
+import os
+import shutil
+import sqlite3
+import sys
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import results_io
+from cli_args import get_flag, positional
+
+RESULTS_FILE = 'results.json'
+TILES_DB_FILE = 'tiles.db'
+TILES_DIR = os.path.join('..', 'website', 'public', 'tiles')
+TILE_ZOOMS = range(2, 9)
+CLUSTER_BITS = 3
+MAX_EDGE_TILES = 64  # Longer edges only appear at the zooms where they span fewer tiles
+TILES_VERSION = 1
+MAX_LATITUDE = 85.0511287798  # Web Mercator cuts off here
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS locations (
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    PRIMARY KEY (latitude, longitude)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS clusters (
+    zoom INTEGER NOT NULL,
+    cx INTEGER NOT NULL,
+    cy INTEGER NOT NULL,
+    tx INTEGER NOT NULL,
+    ty INTEGER NOT NULL,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    label TEXT NOT NULL,
+    nodes INTEGER NOT NULL,
+    PRIMARY KEY (zoom, cx, cy)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS clusters_tile ON clusters (zoom, tx, ty, cx, cy);
+CREATE TABLE IF NOT EXISTS edges (
+    id INTEGER PRIMARY KEY,
+    zoom INTEGER NOT NULL,
+    a_x INTEGER NOT NULL,
+    a_y INTEGER NOT NULL,
+    b_x INTEGER NOT NULL,
+    b_y INTEGER NOT NULL,
+    hops INTEGER NOT NULL,
+    pings INTEGER NOT NULL,
+    ping_sum INTEGER NOT NULL,
+    ping_min INTEGER,
+    ping_max INTEGER,
+    UNIQUE (zoom, a_x, a_y, b_x, b_y)
+);
+CREATE TABLE IF NOT EXISTS edge_tiles (
+    zoom INTEGER NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    edge_id INTEGER NOT NULL,
+    PRIMARY KEY (zoom, x, y, edge_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS edge_tiles_edge ON edge_tiles (edge_id);
+CREATE TABLE IF NOT EXISTS entries (
+    position INTEGER PRIMARY KEY,
+    digest BLOB NOT NULL,
+    ping INTEGER
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+Tile = Tuple[int, int, int]
+Cell = Tuple[int, int]
+
+
+def _mercator(lat: float, lon: float, zoom: int) -> Tuple[float, float]:
+    """Fractional tile coordinates of a point at zoom"""
+    scale = 1 << zoom
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = (lon + 180.0) / 360.0 * scale
+    y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * scale
+    return min(max(x, 0.0), scale - 1e-9), min(max(y, 0.0), scale - 1e-9)
+
+
+def _cell(lat: float, lon: float, zoom: int) -> Cell:
+    x, y = _mercator(lat, lon, zoom + CLUSTER_BITS)
+    return int(x), int(y)
+
+
+def _segment_tiles(a: Tuple[float, float], b: Tuple[float, float], zoom: int) -> Set[Tuple[int, int]]:
+    """Tiles a straight Mercator segment crosses, sampled at twice per tile.
+    Empty when the segment spans more than MAX_EDGE_TILES tiles."""
+    (x0, y0), (x1, y1) = _mercator(*a, zoom), _mercator(*b, zoom)
+    span = max(abs(x1 - x0), abs(y1 - y0))
+    if span > MAX_EDGE_TILES:
+        return set()
+    steps = max(1, math.ceil(span * 2))
+    return {(int(x0 + (x1 - x0) * i / steps), int(y0 + (y1 - y0) * i / steps)) for i in range(steps + 1)}
+
+
+def _location(geo: Optional[Dict]) -> Optional[Tuple[float, float]]:
+    if not geo or geo.get('latitude') is None or geo.get('longitude') is None:
+        return None
+    return float(geo['latitude']), float(geo['longitude'])
+
+
+def _label(geo: Dict) -> str:
+    return ', '.join(part for part in (geo.get('city'), geo.get('country')) if part)
+
+
+def _entry_digest(entry: Dict) -> bytes:
+    """What an entry puts on the map besides its pingTime: endpoints, locations and labels"""
+    parts = [entry.get('origin', 'unknown'), entry.get('destination', '')]
+    for geo in (entry.get('origin_geo'), entry.get('destination_geo')):
+        location = _location(geo)
+        parts += [location, _label(geo) if location is not None else None]
+    return hashlib.blake2b(json.dumps(parts).encode('utf-8'), digest_size=8).digest()
+
+
+def _edge_keys(entry: Dict) -> List[Tuple[int, Cell, Cell]]:
+    """(zoom, a, b) of the edges an entry adds to"""
+    origin, destination = _location(entry.get('origin_geo')), _location(entry.get('destination_geo'))
+    if origin is None or destination is None:
+        return []
+    keys = []
+    for zoom in TILE_ZOOMS:
+        a, b = sorted((_cell(*origin, zoom), _cell(*destination, zoom)))
+        if a != b:
+            keys.append((zoom, a, b))
+    return keys
+
+
+class TileBuilder:
+    def __init__(self, filename: str = TILES_DB_FILE):
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(_SCHEMA)
+        self.dirty: Set[Tile] = set()
+
+    def close(self):
+        self.connection.close()
+
+    def _get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key: str, value: str):
+        self.connection.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    @staticmethod
+    def _settings() -> str:
+        return json.dumps([TILES_VERSION, list(TILE_ZOOMS), CLUSTER_BITS])
+
+    def start(self, results: List[Dict], out_dir: str, full: bool) -> int:
+        """Index of the first entry not tiled yet, after swapping in the pingTime of tiled entries
+        that changed; 0 (after clearing everything) when the tiles can't be trusted"""
+        processed = int(self._get_meta('processed', '0'))
+        if (
+            not full
+            and self._get_meta('settings') == self._settings()
+            and os.path.exists(os.path.join(out_dir, 'index.json'))
+            and processed <= len(results)
+        ):
+            changed = self._changed_pings(results, processed)
+            if changed is not None:
+                if changed:
+                    print(f"{len(changed)} tiled entries have a new pingTime, updating their edges")
+                    self._update_pings(results, processed, changed)
+                return processed
+        if processed > 0 and not full:
+            print(f"Results or {out_dir} changed since the tiles were built, rebuilding them")
+        for table in ('locations', 'clusters', 'edges', 'edge_tiles', 'entries', 'meta'):
+            self.connection.execute(f'DELETE FROM {table}')
+        return 0
+
+    def _changed_pings(self, results: List[Dict], processed: int) -> Optional[Dict[int, Optional[int]]]:
+        """The old pingTime of every tiled entry whose pingTime changed, by position.
+        None if some entry changed otherwise, or wasn't recorded."""
+        changed = {}
+        count = 0
+        for position, digest, ping in self.connection.execute(
+            'SELECT position, digest, ping FROM entries WHERE position < ? ORDER BY position', (processed,)
+        ):
+            if position != count or _entry_digest(results[position]) != digest:
+                return None
+            if results[position].get('pingTime') != ping:
+                changed[position] = ping
+            count += 1
+        return changed if count == processed else None
+
+    def _update_pings(self, results: List[Dict], processed: int, changed: Dict[int, Optional[int]]):
+        """Swap each changed entry's old pingTime for its new one in the edges it adds to"""
+        recount: Set[Tuple[int, Cell, Cell]] = set()
+        for position, old in changed.items():
+            new = results[position].get('pingTime')
+            for zoom, a, b in _edge_keys(results[position]):
+                edge_id, pings, ping_sum, ping_min, ping_max = self.connection.execute(
+                    'SELECT id, pings, ping_sum, ping_min, ping_max FROM edges '
+                    'WHERE zoom = ? AND a_x = ? AND a_y = ? AND b_x = ? AND b_y = ?', (zoom, *a, *b)
+                ).fetchone()
+                if old is not None:
+                    pings, ping_sum = pings - 1, ping_sum - old
+                    if old in (ping_min, ping_max):
+                        # Only the edge's other samples can tell its new extremes
+                        recount.add((zoom, a, b))
+                if new is not None:
+                    pings, ping_sum = pings + 1, ping_sum + new
+                    ping_min = new if ping_min is None else min(ping_min, new)
+                    ping_max = new if ping_max is None else max(ping_max, new)
+                self.connection.execute(
+                    'UPDATE edges SET pings = ?, ping_sum = ?, ping_min = ?, ping_max = ? WHERE id = ?',
+                    (pings, ping_sum, ping_min, ping_max, edge_id),
+                )
+                self.dirty.update(
+                    (zoom, x, y) for x, y in self.connection.execute(
+                        'SELECT x, y FROM edge_tiles WHERE zoom = ? AND edge_id = ?', (zoom, edge_id)
+                    )
+                )
+            self.connection.execute('UPDATE entries SET ping = ? WHERE position = ?', (new, position))
+        if recount:
+            self._recount_extremes(results[:processed], recount)
+
+    def _recount_extremes(self, results: List[Dict], keys: Set[Tuple[int, Cell, Cell]]):
+        """Set ping_min and ping_max of the edges in keys from the entries that add to them"""
+        extremes: Dict[Tuple[int, Cell, Cell], Tuple[int, int]] = {}
+        for entry in results:
+            ping = entry.get('pingTime')
+            if ping is None:
+                continue
+            for key in _edge_keys(entry):
+                if key in keys:
+                    low, high = extremes.get(key, (ping, ping))
+                    extremes[key] = (min(low, ping), max(high, ping))
+        for zoom, a, b in keys:
+            low, high = extremes.get((zoom, a, b), (None, None))
+            self.connection.execute(
+                'UPDATE edges SET ping_min = ?, ping_max = ? '
+                'WHERE zoom = ? AND a_x = ? AND a_y = ? AND b_x = ? AND b_y = ?',
+                (low, high, zoom, *a, *b),
+            )
+
+    def _add_location(self, lat: float, lon: float, geo: Dict):
+        cursor = self.connection.execute(
+            'INSERT OR IGNORE INTO locations (latitude, longitude) VALUES (?, ?)', (lat, lon)
+        )
+        if not cursor.rowcount:
+            return
+        for zoom in TILE_ZOOMS:
+            cx, cy = _cell(lat, lon, zoom)
+            tx, ty = cx >> CLUSTER_BITS, cy >> CLUSTER_BITS
+            self.connection.execute(
+                'INSERT INTO clusters (zoom, cx, cy, tx, ty, latitude, longitude, label, nodes) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1) ON CONFLICT (zoom, cx, cy) DO UPDATE SET nodes = nodes + 1',
+                (zoom, cx, cy, tx, ty, lat, lon, _label(geo)),
+            )
+            self.dirty.add((zoom, tx, ty))
+
+    def _cluster_location(self, zoom: int, cell: Cell) -> Tuple[float, float]:
+        return self.connection.execute(
+            'SELECT latitude, longitude FROM clusters WHERE zoom = ? AND cx = ? AND cy = ?', (zoom, *cell)
+        ).fetchone()
+
+    def _add_edge(self, origin: Tuple[float, float], destination: Tuple[float, float], ping: Optional[int]):
+        for zoom in TILE_ZOOMS:
+            a, b = sorted((_cell(*origin, zoom), _cell(*destination, zoom)))
+            if a == b:
+                continue
+            row = self.connection.execute(
+                'SELECT id FROM edges WHERE zoom = ? AND a_x = ? AND a_y = ? AND b_x = ? AND b_y = ?', (zoom, *a, *b)
+            ).fetchone()
+            if row is None:
+                edge_id = self.connection.execute(
+                    'INSERT INTO edges (zoom, a_x, a_y, b_x, b_y, hops, pings, ping_sum, ping_min, ping_max) '
+                    'VALUES (?, ?, ?, ?, ?, 0, 0, 0, NULL, NULL)', (zoom, *a, *b)
+                ).lastrowid
+                tiles = _segment_tiles(self._cluster_location(zoom, a), self._cluster_location(zoom, b), zoom)
+                self.connection.executemany(
+                    'INSERT OR IGNORE INTO edge_tiles (zoom, x, y, edge_id) VALUES (?, ?, ?, ?)',
+                    [(zoom, x, y, edge_id) for x, y in tiles],
+                )
+            else:
+                edge_id = row[0]
+                tiles = {tuple(tile) for tile in self.connection.execute(
+                    'SELECT x, y FROM edge_tiles WHERE zoom = ? AND edge_id = ?', (zoom, edge_id)
+                )}
+            if ping is None:
+                self.connection.execute('UPDATE edges SET hops = hops + 1 WHERE id = ?', (edge_id,))
+            else:
+                self.connection.execute(
+                    'UPDATE edges SET hops = hops + 1, pings = pings + 1, ping_sum = ping_sum + ?, '
+                    'ping_min = MIN(COALESCE(ping_min, ?), ?), ping_max = MAX(COALESCE(ping_max, ?), ?) WHERE id = ?',
+                    (ping, ping, ping, ping, ping, edge_id),
+                )
+            self.dirty.update((zoom, x, y) for x, y in tiles)
+
+    def add(self, entries: Iterable[Dict], position: int = 0) -> int:
+        """Tile entries, the first of which is at position in results.json"""
+        count = 0
+        for entry in entries:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO entries (position, digest, ping) VALUES (?, ?, ?)',
+                (position + count, _entry_digest(entry), entry.get('pingTime')),
+            )
+            origin = _location(entry.get('origin_geo'))
+            destination = _location(entry.get('destination_geo'))
+            if origin is not None:
+                self._add_location(*origin, entry['origin_geo'])
+            if destination is not None:
+                self._add_location(*destination, entry['destination_geo'])
+            if origin is not None and destination is not None:
+                self._add_edge(origin, destination, entry.get('pingTime'))
+            count += 1
+        return count
+
+    def tile(self, zoom: int, x: int, y: int) -> Dict:
+        clusters = [
+            [f"{cx}:{cy}", lat, lon, nodes, label]
+            for cx, cy, lat, lon, nodes, label in self.connection.execute(
+                'SELECT cx, cy, latitude, longitude, nodes, label FROM clusters INDEXED BY clusters_tile '
+                'WHERE zoom = ? AND tx = ? AND ty = ? ORDER BY cx, cy',
+                (zoom, x, y),
+            )
+        ]
+        edges = []
+        for a_x, a_y, b_x, b_y, hops, pings, ping_sum, ping_min, ping_max, a_lat, a_lon, b_lat, b_lon in (
+            self.connection.execute(
+                'SELECT e.a_x, e.a_y, e.b_x, e.b_y, e.hops, e.pings, e.ping_sum, e.ping_min, e.ping_max, '
+                'a.latitude, a.longitude, b.latitude, b.longitude '
+                'FROM edge_tiles t JOIN edges e ON e.id = t.edge_id '
+                'JOIN clusters a ON a.zoom = e.zoom AND a.cx = e.a_x AND a.cy = e.a_y '
+                'JOIN clusters b ON b.zoom = e.zoom AND b.cx = e.b_x AND b.cy = e.b_y '
+                'WHERE t.zoom = ? AND t.x = ? AND t.y = ? ORDER BY e.id',
+                (zoom, x, y),
+            )
+        ):
+            mean = round(ping_sum / pings) if pings else None
+            edges.append([f"{a_x}:{a_y}", a_lat, a_lon, f"{b_x}:{b_y}", b_lat, b_lon, hops, mean, ping_min, ping_max])
+        return {'z': zoom, 'x': x, 'y': y, 'clusters': clusters, 'edges': edges}
+
+    def write_tiles(self, out_dir: str, processed: List[Dict]) -> int:
+        """Write the dirty tiles and index.json, then record progress. Returns tiles written"""
+        for zoom, x, y in sorted(self.dirty):
+            tile_dir = os.path.join(out_dir, str(zoom), str(x))
+            os.makedirs(tile_dir, exist_ok=True)
+            _write_json(os.path.join(tile_dir, f"{y}.json"), self.tile(zoom, x, y))
+        revision = int(self._get_meta('revision', '0')) + 1
+        _write_json(os.path.join(out_dir, 'index.json'), {
+            'version': TILES_VERSION,
+            'minZoom': TILE_ZOOMS[0],
+            'maxZoom': TILE_ZOOMS[-1],
+            'clusterBits': CLUSTER_BITS,
+            'revision': revision,
+        })
+        self._set_meta('revision', str(revision))
+        self._set_meta('processed', str(len(processed)))
+        self._set_meta('settings', self._settings())
+        self.connection.commit()
+        written = len(self.dirty)
+        self.dirty.clear()
+        return written
+
+
+def _write_json(filename: str, data):
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+    os.replace(temp_filename, filename)
+
+
+def _remove_tiles(out_dir: str):
+    """Remove what write_tiles wrote to out_dir (index.json and a directory per zoom level,
+    including zooms no longer in TILE_ZOOMS), leaving anything else there alone"""
+    if not os.path.isdir(out_dir):
+        return
+    for name in os.listdir(out_dir):
+        path = os.path.join(out_dir, name)
+        if name.isdigit() and os.path.isdir(path):
+            shutil.rmtree(path)
+    if os.path.exists(os.path.join(out_dir, 'index.json')):
+        os.remove(os.path.join(out_dir, 'index.json'))
+
+
+def build_tiles(filename: str = RESULTS_FILE, out_dir: str = TILES_DIR, db_filename: str = TILES_DB_FILE,
+                full: bool = False):
+    results = results_io.load_results(filename)
+    builder = TileBuilder(db_filename)
+    try:
+        start = builder.start(results, out_dir, full)
+        if start == 0:
+            _remove_tiles(out_dir)
+        os.makedirs(out_dir, exist_ok=True)
+        if start > 0:
+            print(f"Incremental run: {len(results) - start} new entries after {start} already tiled")
+        added = builder.add(results[start:], start)
+        written = builder.write_tiles(out_dir, results)
+    finally:
+        builder.close()
+    print(f"Tiled {added:,} entries, wrote {written:,} tile(s) to {out_dir} "
+          f"(zoom {TILE_ZOOMS[0]}-{TILE_ZOOMS[-1]})")
+
+
+if __name__ == '__main__':
+    filenames = positional(sys.argv, ('--out',))
+    filename = filenames[0] if filenames else RESULTS_FILE
+    if not os.path.exists(filename):
+        print(f"Error: {filename} not found")
+        sys.exit(1)
+    build_tiles(filename, get_flag(sys.argv, '--out', TILES_DIR), full='--full' in sys.argv)
@@ -1,16 +1,48 @@
 import json
+import os
 import subprocess
 import re
-import os
 import getpass
-from typing import List, Optional, Tuple
+import ipaddress
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar
 from pydantic import BaseModel, ValidationError
+from cli_args import get_flag
+from results_store import ResultsStore, STORE_FILE
+import instrumentation
+import shards
+import target_resolver
 
 # Constants
 TARGETS_FILE = 'targets.json'
 RESULTS_FILE = 'results.json'
 TRACEROUTE_TIMEOUT = 120
+MAX_SILENT_HOPS = 5  # Consecutive all-'*' hops before a streamed traceroute gives up
+STOP_SET_FIRST_TTL = 6  # First TTL probed forward in stop-set mode
+PROBES_PER_HOP = 3  # traceroute's default -q
+DEFAULT_MAX_TTL = 30  # traceroute's default -m
 FIRST_HOP_FILTER = 1  # Skip first hop for user privacy
+DEFAULT_WORKERS = 1
+MAX_TRACES_PER_PREFIX = 2  # Concurrent traceroutes towards the same destination prefix
+DESTINATION_PREFIX_LENGTH = 24
+
+T = TypeVar('T')
+
+_HEADER_PATTERN = re.compile(r'^traceroute to \S+ \((\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\)')
+_SILENT_HOP_PATTERN = re.compile(r'^\s*\d+\s+\*\s+\*\s+\*')
+# Pattern handles both formats:
+# With parentheses: "1  (172.24.96.1)  0.458 ms  0.442 ms  0.440 ms"
+# Without parentheses (with -n flag): "1  172.24.96.1  0.458 ms  0.442 ms  0.440 ms"
+_HOP_PATTERN = re.compile(r'^\s*(\d+)\s+(?:(\S+)\s+)?(?:\((\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\)|(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}))\s+(\*|\d+\.?\d*)\s+ms\s+(\*|\d+\.?\d*)\s+ms\s+(\*|\d+\.?\d*)\s+ms')
+# Matches IPs in parentheses or standalone
+_IP_PATTERN = re.compile(r'(?:\((\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\)|(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}))')
+NO_PING = -1  # Stands for a missing ping in HopColumns.ping
 
 # Pydantic models
 class Hop(BaseModel):
@@ -33,6 +65,21 @@ def get_sudo_password() -> Optional[str]:
         _sudo_password = getpass.getpass("traceroute requires sudo privileges. Please enter your password: ")
     return _sudo_password
 
+def validate_sudo_password(sudo_password: Optional[str]) -> bool:
+    """Refresh sudo's cached credential once, so concurrent traceroutes don't each fail on a bad password"""
+    try:
+        result = subprocess.run(
+            ['sudo', '-S', '-v'],
+            input=(sudo_password + '\n') if sudo_password else '',
+            capture_output=True,
+            text=True,
+            timeout=30
+        )
+    except (subprocess.TimeoutExpired, OSError) as e:
+        print(f"Error validating sudo password: {e}")
+        return False
+    return result.returncode == 0 and not _check_sudo_error(result.stderr.split('\n'))
+
 def read_targets() -> List[str]:
     """Read targets from JSON file"""
     try:
@@ -48,10 +95,28 @@ def read_targets() -> List[str]:
         print(f"Error: Invalid {TARGETS_FILE}: {e}")
         return []
 
-def run_traceroute(target: str, sudo_password: Optional[str] = None) -> Tuple[List[str], List[str], int]:
-    """Run traceroute command and return stdout, stderr lines, and return code"""
+def _build_traceroute_cmd(target: str, first_ttl: int = 1, max_ttl: Optional[int] = None) -> List[str]:
+    cmd = ['sudo', '-S', 'traceroute', '-I', '-n']
+    if first_ttl > 1:
+        cmd += ['-f', str(first_ttl)]
+    if max_ttl is not None:
+        cmd += ['-m', str(max_ttl)]
+    return cmd + [target]
+
+def _to_lines(output) -> List[str]:
+    """Split captured output into lines, decoding the bytes TimeoutExpired carries"""
+    if not output:
+        return []
+    if isinstance(output, bytes):
+        output = output.decode(errors='replace')
+    return output.split('\n')
+
+def run_traceroute(target: str, sudo_password: Optional[str] = None,
+                   first_ttl: int = 1, max_ttl: Optional[int] = None) -> Tuple[List[str], List[str], int]:
+    """Run traceroute command and return stdout, stderr lines, and return code.
+    On timeout, whatever was printed before the process was killed is returned with code -1."""
     try:
-        cmd = ['sudo', '-S', 'traceroute', '-I', '-n', target]
+        cmd = _build_traceroute_cmd(target, first_ttl=first_ttl, max_ttl=max_ttl)
         input_data = (sudo_password + '\n') if sudo_password else ''
         
         result = subprocess.run(
@@ -62,15 +127,109 @@ def run_traceroute(target: str, sudo_password: Optional[str] = None) -> Tuple[Li
             timeout=TRACEROUTE_TIMEOUT
         )
         
-        stdout_lines = result.stdout.split('\n') if result.stdout else []
-        stderr_lines = result.stderr.split('\n') if result.stderr else []
-        return stdout_lines, stderr_lines, result.returncode
-    except subprocess.TimeoutExpired:
+        return _to_lines(result.stdout), _to_lines(result.stderr), result.returncode
+    except subprocess.TimeoutExpired as e:
         print(f"Warning: traceroute to {target} timed out after {TRACEROUTE_TIMEOUT} seconds")
+        return _to_lines(e.stdout), _to_lines(e.stderr), -1
+    except Exception as e:
+        print(f"Error running traceroute to {target}: {e}")
         return [], [], -1
+
+def stream_traceroute(target: str, sudo_password: Optional[str] = None,
+                      max_silent_hops: int = MAX_SILENT_HOPS, first_ttl: int = 1) -> Tuple[List[str], List[str], int]:
+    """Run traceroute reading stdout line by line, and stop the probe early once the destination
+    answers or max_silent_hops consecutive hops time out. Same return shape as run_traceroute;
+    lines read before an early stop or a timeout are kept."""
+    destination_ip = _resolve_ipv4(target)
+    stdout_lines = []
+    silent_hops = 0
+    try:
+        proc = subprocess.Popen(
+            _build_traceroute_cmd(target, first_ttl=first_ttl),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1
+        )
     except Exception as e:
         print(f"Error running traceroute to {target}: {e}")
         return [], [], -1
+    
+    started = time.monotonic()
+    # SIGTERM rather than SIGKILL: sudo relays it to traceroute
+    watchdog = threading.Timer(TRACEROUTE_TIMEOUT, proc.terminate)
+    watchdog.start()
+    try:
+        proc.stdin.write((sudo_password + '\n') if sudo_password else '')
+        proc.stdin.close()
+        for line in proc.stdout:
+            line = line.rstrip('\n')
+            stdout_lines.append(line)
+            
+            header = _HEADER_PATTERN.match(line)
+            if header:
+                destination_ip = header.group(1)
+                continue
+            if _SILENT_HOP_PATTERN.match(line):
+                silent_hops += 1
+                if silent_hops >= max_silent_hops:
+                    break
+                continue
+            hop = parse_traceroute_line(line)
+            if hop:
+                silent_hops = 0
+                if hop.ip == destination_ip:
+                    break
+    except Exception as e:
+        print(f"Error reading traceroute to {target}: {e}")
+    finally:
+        watchdog.cancel()
+        if proc.poll() is None:
+            proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        stderr_output = proc.stderr.read()
+        proc.stdout.close()
+        proc.stderr.close()
+    
+    if time.monotonic() - started >= TRACEROUTE_TIMEOUT:
+        print(f"Warning: traceroute to {target} timed out after {TRACEROUTE_TIMEOUT} seconds, keeping {len(stdout_lines)} line(s)")
+        return stdout_lines, _to_lines(stderr_output), -1
+    return stdout_lines, _to_lines(stderr_output), proc.returncode
+
+class Tracer(ABC):
+    """Where traceroute output comes from. run and stream return (stdout lines, stderr lines,
+    return code) the way run_traceroute and stream_traceroute do, for `traceroute -I -n` output.
+    A backend has to implement both: one missing either can't be instantiated."""
+    needs_sudo = False
+    
+    @abstractmethod
+    def run(self, target: str, first_ttl: int = 1, max_ttl: Optional[int] = None) -> Tuple[List[str], List[str], int]:
+        """The whole trace from first_ttl to max_ttl (traceroute's default when None)"""
+    
+    @abstractmethod
+    def stream(self, target: str, max_silent_hops: int = MAX_SILENT_HOPS,
+               first_ttl: int = 1) -> Tuple[List[str], List[str], int]:
+        """The trace up to the destination or max_silent_hops silent hops in a row"""
+
+class SudoTracer(Tracer):
+    """Runs the real traceroute through sudo"""
+    needs_sudo = True
+    
+    def __init__(self, sudo_password: Optional[str] = None):
+        self.sudo_password = sudo_password
+    
+    def run(self, target: str, first_ttl: int = 1, max_ttl: Optional[int] = None) -> Tuple[List[str], List[str], int]:
+        return run_traceroute(target, sudo_password=self.sudo_password, first_ttl=first_ttl, max_ttl=max_ttl)
+    
+    def stream(self, target: str, max_silent_hops: int = MAX_SILENT_HOPS,
+               first_ttl: int = 1) -> Tuple[List[str], List[str], int]:
+        return stream_traceroute(target, sudo_password=self.sudo_password, max_silent_hops=max_silent_hops,
+                                 first_ttl=first_ttl)
 
 def _extract_ping_value(ping_strings: List[str]) -> Optional[int]:
     """Extract minimum ping value from three ping measurements"""
@@ -86,10 +245,7 @@ def _extract_ping_value(ping_strings: List[str]) -> Optional[int]:
 def _extract_ip_from_line(line: str) -> Optional[str]:
     """Extract IP address from a traceroute line, even if it doesn't match full hop pattern.
     This ensures we capture IPs for geolocation even when we can't create a complete hop."""
-    # Try to find IPv4 addresses in the line
-    # Pattern matches IPs in parentheses or standalone
-    ip_pattern = r'(?:\((\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\)|(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}))'
-    match = re.search(ip_pattern, line)
+    match = _IP_PATTERN.search(line)
     if match:
         return match.group(1) if match.group(1) else match.group(2)
     return None
@@ -97,14 +253,10 @@ def _extract_ip_from_line(line: str) -> Optional[str]:
 def parse_traceroute_line(line: str) -> Optional[Hop]:
     """Parse a traceroute line and return a Hop model"""
     # Skip lines with all asterisks (timeouts)
-    if re.match(r'^\s*\d+\s+\*\s+\*\s+\*', line):
+    if _SILENT_HOP_PATTERN.match(line):
         return None
     
-    # Pattern handles both formats:
-    # With parentheses: "1  (172.24.96.1)  0.458 ms  0.442 ms  0.440 ms"
-    # Without parentheses (with -n flag): "1  172.24.96.1  0.458 ms  0.442 ms  0.440 ms"
-    pattern = r'^\s*(\d+)\s+(?:(\S+)\s+)?(?:\((\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\)|(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}))\s+(\*|\d+\.?\d*)\s+ms\s+(\*|\d+\.?\d*)\s+ms\s+(\*|\d+\.?\d*)\s+ms'
-    match = re.match(pattern, line)
+    match = _HOP_PATTERN.match(line)
     
     if not match:
         return None
@@ -123,6 +275,108 @@ def parse_traceroute_line(line: str) -> Optional[Hop]:
         print(f"  Warning: Failed to validate hop data: {e}")
         return None
 
+def _ip_to_int(ip: str) -> int:
+    """ip as a uint32, or -1 if the text isn't how that address prints (an octet above 255, a leading zero)"""
+    try:
+        value = int.from_bytes(socket.inet_aton(ip), 'big')
+    except OSError:
+        return -1
+    return value if _int_to_ip(value) == ip else -1
+
+def _int_to_ip(value: int) -> str:
+    return f"{value >> 24}.{(value >> 16) & 255}.{(value >> 8) & 255}.{value & 255}"
+
+class HopColumns:
+    """Hops parsed from one or more traceroute outputs, stored column-wise in flat arrays.
+    Row i is hop number hop[i] of output trace[i], with its IPv4 address as a uint32 in ip[i]
+    and its minimum RTT in ping[i] (NO_PING when every probe timed out).
+    An address with an octet above 255 doesn't fit: its text is kept in odd_ips[i] and ip[i] is 0.
+    standalone holds (trace, ip) for IPs found on lines that aren't complete hops.
+    ip_values and ip_texts cache the conversions each way, as routers repeat across outputs."""
+    __slots__ = ('trace', 'hop', 'ip', 'ping', 'odd_ips', 'standalone', 'trace_count', 'ip_values', 'ip_texts')
+    
+    def __init__(self):
+        self.trace = array('I')
+        self.hop = array('I')
+        self.ip = array('I')
+        self.ping = array('i')
+        self.odd_ips: Dict[int, str] = {}
+        self.standalone: List[Tuple[int, str]] = []
+        self.trace_count = 0
+        self.ip_values: Dict[str, int] = {}
+        self.ip_texts: Dict[int, str] = {}
+    
+    def __len__(self) -> int:
+        return len(self.hop)
+    
+    def ip_at(self, row: int) -> str:
+        """The address of a row, as text"""
+        if row in self.odd_ips:
+            return self.odd_ips[row]
+        return self.ip_texts.get(self.ip[row]) or _int_to_ip(self.ip[row])
+    
+    def kept_hops(self) -> int:
+        """How many hops are past FIRST_HOP_FILTER, the ones results are made of"""
+        return sum(hop > FIRST_HOP_FILTER for hop in self.hop)
+    
+    def to_hops(self, trace: int) -> List[Hop]:
+        """Validate and return the hops of a single output, as parse_traceroute_line would"""
+        return [
+            Hop(hop=self.hop[i], ip=self.ip_at(i), ping=None if self.ping[i] == NO_PING else self.ping[i])
+            for i in range(len(self.hop)) if self.trace[i] == trace
+        ]
+
+# _HOP_PATTERN or, failing that, _IP_PATTERN's first match, for every line of a whole output at once.
+# Whitespace can't cross a newline, so each match sees no more than its line, as the per-line parser does.
+# The hostname is tried last: no line parses both with and without one, and -n output has none.
+_OUTPUT_PATTERN = re.compile(
+    '(?m)^(?:'
+    + _HOP_PATTERN.pattern[1:].replace(r'\s', r'[^\S\n]').replace(r'(?:(\S+)[^\S\n]+)?', r'(?:(\S+)[^\S\n]+)??')
+    + r'|[^\n]*?' + _IP_PATTERN.pattern + ')'
+)
+
+def parse_traceroute_outputs(outputs: Iterable[str], columns: Optional[HopColumns] = None) -> HopColumns:
+    """Parse whole traceroute outputs into HopColumns, without building a model per line.
+    Gives the same hops and standalone IPs as running parse_traceroute_line and
+    _extract_ip_from_line over each line. Pass columns to append to an existing batch."""
+    if columns is None:
+        columns = HopColumns()
+    finditer = _OUTPUT_PATTERN.finditer
+    trace_column, hop_column, ip_column, ping_column = columns.trace, columns.hop, columns.ip, columns.ping
+    odd_ips, standalone, ip_values, ip_texts = columns.odd_ips, columns.standalone, columns.ip_values, columns.ip_texts
+    for output in outputs:
+        trace = columns.trace_count
+        columns.trace_count += 1
+        first_row = len(hop_column)
+        for match in finditer(output):
+            hop, _, ip, bare_ip, ping1, ping2, ping3, standalone_ip, bare_standalone_ip = match.groups()
+            if hop is None:
+                standalone.append((trace, standalone_ip or bare_standalone_ip))
+                continue
+            ip = ip or bare_ip
+            value = ip_values.get(ip)
+            if value is None:
+                value = ip_values[ip] = _ip_to_int(ip)
+                if value >= 0:
+                    ip_texts[value] = ip
+            if value < 0:
+                odd_ips[len(hop_column)] = ip
+                value = 0
+            try:
+                ping = round(min(float(ping1), float(ping2), float(ping3)))
+            except ValueError:
+                pings = [float(p) for p in (ping1, ping2, ping3) if p != '*']
+                ping = round(min(pings)) if pings else NO_PING
+            hop_column.append(int(hop))
+            ip_column.append(value)
+            ping_column.append(ping)
+        trace_column.extend(array('I', (trace,)) * (len(hop_column) - first_row))
+    return columns
+
+def parse_traceroute_output(output: str) -> HopColumns:
+    """Parse a single traceroute output, see parse_traceroute_outputs"""
+    return parse_traceroute_outputs([output])
+
 def _check_sudo_error(stderr_lines: List[str]) -> bool:
     """Check if stderr contains sudo password error messages"""
     if not stderr_lines:
@@ -131,15 +385,25 @@ def _check_sudo_error(stderr_lines: List[str]) -> bool:
     error_keywords = ['sorry', 'incorrect password', 'authentication failure']
     return any(keyword in stderr_combined for keyword in error_keywords)
 
-def process_traceroute(target: str, debug: bool = False, sudo_password: Optional[str] = None) -> Tuple[List[Hop], List[str]]:
-    """Run traceroute and parse hops, filtering first hop for privacy.
-    Returns tuple of (hops, standalone_ips) where standalone_ips are IPs found but not in complete hops."""
+def trace_output(target: str, debug: bool = False, sudo_password: Optional[str] = None,
+                 stream: bool = False, max_silent_hops: int = MAX_SILENT_HOPS,
+                 first_ttl: int = 1, tracer: Optional[Tracer] = None) -> List[str]:
+    """Run traceroute and return its stdout lines, [] if it failed.
+    With stream=True the probe stops early, see stream_traceroute. tracer defaults to sudo traceroute."""
     print(f"Running traceroute to {target}...")
-    stdout_lines, stderr_lines, returncode = run_traceroute(target, sudo_password=sudo_password)
+    if tracer is None:
+        tracer = SudoTracer(sudo_password)
+    instrumentation.count('traces')
+    with instrumentation.timer('traceroute'):
+        if stream:
+            stdout_lines, stderr_lines, returncode = tracer.stream(target, max_silent_hops=max_silent_hops,
+                                                                   first_ttl=first_ttl)
+        else:
+            stdout_lines, stderr_lines, returncode = tracer.run(target, first_ttl=first_ttl)
     
     if sudo_password and _check_sudo_error(stderr_lines):
         print("  Error: Incorrect sudo password. Please run the script again.")
-        return [], []
+        return []
     
     if debug:
         print(f"  Debug: exit code {returncode}, {len(stdout_lines)} stdout, {len(stderr_lines)} stderr lines")
@@ -154,37 +418,117 @@ def process_traceroute(target: str, debug: bool = False, sudo_password: Optional
                     print(f"    [{i}] {repr(line)}")
     
     if not stdout_lines:
+        instrumentation.count('traces_failed')
         if debug:
             print(f"  Debug: No stdout lines returned for {target}")
-        return [], []
+    return stdout_lines
+
+def trace_columns(target: str, debug: bool = False, **options) -> HopColumns:
+    """Run traceroute (see trace_output) and parse its output in one batch. Hops up to
+    FIRST_HOP_FILTER are kept in the columns; columns_to_entries drops them."""
+    stdout_lines = trace_output(target, debug=debug, **options)
+    with instrumentation.timer('parse'):
+        columns = parse_traceroute_output('\n'.join(stdout_lines))
+    instrumentation.count('hops_parsed', len(columns))
+    instrumentation.count('standalone_ips', len(columns.standalone))
     
-    hops = []
+    if debug and stdout_lines:
+        if len(columns) > 0 and columns.kept_hops() == 0:
+            print(f"  Debug: Parsed {len(columns)} hop(s) but all were filtered (hop <= {FIRST_HOP_FILTER})")
+        elif len(columns) == 0:
+            print("  Debug: Could not parse any hop lines")
+            sample = next((line for line in stdout_lines[:10] if line.strip()), None)
+            if sample:
+                print(f"  Debug: Sample line: {repr(sample)}")
+        if columns.standalone:
+            print(f"  Debug: Found {len(columns.standalone)} standalone IP(s) for geolocation")
+    return columns
+
+def process_traceroute(target: str, debug: bool = False, sudo_password: Optional[str] = None,
+                       stream: bool = False, max_silent_hops: int = MAX_SILENT_HOPS,
+                       first_ttl: int = 1, tracer: Optional[Tracer] = None) -> Tuple[List[Hop], List[str]]:
+    """Run traceroute and parse hops, filtering first hop for privacy.
+    Returns tuple of (hops, standalone_ips) where standalone_ips are IPs found but not in complete hops.
+    Callers that only need result entries should use trace_columns, which builds no Hop models."""
+    columns = trace_columns(target, debug=debug, sudo_password=sudo_password, stream=stream,
+                            max_silent_hops=max_silent_hops, first_ttl=first_ttl, tracer=tracer)
+    hops = [hop for hop in columns.to_hops(0) if hop.hop > FIRST_HOP_FILTER]
+    return hops, [ip for _, ip in columns.standalone]
+
+def load_stop_set(filename: str = RESULTS_FILE, store_filename: str = STORE_FILE) -> Set[str]:
+    """Return every interface already known from previous results"""
+    with ResultsStore(store_filename) as store:
+        store.import_results(filename)
+        return store.interfaces()
+
+def _probe_single_hop(target: str, ttl: int, sudo_password: Optional[str] = None,
+                      tracer: Optional[Tracer] = None) -> Tuple[Optional[Hop], List[str]]:
+    """Probe a single TTL towards target. Returns (hop, standalone_ips)"""
+    if tracer is None:
+        tracer = SudoTracer(sudo_password)
+    with instrumentation.timer('traceroute_single_hop'):
+        stdout_lines, _, _ = tracer.run(target, first_ttl=ttl, max_ttl=ttl)
     standalone_ips = []
-    parsed_count = 0
     for line in stdout_lines:
-        hop_data = parse_traceroute_line(line)
-        if hop_data:
-            parsed_count += 1
-            if hop_data.hop > FIRST_HOP_FILTER:
-                hops.append(hop_data)
-        else:
-            # Even if we can't parse a complete hop, try to extract IP for geolocation
+        hop = parse_traceroute_line(line)
+        if hop and hop.hop == ttl:
+            return hop, standalone_ips
+        if not hop and not _HEADER_PATTERN.match(line):
             ip = _extract_ip_from_line(line)
             if ip:
                 standalone_ips.append(ip)
+    return None, standalone_ips
+
+def process_traceroute_with_stop_set(target: str, stop_set: Set[str], first_ttl: int = STOP_SET_FIRST_TTL,
+                                     debug: bool = False, sudo_password: Optional[str] = None,
+                                     stream: bool = False, max_silent_hops: int = MAX_SILENT_HOPS,
+                                     tracer: Optional[Tracer] = None
+                                     ) -> Tuple[List[Hop], List[str], int, Optional[Hop]]:
+    """Doubletree-style traceroute: probe forward from first_ttl, then backwards one TTL at a time
+    until a hop joins a path already in stop_set, instead of re-probing the near side every time.
+    Interfaces found are added to stop_set. Returns (hops, standalone_ips, probes_saved, anchor):
+    anchor is the known hop the path joined, which hops continue from (see format_results).
+    probes_saved counts the TTLs below the anchor that were never probed, minus the probes the
+    backward single-TTL traceroutes spent; it is negative when no hop was in stop_set."""
+    first_ttl = max(first_ttl, FIRST_HOP_FILTER + 1)
+    hops, standalone_ips = process_traceroute(target, debug=debug, sudo_password=sudo_password, stream=stream,
+                                              max_silent_hops=max_silent_hops, first_ttl=first_ttl, tracer=tracer)
     
-    if debug:
-        if parsed_count > 0 and len(hops) == 0:
-            print(f"  Debug: Parsed {parsed_count} hop(s) but all were filtered (hop <= {FIRST_HOP_FILTER})")
-        elif parsed_count == 0:
-            print("  Debug: Could not parse any hop lines")
-            sample = next((line for line in stdout_lines[:10] if line.strip()), None)
-            if sample:
-                print(f"  Debug: Sample line: {repr(sample)}")
-        if standalone_ips:
-            print(f"  Debug: Found {len(standalone_ips)} standalone IP(s) for geolocation")
+    backward_hops = []
+    anchor = None
+    backward_runs = 0
+    for ttl in range(first_ttl - 1, FIRST_HOP_FILTER, -1):
+        hop, ips = _probe_single_hop(target, ttl, sudo_password=sudo_password, tracer=tracer)
+        backward_runs += 1
+        standalone_ips.extend(ips)
+        if hop:
+            if hop.ip in stop_set:
+                anchor = hop
+                break
+            backward_hops.append(hop)
     
-    return hops, standalone_ips
+    # A destination closer than first_ttl answers every TTL from its real distance up; keep the nearest one
+    merged = []
+    for hop in reversed(backward_hops):
+        if not merged or merged[-1].ip != hop.ip:
+            merged.append(hop)
+    for hop in hops:
+        if not merged or merged[-1].ip != hop.ip:
+            merged.append(hop)
+    
+    # The anchor is already on the map: it only starts the next edge
+    if anchor is not None and merged and merged[0].ip == anchor.ip:
+        merged = merged[1:]
+    
+    stop_set.update(hop.ip for hop in merged)
+    skipped_ttls = anchor.hop - 1 if anchor is not None else 0
+    probes_saved = (skipped_ttls - backward_runs) * PROBES_PER_HOP
+    instrumentation.count('stop_set_probes_saved', probes_saved)
+    instrumentation.count('stop_set_backward_runs', backward_runs)
+    if debug:
+        joined = f"joined at TTL {anchor.hop} ({anchor.ip})" if anchor is not None else "not joined"
+        print(f"  Debug: stop-set {joined}, {backward_runs} backward run(s), saved {probes_saved} probe(s)")
+    return merged, standalone_ips, probes_saved, anchor
 
 def _calculate_hop_ping_time(current_hop: Hop, previous_hop: Optional[Hop]) -> Optional[int]:
     """Calculate ping time between two hops"""
@@ -194,17 +538,20 @@ def _calculate_hop_ping_time(current_hop: Hop, previous_hop: Optional[Hop]) -> O
         return abs(current_hop.ping - previous_hop.ping)
     return current_hop.ping
 
-def format_results(hops: List[Hop], standalone_ips: List[str] = None) -> List[ResultEntry]:
+def format_results(hops: List[Hop], standalone_ips: List[str] = None,
+                   anchor: Optional[Hop] = None) -> List[ResultEntry]:
     """Format hops into origin, destination, pingTime format.
-    Also creates entries for standalone IPs (IPs found but not in complete hops)."""
+    anchor is a hop already known that hops continue from: the first edge starts there, and no
+    edge leads into it. Also creates entries for standalone IPs (IPs found but not in complete hops)."""
     results = []
     
     # Format complete hops
     for i, hop in enumerate(hops):
+        previous_hop = hops[i-1] if i > 0 else anchor
         results.append(ResultEntry(
-            origin="unknown" if i == 0 else hops[i-1].ip,
+            origin="unknown" if previous_hop is None else previous_hop.ip,
             destination=hop.ip,
-            pingTime=_calculate_hop_ping_time(hop, hops[i-1] if i > 0 else None)
+            pingTime=_calculate_hop_ping_time(hop, previous_hop)
         ))
     
     # Add entries for standalone IPs (IPs we found but couldn't create complete hops for)
@@ -221,75 +568,333 @@ def format_results(hops: List[Hop], standalone_ips: List[str] = None) -> List[Re
     
     return results
 
-def _load_existing_results(filename: str) -> List[dict]:
-    """Load existing results from JSON file"""
-    if not os.path.exists(filename):
-        return []
-    try:
-        with open(filename, 'r') as f:
-            data = json.load(f)
-            return data if isinstance(data, list) else []
-    except (json.JSONDecodeError, IOError) as e:
-        print(f"  Warning: Could not read existing results file: {e}")
-        return []
+def outcome_results(outcome: Tuple) -> List[ResultEntry]:
+    """format_results for what process_traceroute or process_traceroute_with_stop_set returned"""
+    return format_results(outcome[0], outcome[1], anchor=outcome[3] if len(outcome) > 3 else None)
+
+def columns_to_entries(columns: HopColumns) -> List[Dict]:
+    """Format every output in columns like format_results does, dropping hops up to FIRST_HOP_FILTER.
+    Entries are the plain dicts the results store takes: the columns' types already hold, so
+    no model is built per edge."""
+    entries = []
+    standalone = columns.standalone
+    next_standalone = 0
+    odd_ips, text_of = columns.odd_ips, columns.ip_texts.get
+    current = -1
+    previous_ip = None
+    previous_ping = NO_PING
+    for row, (trace, hop, value, ping) in enumerate(zip(columns.trace, columns.hop, columns.ip, columns.ping)):
+        if trace != current:
+            # The standalone IPs of earlier outputs follow their hops
+            while next_standalone < len(standalone) and standalone[next_standalone][0] < trace:
+                entries.append({'origin': 'unknown', 'destination': standalone[next_standalone][1], 'pingTime': None})
+                next_standalone += 1
+            current, previous_ip, previous_ping = trace, None, NO_PING
+        if hop <= FIRST_HOP_FILTER:
+            continue
+        ip = odd_ips[row] if odd_ips and row in odd_ips else text_of(value) or _int_to_ip(value)
+        if previous_ip is not None and previous_ping != NO_PING and ping != NO_PING:
+            ping_time = abs(ping - previous_ping)
+        else:
+            ping_time = None if ping == NO_PING else ping
+        entries.append({'origin': 'unknown' if previous_ip is None else previous_ip, 'destination': ip,
+                        'pingTime': ping_time})
+        previous_ip, previous_ping = ip, ping
+    for _, ip in standalone[next_standalone:]:
+        entries.append({'origin': 'unknown', 'destination': ip, 'pingTime': None})
+    return entries
+
+def outcome_entries(outcome) -> List[Dict]:
+    """Result entries for what trace_columns, process_traceroute or process_traceroute_with_stop_set returned"""
+    if isinstance(outcome, HopColumns):
+        return columns_to_entries(outcome)
+    return [entry.model_dump() for entry in outcome_results(outcome)]
+
+def save_results(results: List[ResultEntry], filename: str = RESULTS_FILE, store_filename: str = STORE_FILE):
+    """Add results to the append-only store, merging the pings of (origin, destination) pairs already seen
+    into their latency aggregates, then export the new and re-measured hops to the results file"""
+    save_entries([entry.model_dump() for entry in results], filename, store_filename)
 
-def save_results(results: List[ResultEntry], filename: str = RESULTS_FILE):
-    """Save results to JSON file, avoiding duplicates to preserve geolocation data"""
-    if not results:
+def save_entries(entries: List[Dict], filename: str = RESULTS_FILE, store_filename: str = STORE_FILE):
+    """save_results for entries already in dict form, such as columns_to_entries returns"""
+    if not entries:
         print("No results to save")
         return
     
-    existing_results = _load_existing_results(filename)
-    existing_keys = {(e.get('origin', 'unknown'), e.get('destination', '')) for e in existing_results}
+    with instrumentation.timer('save'), ResultsStore(store_filename) as store:
+        imported_count = store.import_results(filename)
+        if imported_count > 0:
+            print(f"  Imported {imported_count} existing hop(s) from {filename} into {store_filename}")
+        
+        added_count, merged_count = store.add(entries)
+        instrumentation.count('hops_added', added_count)
+        instrumentation.count('hops_merged', merged_count)
+        if added_count > 0:
+            print(f"  Added {added_count} new hop(s)")
+        if merged_count > 0:
+            print(f"  Merged {merged_count} repeat measurement(s) into existing hops (median ping is exported)")
+        
+        store.export_results(filename)
+
+def _resolve_ipv4(target: str) -> Optional[str]:
+    try:
+        return socket.gethostbyname(target)
+    except (OSError, UnicodeError):
+        return None
+
+def _destination_prefix(target: str) -> str:
+    """Return the destination /24 of a target, or the target itself if it can't be resolved"""
+    ip = _resolve_ipv4(target)
+    if ip is None:
+        return target
+    return str(ipaddress.ip_network(f"{ip}/{DESTINATION_PREFIX_LENGTH}", strict=False))
+
+def schedule_traceroutes(targets: List[str], trace: Callable[[str], T], workers: int = DEFAULT_WORKERS,
+                         per_prefix: int = MAX_TRACES_PER_PREFIX) -> List[T]:
+    """Run trace(target) for every target on a pool of workers.
+    At most per_prefix traces run at once towards the same destination prefix, so a single
+    upstream router isn't flooded. Results are returned in the same order as targets."""
+    if workers <= 1:
+        return [trace(target) for target in targets]
     
-    new_results = []
-    skipped_count = 0
-    for entry in results:
-        key = (entry.origin, entry.destination)
-        if key not in existing_keys:
-            new_results.append(entry.model_dump())
-            existing_keys.add(key)
-        else:
-            skipped_count += 1
+    prefix_limits: Dict[str, threading.Semaphore] = {}
+    limits_lock = threading.Lock()
+    
+    def run(target: str) -> T:
+        prefix = _destination_prefix(target)
+        with limits_lock:
+            limit = prefix_limits.setdefault(prefix, threading.Semaphore(max(1, per_prefix)))
+        with limit:
+            return trace(target)
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run, targets))
+
+def preflight_targets(targets: List[str], resolver: target_resolver.Resolver = target_resolver.system_resolver,
+                      prefix_length: int = 32, skip_anycast: bool = False, debug: bool = False,
+                      anycast_shared: int = target_resolver.ANYCAST_SHARED_TARGETS,
+                      names: Optional[Dict[str, str]] = None) -> List[str]:
+    """Resolve targets concurrently and return one literal address to trace per address (or prefix).
+    names, if given, gets the first target each of those addresses stands for."""
+    cache = target_resolver.DnsCache()
+    try:
+        with instrumentation.timer('resolve'):
+            plan = target_resolver.resolve_targets(targets, resolver=resolver, cache=cache,
+                                                   prefix_length=prefix_length, shared_targets=anycast_shared)
+    finally:
+        cache.close()
+    instrumentation.count('dns_cache_hits', plan.cache_hits)
+    instrumentation.count('targets_unresolved', len(plan.unresolved))
+    instrumentation.count('traces_avoided', plan.traces_avoided)
+    instrumentation.count('targets_anycast', len(plan.anycast))
+    
+    print(f"Resolved {plan.resolved} of {len(targets)} target(s) to {len(plan.traces)} address(es) "
+          f"({plan.cache_hits} from {target_resolver.DNS_CACHE_FILE})")
+    for target in plan.unresolved:
+        print(f"  Warning: could not resolve {target}, skipping it")
+    if plan.traces_avoided > 0:
+        grouping = "address" if prefix_length >= 32 else f"/{prefix_length}"
+        print(f"  One traceroute per {grouping} avoided {plan.traces_avoided} traceroute(s), "
+              f"up to {plan.traces_avoided * DEFAULT_MAX_TTL * PROBES_PER_HOP:,} probes")
+        if debug:
+            for trace in plan.traces:
+                if len(plan.targets_of[trace]) > 1:
+                    print(f"  Debug: {trace} stands for {', '.join(plan.targets_of[trace])}")
+    
+    traces = plan.traces
+    for trace in plan.traces:
+        if trace in plan.anycast:
+            print(f"  Likely anycast: {trace} ({', '.join(plan.targets_of[trace])})"
+                  + (", skipping it" if skip_anycast else ""))
+    if skip_anycast:
+        traces = [trace for trace in traces if trace not in plan.anycast]
+    if names is not None:
+        names.update((trace, plan.targets_of[trace][0]) for trace in traces)
+    return traces
+
+def collect_shard(targets: List[str], trace: Callable[[str], Tuple], writer: 'shards.ShardWriter',
+                  stop: threading.Event, workers: int = DEFAULT_WORKERS,
+                  per_prefix: int = MAX_TRACES_PER_PREFIX, names: Optional[Dict[str, str]] = None
+                  ) -> Tuple[int, int, bool]:
+    """Trace the targets writer hasn't recorded yet, writing each one's results as soon as it finishes.
+    A target is recorded under its name in names (see preflight_targets) if it has one, so resuming
+    doesn't depend on DNS giving the same address again.
+    Once stop is set no new trace starts, and those running get shards.SHUTDOWN_GRACE seconds.
+    Returns (targets written, targets left, whether the run was stopped)."""
+    names = names or {}
+    pending = [target for target in targets if names.get(target, target) not in writer.done]
     
-    if len(new_results) > 0:
-        print(f"  Added {len(new_results)} new hop(s)")
-    if skipped_count > 0:
-        print(f"  Skipped {skipped_count} duplicate entries (preserving existing geolocation data)")
+    def collect(target: str):
+        if stop.is_set():
+            return
+        entries = outcome_entries(trace(target))
+        if writer.write(names.get(target, target), entries):
+            print(f"  Checkpointed {target}: {len(entries)} result(s)")
     
-    with open(filename, 'w') as f:
-        json.dump(existing_results + new_results, f, indent=2)
+    # Run off the main thread, which has to stay free to handle SIGTERM
+    runner = threading.Thread(
+        target=schedule_traceroutes, args=(pending, collect), kwargs=dict(workers=workers, per_prefix=per_prefix),
+        daemon=True
+    )
+    runner.start()
+    while runner.is_alive() and not stop.is_set():
+        runner.join(0.5)
+    if stop.is_set():
+        runner.join(shards.SHUTDOWN_GRACE)
+    writer.close()
+    # Counted here rather than in collect, which runs on the worker threads
+    written = sum(names.get(target, target) in writer.done for target in pending)
+    return written, len(pending) - written, stop.is_set()
+
+def merge_shard_files(directory: str = shards.SHARD_DIR):
+    """Merge every shard file in directory into results.json"""
+    filenames = shards.find_shards(directory)
+    if not filenames:
+        print(f"No shard files found in {directory}")
+        return
+    print(f"Merging {len(filenames)} shard file(s) from {directory}")
+    targets, added, merged = shards.merge_shards(filenames)
+    print(f"\nMerged {targets} target(s) into {RESULTS_FILE}: {added} new hop(s), "
+          f"{merged} repeat measurement(s) folded into existing hops")
+
+def tracer_from_args(argv: List[str]) -> Tuple[Optional[Tracer], Optional[str]]:
+    """The tracer argv asks for: recorded outputs with --replay PATH, made-up ones with --synthetic
+    (both take --latency MS per hop), else sudo traceroute, saved to a directory with --record DIR.
+    Returns (tracer, sudo password); tracer is None when the password is wrong."""
+    replay_path = get_flag(argv, '--replay', None)
+    record_dir = get_flag(argv, '--record', None)
+    if replay_path is not None or '--synthetic' in argv:
+        # Imported here since replay_tracer builds on this module
+        import replay_tracer
+        latency = get_flag(argv, '--latency', replay_tracer.DEFAULT_LATENCY_MS, float)
+        tracer = replay_tracer.ReplayTracer(
+            outputs=replay_tracer.load_recorded(replay_path) if replay_path else None,
+            network=replay_tracer.SyntheticNetwork() if '--synthetic' in argv else None,
+            latency_ms=latency,
+        )
+        print(f"Replaying {'recorded' if replay_path else 'synthetic'} traceroutes ({latency:g} ms per hop)")
+        return tracer, None
+    
+    print("traceroute -I requires root privileges.")
+    sudo_password = get_sudo_password()
+    if not validate_sudo_password(sudo_password):
+        print("Error: Incorrect sudo password. Please run the script again.")
+        return None, None
+    print("Using sudo for traceroute commands...")
+    tracer = SudoTracer(sudo_password)
+    if record_dir is not None:
+        import replay_tracer
+        tracer = replay_tracer.RecordingTracer(tracer, record_dir)
+        print(f"Recording traceroute outputs to {record_dir}")
+    return tracer, sudo_password
 
 def main():
     import sys
+    global _sudo_password
     debug_mode = '--debug' in sys.argv
+    workers = max(1, get_flag(sys.argv, '--workers', DEFAULT_WORKERS, int))
+    per_prefix = max(1, get_flag(sys.argv, '--per-prefix', MAX_TRACES_PER_PREFIX, int))
+    stream_mode = '--stream' in sys.argv
+    max_silent_hops = max(1, get_flag(sys.argv, '--max-silent', MAX_SILENT_HOPS, int))
+    stop_set_mode = '--stop-set' in sys.argv
+    first_ttl = max(FIRST_HOP_FILTER + 1, get_flag(sys.argv, '--first-ttl', STOP_SET_FIRST_TTL, int))
+    shard_dir = get_flag(sys.argv, '--shard-dir', shards.SHARD_DIR)
+    
+    resolve_mode = '--no-resolve' not in sys.argv
+    dedup_prefix = min(32, max(8, get_flag(sys.argv, '--dedup-prefix', 32, int)))
+    skip_anycast = '--skip-anycast' in sys.argv
+    anycast_shared = max(0, get_flag(sys.argv, '--anycast-shared', target_resolver.ANYCAST_SHARED_TARGETS, int))
+    hosts_file = get_flag(sys.argv, '--hosts', None)
+    
+    if '--merge' in sys.argv:
+        merge_shard_files(shard_dir)
+        return
+    
+    shard = None
+    shard_spec = get_flag(sys.argv, '--shard', None)
+    if shard_spec is not None:
+        try:
+            shard = shards.parse_shard_spec(shard_spec)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
     
     targets = read_targets()
     if not targets:
         print(f"No targets found. Please ensure {TARGETS_FILE} contains an array of IPv4 addresses.")
         return
     
+    writer = None
+    names: Dict[str, str] = {}  # Address traced -> the first target it stands for
+    if resolve_mode:
+        resolver = target_resolver.HostsResolver(hosts_file) if hosts_file else target_resolver.system_resolver
+        targets = preflight_targets(targets, resolver=resolver, prefix_length=dedup_prefix,
+                                    skip_anycast=skip_anycast, debug=debug_mode, anycast_shared=anycast_shared,
+                                    names=names)
+        if not targets:
+            print("No targets left to traceroute after resolution.")
+            return
+    if shard is not None:
+        # Split and checkpoint by name, not address (see shards)
+        total_targets = len(targets)
+        targets = shards.shard_targets(targets, *shard, names=names)
+        print(f"Shard {shard[0]}/{shard[1]}: {len(targets)} of {total_targets} target(s)")
+        writer = shards.ShardWriter(shards.shard_filename(*shard, directory=shard_dir))
+        print(f"{sum(names.get(t, t) in writer.done for t in targets)} target(s) already in {writer.filename}")
+    
     print(f"Found {len(targets)} target(s) to traceroute")
     if debug_mode:
         print("Debug mode enabled")
+    if stream_mode:
+        print(f"Streaming mode: stopping at the destination or after {max_silent_hops} silent hop(s)")
+    stop_set = None
+    if stop_set_mode:
+        stop_set = load_stop_set()
+        print(f"Stop-set mode: {len(stop_set)} known interface(s), probing forward from TTL {first_ttl}")
     
-    print("traceroute -I requires root privileges.")
-    sudo_password = get_sudo_password()
-    print("Using sudo for traceroute commands...")
+    tracer, sudo_password = tracer_from_args(sys.argv)
+    if tracer is None:
+        return
+    if workers > 1:
+        print(f"Running with {workers} workers, at most {per_prefix} per /{DESTINATION_PREFIX_LENGTH} destination")
     
     all_results = []
     successful_targets = 0
     failed_targets = 0
+    probes_saved = 0
     
-    for target in targets:
-        hops, standalone_ips = process_traceroute(target, debug=debug_mode, sudo_password=sudo_password)
-        
-        if hops or standalone_ips:
-            results = format_results(hops, standalone_ips)
-            all_results.extend(results)
+    trace_options = dict(debug=debug_mode, sudo_password=sudo_password, stream=stream_mode,
+                         max_silent_hops=max_silent_hops, tracer=tracer)
+    if stop_set is not None:
+        trace = partial(process_traceroute_with_stop_set, stop_set=stop_set, first_ttl=first_ttl, **trace_options)
+    else:
+        # Results only need entries: parse each output in one batch, no Hop models
+        trace = partial(trace_columns, **trace_options)
+    
+    if writer is not None:
+        written, left, stopped = collect_shard(targets, trace, writer, shards.stop_on_sigterm(),
+                                               workers=workers, per_prefix=per_prefix, names=names)
+        print(f"\nCheckpointed {written} target(s) to {writer.filename}, {left} left")
+        _sudo_password = None
+        if stopped:
+            # Traceroutes still running can't be interrupted; everything written is already on disk
+            print("Stopped early, rerun the same --shard to resume")
+            instrumentation.flush_report()
+            sys.stdout.flush()
+            os._exit(shards.EXIT_PREEMPTED)
+        return
+    
+    outcomes = schedule_traceroutes(targets, trace, workers=workers, per_prefix=per_prefix)
+    
+    for target, outcome in zip(targets, outcomes):
+        if stop_set is not None:
+            probes_saved += outcome[2]
+            hop_count, ip_count = len(outcome[0]), len(outcome[1])
+        else:
+            hop_count, ip_count = outcome.kept_hops(), len(outcome.standalone)
+        if hop_count or ip_count:
+            all_results.extend(outcome_entries(outcome))
             successful_targets += 1
-            hop_count = len(hops)
-            ip_count = len(standalone_ips)
             if hop_count > 0 and ip_count > 0:
                 print(f"  Processed {hop_count} hop(s) and {ip_count} standalone IP(s) for {target}")
             elif hop_count > 0:
@@ -298,19 +903,26 @@ def main():
                 print(f"  Processed {ip_count} standalone IP(s) for {target}")
         else:
             failed_targets += 1
-            print(f"  No hops or IPs found")
+            print(f"  No hops or IPs found for {target}")
     
     if all_results:
-        save_results(all_results)
+        save_entries(all_results)
         print(f"\nSaved {len(all_results)} result(s) to {RESULTS_FILE}")
         print(f"Summary: {successful_targets} target(s) succeeded, {failed_targets} target(s) failed")
     else:
         print("\nNo results to save - all traceroutes failed or returned no parseable hops/IPs")
         print(f"Summary: {failed_targets} target(s) failed")
     
+    if stop_set is not None:
+        if probes_saved >= 0:
+            print(f"Stop-set saved {probes_saved:,} probe(s) across {len(targets)} target(s)")
+        else:
+            print(f"Stop-set cost {-probes_saved:,} extra probe(s) across {len(targets)} target(s)")
+    
     # Clear sudo password from memory for security
-    global _sudo_password
     _sudo_password = None
 
 if __name__ == '__main__':
-    main()
+    import sys
+    with instrumentation.run_report('unix', sys.argv):
+        main()
@@ -12,10 +12,12 @@ import { ErrorScreen } from "./components/ErrorScreen";
 import { LoadingScreen } from "./components/LoadingScreen";
 import { MapBoundsController } from "./components/MapBoundsController";
 import { MapLegend } from "./components/MapLegend";
+import { TiledNetwork } from "./components/TiledNetwork";
 import { ToggleControls } from "./components/ToggleControls";
 import { WrappedLocationMarker } from "./components/WrappedLocationMarker";
 import { WrappedNetworkEdge } from "./components/WrappedNetworkEdge";
 import { useResultsData } from "./hooks/useResultsData";
+import { useTileIndex } from "./hooks/useTileIndex";
 import { useUniqueNodes } from "./hooks/useUniqueNodes";
 import type { ResultEntry } from "./types";
 
@@ -31,11 +33,15 @@ const DefaultIcon = L.icon({
 L.Marker.prototype.options.icon = DefaultIcon;
 
 function App() {
-  const { data, loading, error } = useResultsData();
-  const nodes = useUniqueNodes(data);
+  // With tiles, only what's in view is fetched; otherwise every hop is loaded up front
+  const { index: tileIndex, loading: tilesLoading } = useTileIndex();
+  const { data, nodes: bundledNodes, loading, error } = useResultsData(
+    !tilesLoading && !tileIndex
+  );
+  const nodes = useUniqueNodes(data, bundledNodes);
   const [showEdges, setShowEdges] = useState(true);
 
-  if (loading) {
+  if (tilesLoading || (!tileIndex && loading)) {
     return <LoadingScreen />;
   }
 
@@ -60,18 +66,24 @@ function App() {
           attribution='&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
           url="https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png"
         />
-        <MapBoundsController data={data} />
+        {tileIndex ? (
+          <TiledNetwork index={tileIndex} showEdges={showEdges} />
+        ) : (
+          <>
+            <MapBoundsController data={data} />
 
-        {/* Render nodes (markers) */}
-        {Array.from(nodes.values()).map((geo, index) => (
-          <WrappedLocationMarker key={index} geo={geo} index={index} />
-        ))}
+            {/* Render nodes (markers) */}
+            {nodes.map((geo, index) => (
+              <WrappedLocationMarker key={index} geo={geo} index={index} />
+            ))}
 
-        {/* Render edges (polylines) */}
-        {showEdges &&
-          data.map((entry: ResultEntry, index) => (
-            <WrappedNetworkEdge key={index} entry={entry} index={index} />
-          ))}
+            {/* Render edges (polylines) */}
+            {showEdges &&
+              data.map((entry: ResultEntry, index) => (
+                <WrappedNetworkEdge key={index} entry={entry} index={index} />
+              ))}
+          </>
+        )}
       </MapContainer>
     </div>
   );
@@ -14,7 +14,7 @@ export function NetworkEdge({ entry, index }: NetworkEdgeProps) {
     return null;
   }
 
-  const color = getEdgeColor(entry.pingTime);
+  const color = entry.pingTime === null ? "gray" : getEdgeColor(entry.pingTime);
   const positions = [
     [entry.origin_geo.latitude, entry.origin_geo.longitude],
     [entry.destination_geo.latitude, entry.destination_geo.longitude],
@@ -41,7 +41,9 @@ export function NetworkEdge({ entry, index }: NetworkEdgeProps) {
   const destinationDisplay = `${entry.destination_geo.city}, ${entry.destination_geo.country}`;
   const pingDisplay =
     entry.pingTime !== null && entry.pingTime !== undefined
-      ? `${entry.pingTime} ms`
+      ? entry.samples && entry.samples > 1
+        ? `${entry.pingTime} ms (median of ${entry.samples}, min ${entry.pingMin} ms, p90 ${entry.pingP90} ms)`
+        : `${entry.pingTime} ms`
       : "N/A";
 
   return (
@@ -0,0 +1,160 @@
+import { Fragment, useEffect, useRef, useState } from "react";
+import { CircleMarker, Popup, useMap } from "react-leaflet";
+import { TILES_URL } from "../hooks/useTileIndex";
+import type { MapTile, TileCluster, TileEdge, TileIndex } from "../types";
+import { calculateDistance, getEdgeColor } from "../utils";
+import { BorderPolyline } from "./BorderPolyline";
+import { EdgeWithTooltip } from "./EdgeWithTooltip";
+
+interface TiledNetworkProps {
+  index: TileIndex;
+  showEdges: boolean;
+}
+
+interface VisibleTile {
+  tile: MapTile;
+  // Longitude shift of the world copy this tile is shown in
+  offset: number;
+}
+
+const EMPTY_TILE = { clusters: [], edges: [] };
+
+function tileX(lng: number, scale: number): number {
+  return Math.floor(((lng + 180) / 360) * scale);
+}
+
+function tileY(lat: number, scale: number): number {
+  const sin = Math.sin((Math.max(-85.0511, Math.min(85.0511, lat)) * Math.PI) / 180);
+  const y = (0.5 - Math.log((1 + sin) / (1 - sin)) / (4 * Math.PI)) * scale;
+  return Math.max(0, Math.min(scale - 1, Math.floor(y)));
+}
+
+function edgeDisplay(edge: TileEdge) {
+  const [, aLat, aLon, , bLat, bLon, hops, mean, min, max] = edge;
+  const distanceKm = calculateDistance(aLat, aLon, bLat, bLon) / 1000;
+  const pingDisplay =
+    mean === null
+      ? "N/A"
+      : hops > 1
+      ? `${mean} ms (mean of ${hops} hops, min ${min} ms, max ${max} ms)`
+      : `${mean} ms`;
+  return { distanceDisplay: `${distanceKm.toFixed(2)} km`, pingDisplay };
+}
+
+/**
+ * Renders the clusters and merged edges of the tiles in view, at the tile zoom closest to
+ * the map's. Tiles are fetched as the map moves and kept for the rest of the session.
+ */
+export function TiledNetwork({ index, showEdges }: TiledNetworkProps) {
+  const map = useMap();
+  const cache = useRef(new Map<string, Promise<MapTile>>());
+  const [visible, setVisible] = useState<VisibleTile[]>([]);
+
+  useEffect(() => {
+    let current = true;
+
+    const fetchTile = (z: number, x: number, y: number) => {
+      const key = `${z}/${x}/${y}`;
+      let tile = cache.current.get(key);
+      if (!tile) {
+        // A tile with nothing in it was never written
+        tile = fetch(`${TILES_URL}/${key}.json?v=${index.revision}`)
+          .then((response) => (response.ok ? response.json() : { z, x, y, ...EMPTY_TILE }))
+          .catch(() => ({ z, x, y, ...EMPTY_TILE }));
+        cache.current.set(key, tile);
+      }
+      return tile;
+    };
+
+    const update = async () => {
+      const zoom = Math.max(index.minZoom, Math.min(index.maxZoom, Math.round(map.getZoom())));
+      const scale = 1 << zoom;
+      const bounds = map.getBounds();
+      const [west, east] = [tileX(bounds.getWest(), scale), tileX(bounds.getEast(), scale)];
+      const [north, south] = [tileY(bounds.getNorth(), scale), tileY(bounds.getSouth(), scale)];
+
+      const requests: Promise<VisibleTile>[] = [];
+      for (let x = west; x <= Math.min(east, west + 2 * scale - 1); x++) {
+        const wrapped = ((x % scale) + scale) % scale;
+        const offset = ((x - wrapped) / scale) * 360;
+        for (let y = north; y <= south; y++) {
+          requests.push(fetchTile(zoom, wrapped, y).then((tile) => ({ tile, offset })));
+        }
+      }
+      const tiles = await Promise.all(requests);
+      if (current) {
+        setVisible(tiles);
+      }
+    };
+
+    update();
+    map.on("moveend", update);
+    map.on("zoomend", update);
+
+    return () => {
+      current = false;
+      map.off("moveend", update);
+      map.off("zoomend", update);
+    };
+  }, [map, index]);
+
+  // A cluster is in one tile, but an edge is in every tile it crosses
+  const clusters = new Map<string, TileCluster>();
+  const edges = new Map<string, TileEdge>();
+  visible.forEach(({ tile, offset }) => {
+    tile.clusters.forEach((cluster) => {
+      const [id, lat, lon, ...rest] = cluster;
+      clusters.set(`${offset}:${id}`, [id, lat, lon + offset, ...rest]);
+    });
+    tile.edges.forEach((edge) => {
+      const [aId, aLat, aLon, bId, bLat, bLon, ...rest] = edge;
+      edges.set(`${offset}:${aId}-${bId}`, [aId, aLat, aLon + offset, bId, bLat, bLon + offset, ...rest]);
+    });
+  });
+
+  return (
+    <>
+      {Array.from(clusters, ([key, [, lat, lon, nodes, label]]) => (
+        <CircleMarker
+          key={key}
+          center={[lat, lon]}
+          radius={Math.min(4 + Math.log2(nodes) * 2, 16)}
+          pathOptions={{ color: "#1f4e79", fillColor: "#3388ff", fillOpacity: 0.8, weight: 1 }}
+        >
+          <Popup>
+            {label || "Unknown"}
+            {nodes > 1 && ` (${nodes} locations)`}
+          </Popup>
+        </CircleMarker>
+      ))}
+      {showEdges &&
+        Array.from(edges, ([key, edge]) => {
+          const [, aLat, aLon, , bLat, bLon, , mean] = edge;
+          const positions = [
+            [aLat, aLon],
+            [bLat, bLon],
+          ] as [[number, number], [number, number]];
+          const { distanceDisplay, pingDisplay } = edgeDisplay(edge);
+          // The far end's cluster may be in a tile out of view
+          const labelOf = (id: string, lat: number, lon: number) =>
+            clusters.get(`${key.split(":")[0]}:${id}`)?.[4] ||
+            `${lat.toFixed(2)}, ${lon.toFixed(2)}`;
+          return (
+            <Fragment key={key}>
+              <BorderPolyline positions={positions} isHighlighted={false} />
+              <EdgeWithTooltip
+                positions={positions}
+                color={mean === null ? "gray" : getEdgeColor(mean)}
+                weight={3}
+                opacity={0.8}
+                originDisplay={labelOf(edge[0], aLat, aLon)}
+                destinationDisplay={labelOf(edge[3], bLat, bLon)}
+                pingDisplay={pingDisplay}
+                distanceDisplay={distanceDisplay}
+              />
+            </Fragment>
+          );
+        })}
+    </>
+  );
+}
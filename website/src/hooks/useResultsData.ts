@@ -1,28 +1,65 @@
 import { useEffect, useState } from "react";
-import type { ResultsData } from "../types";
+import type { GeoLocation, ResultsData } from "../types";
+import { toResultsData } from "../utils";
+import { fetchBundle } from "../utils/bundle";
+import { fetchDelta } from "../utils/delta";
 
 // GitHub Gist raw URL for results.json
 const RESULTS_JSON_URL =
   "https://gist.githubusercontent.com/MatthewLacerda2/e087768cee30773ac20c7eec2e16fdfb/raw/results.json";
 
-export function useResultsData() {
+// Manifest of the binary bundle written by traceroute-app/export_bundle.py
+const RESULTS_BUNDLE_URL =
+  import.meta.env.VITE_RESULTS_BUNDLE_URL ??
+  `${import.meta.env.BASE_URL}data/bundle.json`;
+
+// Manifest of the base snapshot and patches written by traceroute-app/publish_delta.py
+const RESULTS_DELTA_URL =
+  import.meta.env.VITE_RESULTS_DELTA_URL ??
+  `${import.meta.env.BASE_URL}data/delta/delta.json`;
+
+// enabled: false skips loading, e.g. while the map is served from tiles instead
+export function useResultsData(enabled = true) {
   const [data, setData] = useState<ResultsData>([]);
+  // Deduplicated locations, when the bundle already provides them
+  const [nodes, setNodes] = useState<GeoLocation[] | null>(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
 
   useEffect(() => {
+    if (!enabled) {
+      return;
+    }
+
+    const fetchJson = async () => {
+      const response = await fetch(RESULTS_JSON_URL);
+
+      if (!response.ok) {
+        throw new Error(`Failed to fetch data: ${response.statusText}`);
+      }
+
+      const jsonData = await response.json();
+      setData(toResultsData(jsonData));
+    };
+
     const fetchData = async () => {
       try {
         setLoading(true);
         setError(null);
-        const response = await fetch(RESULTS_JSON_URL);
-
-        if (!response.ok) {
-          throw new Error(`Failed to fetch data: ${response.statusText}`);
+        try {
+          setData(await fetchDelta(RESULTS_DELTA_URL));
+          return;
+        } catch (deltaError) {
+          console.warn("Published patches unavailable, loading the bundle:", deltaError);
+        }
+        try {
+          const bundle = await fetchBundle(RESULTS_BUNDLE_URL);
+          setNodes(bundle.nodes);
+          setData(bundle.data);
+        } catch (bundleError) {
+          console.warn("Results bundle unavailable, loading results.json:", bundleError);
+          await fetchJson();
         }
-
-        const jsonData = await response.json();
-        setData(jsonData as ResultsData);
       } catch (err) {
         setError(err instanceof Error ? err.message : "Failed to load data");
         console.error("Error fetching results.json:", err);
@@ -32,7 +69,7 @@ export function useResultsData() {
     };
 
     fetchData();
-  }, []);
+  }, [enabled]);
 
-  return { data, loading, error };
+  return { data, nodes, loading, error };
 }
@@ -0,0 +1,34 @@
+import { useEffect, useState } from "react";
+import type { TileIndex } from "../types";
+
+// Level-of-detail tiles written by traceroute-app/tile_results.py
+export const TILES_URL =
+  import.meta.env.VITE_TILES_URL ?? `${import.meta.env.BASE_URL}tiles`;
+
+/** The tile index, or null once it's known there are no tiles to load */
+export function useTileIndex() {
+  const [index, setIndex] = useState<TileIndex | null>(null);
+  const [loading, setLoading] = useState(true);
+
+  useEffect(() => {
+    const fetchIndex = async () => {
+      try {
+        const response = await fetch(`${TILES_URL}/index.json`, {
+          cache: "no-cache",
+        });
+        if (!response.ok) {
+          throw new Error(`Failed to fetch tile index: ${response.statusText}`);
+        }
+        setIndex(await response.json());
+      } catch (err) {
+        console.warn("Map tiles unavailable, loading all results:", err);
+      } finally {
+        setLoading(false);
+      }
+    };
+
+    fetchIndex();
+  }, []);
+
+  return { index, loading };
+}
@@ -1,8 +1,16 @@
 import { useMemo } from "react";
 import type { GeoLocation, ResultsData } from "../types";
 
-export function useUniqueNodes(data: ResultsData): Map<string, GeoLocation> {
+export function useUniqueNodes(
+  data: ResultsData,
+  bundledNodes: GeoLocation[] | null = null
+): GeoLocation[] {
   return useMemo(() => {
+    // The bundle export already deduplicated them
+    if (bundledNodes) {
+      return bundledNodes;
+    }
+
     const nodes = new Map<string, GeoLocation>();
 
     data.forEach((entry) => {
@@ -26,6 +34,6 @@ export function useUniqueNodes(data: ResultsData): Map<string, GeoLocation> {
       Array.from(nodes.values()).map((g) => `${g.city}, ${g.country}`)
     );
 
-    return nodes;
-  }, [data]);
+    return Array.from(nodes.values());
+  }, [data, bundledNodes]);
 }
@@ -9,9 +9,111 @@ export interface GeoLocation {
 export interface ResultEntry {
   origin: string;
   destination: string;
-  pingTime: number;
+  // null when no probe to the hop got a reply
+  pingTime: number | null;
+  // Latency aggregates, present once a hop has been measured by the collector
+  pingMin?: number | null;
+  pingP90?: number | null;
+  samples?: number;
   origin_geo?: GeoLocation | null;
   destination_geo?: GeoLocation | null;
 }
 
 export type ResultsData = ResultEntry[];
+
+// Normalized layout written by traceroute-app/results_io.py: every IP and location is stored once
+export interface NormalizedResults {
+  format: "traceroute-results/normalized";
+  version: number;
+  locations: GeoLocation[];
+  // [ip, location index (null: lookup failed, -1: not looked up), geozone id]
+  nodes: [string, number | null, string | null][];
+  // notLookedUp, when present, flags endpoints a hop has no lookup for (1: origin, 2: destination)
+  edgeFields: string[];
+  edges: (number | null)[][];
+}
+
+// bundle.json written by traceroute-app/export_bundle.py
+export interface BundleManifest {
+  version: number;
+  file: string;
+  encodings: Partial<Record<"gzip" | "br", string>>;
+  sha256: string;
+  bytes: number;
+  nodes: number;
+  edges: number;
+}
+
+// tiles/index.json written by traceroute-app/tile_results.py
+export interface TileIndex {
+  version: number;
+  minZoom: number;
+  maxZoom: number;
+  clusterBits: number;
+  revision: number;
+}
+
+// [cluster id, latitude, longitude, location count, label]
+export type TileCluster = [string, number, number, number, string];
+
+// [a id, a latitude, a longitude, b id, b latitude, b longitude, hops, mean ping, min ping, max ping]
+export type TileEdge = [
+  string,
+  number,
+  number,
+  string,
+  number,
+  number,
+  number,
+  number | null,
+  number | null,
+  number | null
+];
+
+// One tiles/{z}/{x}/{y}.json file
+export interface MapTile {
+  z: number;
+  x: number;
+  y: number;
+  clusters: TileCluster[];
+  edges: TileEdge[];
+}
+
+// A file listed in data/delta/delta.json, written by traceroute-app/publish_delta.py
+export interface DeltaFile {
+  file: string;
+  encodings: Partial<Record<"gzip", string>>;
+  sha256: string;
+  bytes: number;
+}
+
+export interface DeltaManifest {
+  version: number;
+  head: number;
+  base: DeltaFile & { version: number };
+  patches: (DeltaFile & { from: number; to: number })[];
+  nodes: number;
+  edges: number;
+}
+
+// A node's location, null when the lookup failed, -1 when it wasn't looked up
+export type DeltaGeo = GeoLocation | null | -1;
+
+// patch-<version>.json: what changed from one published version to the next
+export interface ResultsPatch {
+  format: "traceroute-results/patch";
+  version: number;
+  from: number;
+  to: number;
+  edgeFields: string[];
+  nodes: {
+    added: [string, DeltaGeo][];
+    changed: [string, DeltaGeo][];
+    removed: string[];
+  };
+  edges: {
+    added: (string | number | null)[][];
+    changed: (string | number | null)[][];
+    removed: [string, string][];
+  };
+}
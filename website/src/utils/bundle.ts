@@ -0,0 +1,137 @@
+import type { BundleManifest, GeoLocation, ResultEntry } from "../types";
+
+const BUNDLE_MAGIC = "WWMB";
+const BUNDLE_VERSION = 1;
+const HEADER_BYTES = 24;
+const NO_PING = -1;
+
+export interface DecodedBundle {
+  nodes: GeoLocation[];
+  data: ResultEntry[];
+}
+
+function align8(offset: number): number {
+  return (offset + 7) & ~7;
+}
+
+/**
+ * Decode a bundle from traceroute-app/export_bundle.py. Locations are already deduplicated,
+ * and every edge references the shared GeoLocation objects of its two ends.
+ */
+export function decodeBundle(buffer: ArrayBuffer): DecodedBundle {
+  const header = new DataView(buffer, 0, HEADER_BYTES);
+  const magic = new TextDecoder().decode(new Uint8Array(buffer, 0, 4));
+  const version = header.getUint32(4, true);
+  if (magic !== BUNDLE_MAGIC || version !== BUNDLE_VERSION) {
+    throw new Error(`Unsupported results bundle (${magic} v${version})`);
+  }
+  const stringBytes = header.getUint32(8, true);
+  const nodeCount = header.getUint32(12, true);
+  const edgeCount = header.getUint32(16, true);
+
+  let offset = HEADER_BYTES;
+  const strings = new TextDecoder()
+    .decode(new Uint8Array(buffer, offset, stringBytes))
+    .split("\0");
+  offset = align8(offset + stringBytes);
+
+  const float64 = () => {
+    const column = new Float64Array(buffer, offset, nodeCount);
+    offset += nodeCount * 8;
+    return column;
+  };
+  const uint32 = (count: number) => {
+    const column = new Uint32Array(buffer, offset, count);
+    offset += count * 4;
+    return column;
+  };
+  const int32 = (count: number) => {
+    const column = new Int32Array(buffer, offset, count);
+    offset += count * 4;
+    return column;
+  };
+
+  const latitudes = float64();
+  const longitudes = float64();
+  const countries = uint32(nodeCount);
+  const regions = uint32(nodeCount);
+  const cities = uint32(nodeCount);
+  offset = align8(offset);
+  const nodes: GeoLocation[] = Array.from({ length: nodeCount }, (_, i) => ({
+    country: strings[countries[i]],
+    region: strings[regions[i]],
+    city: strings[cities[i]],
+    latitude: latitudes[i],
+    longitude: longitudes[i],
+  }));
+
+  const origins = uint32(edgeCount);
+  const destinations = uint32(edgeCount);
+  const pings = int32(edgeCount);
+  const pingMins = int32(edgeCount);
+  const pingP90s = int32(edgeCount);
+  const samples = uint32(edgeCount);
+  const data: ResultEntry[] = Array.from({ length: edgeCount }, (_, i) => {
+    const origin = nodes[origins[i]];
+    const destination = nodes[destinations[i]];
+    const entry: ResultEntry = {
+      // The map draws located hops by their locations, so the bundle leaves the IPs out
+      origin: "",
+      destination: "",
+      pingTime: pings[i] === NO_PING ? null : pings[i],
+      origin_geo: origin,
+      destination_geo: destination,
+    };
+    if (samples[i] > 0) {
+      entry.pingMin = pingMins[i] === NO_PING ? null : pingMins[i];
+      entry.pingP90 = pingP90s[i] === NO_PING ? null : pingP90s[i];
+      entry.samples = samples[i];
+    }
+    return entry;
+  });
+
+  return { nodes, data };
+}
+
+async function fetchBuffer(url: string, gzipped: boolean): Promise<ArrayBuffer> {
+  const response = await fetch(url);
+  if (!response.ok || !response.body) {
+    throw new Error(`Failed to fetch ${url}: ${response.statusText}`);
+  }
+  if (!gzipped) {
+    return response.arrayBuffer();
+  }
+  // Static hosts serve the .gz as-is, without Content-Encoding, so inflate it here
+  const stream = response.body.pipeThrough(new DecompressionStream("gzip"));
+  return new Response(stream).arrayBuffer();
+}
+
+/**
+ * Fetch a file a manifest lists, preferring its gzip copy when the browser can inflate it.
+ * Paths are relative to the manifest's URL.
+ */
+export function fetchPrecompressed(
+  entry: { file: string; encodings: Partial<Record<"gzip" | "br", string>> },
+  manifestUrl: string
+): Promise<ArrayBuffer> {
+  const base = new URL(manifestUrl, window.location.href);
+  const gzipFile =
+    typeof DecompressionStream !== "undefined" ? entry.encodings.gzip : undefined;
+  return fetchBuffer(
+    new URL(gzipFile ?? entry.file, base).href,
+    gzipFile !== undefined
+  );
+}
+
+/**
+ * Fetch the bundle a manifest points at, preferring the gzip copy when the browser can
+ * inflate it. The .br copy is for servers that send precompressed files with Content-Encoding.
+ */
+export async function fetchBundle(manifestUrl: string): Promise<DecodedBundle> {
+  const response = await fetch(manifestUrl, { cache: "no-cache" });
+  if (!response.ok) {
+    throw new Error(`Failed to fetch ${manifestUrl}: ${response.statusText}`);
+  }
+  const manifest = (await response.json()) as BundleManifest;
+  return decodeBundle(await fetchPrecompressed(manifest, manifestUrl));
+}
@@ -0,0 +1,216 @@
+import type {
+  DeltaGeo,
+  DeltaManifest,
+  NormalizedResults,
+  ResultEntry,
+  ResultsData,
+  ResultsPatch,
+} from "../types";
+import { fetchPrecompressed } from "./bundle";
+
+const DELTA_VERSION = 1;
+const PATCH_FORMAT = "traceroute-results/patch";
+const NOT_LOOKED_UP = -1;
+const CACHE_DB = "world-wide-map";
+const CACHE_STORE = "delta";
+
+type EdgeRow = (string | number | null)[];
+type EdgeValues = Record<string, number | null>;
+
+// One published version of the dataset, kept in IndexedDB between visits
+interface DeltaState {
+  version: number;
+  nodes: Map<string, DeltaGeo>;
+  // [origin, destination, the other fields] by edgeKey
+  edges: Map<string, [string, string, EdgeValues]>;
+}
+
+const edgeKey = (origin: string, destination: string) =>
+  `${origin} ${destination}`;
+
+function edgeValues(fields: string[], row: EdgeRow): EdgeValues {
+  const values: EdgeValues = {};
+  for (let i = 2; i < fields.length; i++) {
+    const value = row[i] as number | null;
+    if (value !== null || fields[i] === "pingTime") {
+      values[fields[i]] = value;
+    }
+  }
+  return values;
+}
+
+function fromBase(base: NormalizedResults, version: number): DeltaState {
+  const { locations, nodes, edgeFields, edges } = base;
+  const state: DeltaState = { version, nodes: new Map(), edges: new Map() };
+  for (const [ip, location] of nodes) {
+    state.nodes.set(
+      ip,
+      location === null || location === NOT_LOOKED_UP
+        ? location
+        : locations[location]
+    );
+  }
+  for (const row of edges) {
+    const origin = row[0] === null ? "unknown" : nodes[row[0]][0];
+    const destination = row[1] === null ? "" : nodes[row[1]][0];
+    state.edges.set(edgeKey(origin, destination), [
+      origin,
+      destination,
+      edgeValues(edgeFields, row),
+    ]);
+  }
+  return state;
+}
+
+/** Bring state to the patch's version, as traceroute-app/publish_delta.py does */
+function applyPatch(state: DeltaState, patch: ResultsPatch) {
+  if (patch.format !== PATCH_FORMAT || patch.version !== DELTA_VERSION) {
+    throw new Error(`Unsupported patch (${patch.format} v${patch.version})`);
+  }
+  if (patch.from !== state.version) {
+    throw new Error(`Patch from ${patch.from} can't apply to ${state.version}`);
+  }
+  patch.nodes.removed.forEach((ip) => state.nodes.delete(ip));
+  for (const [ip, geo] of [...patch.nodes.added, ...patch.nodes.changed]) {
+    state.nodes.set(ip, geo);
+  }
+  for (const [origin, destination] of patch.edges.removed) {
+    state.edges.delete(edgeKey(origin, destination));
+  }
+  for (const row of [...patch.edges.added, ...patch.edges.changed]) {
+    const origin = row[0] as string;
+    const destination = row[1] as string;
+    state.edges.set(edgeKey(origin, destination), [
+      origin,
+      destination,
+      edgeValues(patch.edgeFields, row),
+    ]);
+  }
+  state.version = patch.to;
+}
+
+function toEntries(state: DeltaState): ResultsData {
+  const geoOf = (ip: string): DeltaGeo => {
+    if (ip === "unknown" || ip === "") {
+      return null;
+    }
+    return state.nodes.has(ip) ? state.nodes.get(ip)! : NOT_LOOKED_UP;
+  };
+  return Array.from(state.edges.values(), ([origin, destination, values]) => {
+    const entry = { origin, destination, ...values } as unknown as ResultEntry;
+    const originGeo = geoOf(origin);
+    const destinationGeo = geoOf(destination);
+    if (originGeo !== NOT_LOOKED_UP) {
+      entry.origin_geo = originGeo;
+    }
+    if (destinationGeo !== NOT_LOOKED_UP) {
+      entry.destination_geo = destinationGeo;
+    }
+    return entry;
+  });
+}
+
+/** The patches leading from version to the manifest's head, or null if some are gone */
+function patchesFrom(manifest: DeltaManifest, version: number) {
+  const chain: DeltaManifest["patches"] = [];
+  for (const patch of manifest.patches) {
+    if (patch.from === version) {
+      chain.push(patch);
+      version = patch.to;
+    }
+  }
+  return version === manifest.head ? chain : null;
+}
+
+function openCache(): Promise<IDBDatabase> {
+  return new Promise((resolve, reject) => {
+    const request = indexedDB.open(CACHE_DB, 1);
+    request.onupgradeneeded = () => request.result.createObjectStore(CACHE_STORE);
+    request.onsuccess = () => resolve(request.result);
+    request.onerror = () => reject(request.error);
+  });
+}
+
+async function readCache(key: string): Promise<DeltaState | undefined> {
+  const db = await openCache();
+  try {
+    return await new Promise((resolve, reject) => {
+      const request = db
+        .transaction(CACHE_STORE)
+        .objectStore(CACHE_STORE)
+        .get(key);
+      request.onsuccess = () => resolve(request.result as DeltaState | undefined);
+      request.onerror = () => reject(request.error);
+    });
+  } finally {
+    db.close();
+  }
+}
+
+async function writeCache(key: string, state: DeltaState): Promise<void> {
+  const db = await openCache();
+  try {
+    await new Promise<void>((resolve, reject) => {
+      const transaction = db.transaction(CACHE_STORE, "readwrite");
+      transaction.objectStore(CACHE_STORE).put(state, key);
+      transaction.oncomplete = () => resolve();
+      transaction.onerror = () => reject(transaction.error);
+    });
+  } finally {
+    db.close();
+  }
+}
+
+function decodeJson<T>(buffer: ArrayBuffer): T {
+  return JSON.parse(new TextDecoder().decode(buffer)) as T;
+}
+
+/**
+ * Load the results published by traceroute-app/publish_delta.py. A returning visitor whose
+ * cached version is still covered by the manifest's patches only downloads and applies those;
+ * anyone else starts from the base snapshot. The result is cached in IndexedDB for next time.
+ */
+export async function fetchDelta(manifestUrl: string): Promise<ResultsData> {
+  const response = await fetch(manifestUrl, { cache: "no-cache" });
+  if (!response.ok) {
+    throw new Error(`Failed to fetch ${manifestUrl}: ${response.statusText}`);
+  }
+  const manifest = (await response.json()) as DeltaManifest;
+  if (manifest.version !== DELTA_VERSION) {
+    throw new Error(`Unsupported delta manifest v${manifest.version}`);
+  }
+
+  const cacheKey = new URL(manifestUrl, window.location.href).href;
+  const cached = await readCache(cacheKey).catch((err) => {
+    console.warn("Cached results unavailable:", err);
+    return undefined;
+  });
+  let state = cached;
+  let chain = cached ? patchesFrom(manifest, cached.version) : null;
+  if (!state || !chain) {
+    const base = decodeJson<NormalizedResults>(
+      await fetchPrecompressed(manifest.base, manifestUrl)
+    );
+    state = fromBase(base, manifest.base.version);
+    chain = patchesFrom(manifest, state.version);
+    if (!chain) {
+      throw new Error(`No patches from ${state.version} to ${manifest.head}`);
+    }
+  }
+
+  // Download the patches at once, apply them in order
+  const patches = await Promise.all(
+    chain.map(async (entry) =>
+      decodeJson<ResultsPatch>(await fetchPrecompressed(entry, manifestUrl))
+    )
+  );
+  for (const patch of patches) {
+    applyPatch(state, patch);
+  }
+  if (state !== cached || patches.length > 0) {
+    writeCache(cacheKey, state).catch((err) =>
+      console.warn("Could not cache results:", err)
+    );
+  }
+  return toEntries(state);
+}
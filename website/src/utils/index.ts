@@ -1,4 +1,9 @@
+import type { NormalizedResults, ResultEntry, ResultsData } from "../types";
+
 const EARTH_RADIUS_METERS = 6371000;
+const NOT_LOOKED_UP = -1;
+// Edge column flagging endpoints the hop has no lookup for (1: origin, 2: destination)
+const NOT_LOOKED_UP_FIELD = "notLookedUp";
 
 export function getEdgeColor(pingTime: number): string {
   if (pingTime < 30) return "green";
@@ -27,3 +32,44 @@ export function calculateDistance(
     Math.cos(lat1Rad) * Math.cos(lat2Rad) * Math.sin(dLon / 2) ** 2;
   return EARTH_RADIUS_METERS * 2 * Math.asin(Math.sqrt(a));
 }
+
+function isNormalizedResults(data: unknown): data is NormalizedResults {
+  return (
+    typeof data === "object" &&
+    data !== null &&
+    (data as NormalizedResults).format === "traceroute-results/normalized"
+  );
+}
+
+/**
+ * Accept results in either layout written by traceroute-app, expanding the normalized one
+ * to flat entries. Entries sharing a node share the same GeoLocation object.
+ */
+export function toResultsData(data: unknown): ResultsData {
+  if (!isNormalizedResults(data)) {
+    return data as ResultsData;
+  }
+  const { locations, nodes, edgeFields, edges } = data;
+  const geoOf = (node: number) => {
+    const location = nodes[node][1];
+    return location === null || location === NOT_LOOKED_UP ? null : locations[location];
+  };
+  const marker = edgeFields.indexOf(NOT_LOOKED_UP_FIELD);
+  return edges.map((row) => {
+    const entry: Record<string, unknown> = {};
+    const bits = marker < 0 ? 0 : row[marker] ?? 0;
+    edgeFields.forEach((field, i) => {
+      const value = row[i];
+      if (field === "origin" || field === "destination") {
+        const bit = field === "origin" ? 1 : 2;
+        entry[field] = value === null ? "unknown" : nodes[value][0];
+        entry[`${field}_geo`] = value === null || bits & bit ? null : geoOf(value);
+      } else if (field === NOT_LOOKED_UP_FIELD) {
+        return;
+      } else if (value !== null || field === "pingTime") {
+        entry[field] = value;
+      }
+    });
+    return entry as unknown as ResultEntry;
+  });
+}